@@ -0,0 +1,111 @@
+"""Measure reads and writes per second on the template server's data layer with several worker processes at once
+
+    python benchmarks/bench_db.py --workers 4 --threads 2 --duration 5 --batch 100
+
+Every worker process (like a gunicorn worker) runs threads that use pcra/template/server/dbutils.py directly.
+Readers fetch pages of rows with keyset pagination and single rows by id, and writers insert --batch rows per
+transaction.  The test database is made in a temporary folder and filled with --rows rows first, unless --db is
+given.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+project_folder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(project_folder, 'pcra', 'template', 'server'))
+
+import dbutils as db  # noqa: E402
+
+TABLE = 'items'
+
+
+def _reader(deadline, max_id, counts):
+    reads = 0
+    while time.perf_counter() < deadline:
+        db.page(TABLE, random.randint(0, max_id), 50)
+        db.get(TABLE, random.randint(1, max_id))
+        reads += 2
+    counts.append(('reads', reads))
+
+
+def _writer(deadline, batch, counts):
+    rows = 0
+    transactions = 0
+    records = [{'name': f'bench-{i}', 'value': 'x' * 64} for i in range(batch)]
+    while time.perf_counter() < deadline:
+        if batch == 1:
+            db.insert(TABLE, records[0])
+        else:
+            db.insert_many(TABLE, records)
+        rows += batch
+        transactions += 1
+    counts.append(('rows written', rows))
+    counts.append(('write transactions', transactions))
+
+
+def worker(db_file, mode, threads, duration, batch, max_id, results):
+    db.connect(db_file)
+    deadline = time.perf_counter() + duration
+    counts = []
+    targets = []
+    for i in range(threads):
+        # In mixed mode every other thread writes
+        if mode == 'read' or (mode == 'mixed' and i % 2 == 0):
+            targets.append(threading.Thread(target=_reader, args=(deadline, max_id, counts)))
+        else:
+            targets.append(threading.Thread(target=_writer, args=(deadline, batch, counts)))
+    for thread in targets:
+        thread.start()
+    for thread in targets:
+        thread.join()
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure reads and writes per second on the data layer')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes (default: 4)')
+    parser.add_argument('--threads', type=int, default=2, help='threads in each worker (default: 2)')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds to run for (default: 5)')
+    parser.add_argument('--mode', default='mixed', choices=['read', 'write', 'mixed'],
+                        help='what the threads do, mixed has half of them writing (default: mixed)')
+    parser.add_argument('--batch', type=int, default=1, help='rows inserted per transaction (default: 1)')
+    parser.add_argument('--rows', type=int, default=10000, help='rows to start with (default: 10000)')
+    parser.add_argument('--db', help='database file to use instead of a temporary one')
+    args = parser.parse_args()
+
+    db_file = args.db or os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.db')
+    db.connect(db_file)
+    existing = db.connection().execute(f'SELECT COUNT(*) FROM {TABLE}').fetchone()[0]
+    if existing < args.rows:
+        db.insert_many(TABLE, [{'name': f'row-{i}', 'value': 'x' * 64} for i in range(args.rows - existing)])
+    max_id = db.connection().execute(f'SELECT MAX(id) FROM {TABLE}').fetchone()[0]
+    db.close()  # The workers open their own connections
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(db_file, args.mode, args.threads, args.duration,
+                                                              args.batch, max_id, results))
+                 for _ in range(args.workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = {}
+    for _ in processes:
+        for name, count in results.get():
+            totals[name] = totals.get(name, 0) + count
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.workers} workers x {args.threads} threads, {args.mode}, batch {args.batch}, {elapsed:.1f} s")
+    for name in ('reads', 'rows written', 'write transactions'):
+        if name in totals:
+            print(f"  {name:<20}{totals[name] / elapsed:>12.0f} /s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Scaffolding benchmarks for pcra
+
+Runs the full py-create-react-app flow in-process against fake git, npm and pip executables so the numbers
+reflect pcra's own copy/validate/orchestration work rather than the network.  The fakes sleep for
+PCRA_STUB_LATENCY seconds per call (set with --latency) to mimic a toolchain without depending on one.
+
+Usage:
+    python benchmarks/bench_scaffold.py                    # run all scenarios and print a table
+    python benchmarks/bench_scaffold.py --save-baseline    # record results in benchmarks/baseline.json
+    python benchmarks/bench_scaffold.py --compare          # exit non-zero if slower than the baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+import venv
+
+project_folder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, project_folder)
+
+from pcra import pcra, profiler  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+
+STUB_GIT = '''
+import os, sys, time
+time.sleep(float(os.environ.get('PCRA_STUB_LATENCY', '0')))
+if sys.argv[1:2] == ['--version']:
+    print('git version 2.30.0')
+elif sys.argv[1:2] == ['init']:
+    os.makedirs('.git', exist_ok=True)
+    with open(os.path.join('.git', 'HEAD'), 'w') as f:
+        f.write('ref: refs/heads/master\\n')
+elif sys.argv[1:2] == ['fast-import']:
+    sys.stdin.buffer.read()
+elif sys.argv[1:2] == ['var']:
+    print('GIT_AUTHOR_IDENT=Bench <bench@example.com> 0 +0000')
+    print('GIT_COMMITTER_IDENT=Bench <bench@example.com> 0 +0000')
+'''
+
+STUB_NPM = '''
+import os, sys, time, json
+time.sleep(float(os.environ.get('PCRA_STUB_LATENCY', '0')))
+if sys.argv[1:2] == ['--version']:
+    print('6.14.8')
+elif sys.argv[1:2] in (['install'], ['ci']):
+    plugin_dir = os.path.join('node_modules', 'parcel-plugin-transcrypt')
+    os.makedirs(plugin_dir, exist_ok=True)
+    with open(os.environ['PCRA_STUB_ASSET'], 'rb') as src, open(os.path.join(plugin_dir, 'asset.js'), 'wb') as f:
+        f.write(src.read())
+    with open(os.path.join(plugin_dir, 'package.json'), 'w') as f:
+        f.write(json.dumps({'name': 'parcel-plugin-transcrypt', 'version': '1.0.20'}))
+    if not os.path.isfile('package-lock.json'):
+        with open('package-lock.json', 'w') as f:
+            f.write(json.dumps({'name': 'bench', 'version': '0.0.0', 'lockfileVersion': 1, 'dependencies': {}}))
+'''
+
+STUB_PIP = '''
+import os, time
+time.sleep(float(os.environ.get('PCRA_STUB_LATENCY', '0')))
+'''
+
+
+def _unpatched_asset(patch_file):
+    # Rebuild an asset.js the default patch applies to from the patch's own context and removed lines
+    lines = []
+    with open(patch_file, 'rb') as f:
+        for line in f.read().splitlines(keepends=True):
+            if line.startswith(b'@@'):
+                start = int(line.split()[1][1:].split(b',')[0])
+                while len(lines) < start - 1:
+                    lines.append(b'// filler\n')
+            elif line.startswith((b' ', b'-')) and not line.startswith(b'---'):
+                lines.append(line[1:])
+    return b''.join(lines)
+
+
+def _write_stub(bin_dir, name, source):
+    script = os.path.join(bin_dir, name)
+    with open(script, 'w') as f:
+        f.write(f'#!{sys.executable}\n{source}')
+    os.chmod(script, 0o755)
+    if os.name == 'nt':
+        with open(f'{script}.cmd', 'w') as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+
+
+def _fake_venv_create(env_dir, **kwargs):
+    # Stands in for venv.create: just enough of a venv for make_venv to call pip
+    bin_dir = os.path.join(env_dir, 'Scripts' if os.name == 'nt' else 'bin')
+    os.makedirs(bin_dir)
+    _write_stub(bin_dir, 'pip', STUB_PIP)
+
+
+def _make_large_template(work_dir, file_count, file_size):
+    template_dir = os.path.join(work_dir, 'large_template')
+    shutil.copytree(os.path.join(project_folder, 'pcra', 'template'), template_dir,
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    payload = os.urandom(file_size)
+    for i in range(file_count):
+        asset_dir = os.path.join(template_dir, 'client', 'src', 'vendor', f'pkg{i // 100:03d}')
+        os.makedirs(asset_dir, exist_ok=True)
+        with open(os.path.join(asset_dir, f'asset{i:05d}.bin'), 'wb') as f:
+            f.write(payload)
+    return template_dir
+
+
+def _run_once(work_dir, run_index, cli_args):
+    project_dir = os.path.join(work_dir, 'projects', f'project{run_index}')
+    sys.argv = ['py-create-react-app', project_dir, '--no-cache'] + cli_args
+
+    profiler.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            pcra.main()
+        except SystemExit as e:
+            if e.code:
+                raise RuntimeError(f'Scaffold failed with exit code {e.code}')
+    total = time.perf_counter() - start
+    summary = profiler.stop().summary()
+
+    shutil.rmtree(project_dir, ignore_errors=True)
+
+    phases = {phase['name']: phase['wall'] for phase in summary['phases']}
+    commands = sum(cmd['wall'] for cmd in summary['commands'])
+    return {'total': total, 'python': total - commands, 'phases': phases}
+
+
+def run_scenario(work_dir, cli_args, repeat):
+    runs = [_run_once(work_dir, i, cli_args) for i in range(repeat)]
+    phase_names = sorted({name for run in runs for name in run['phases']})
+    return {
+        'total': statistics.median(run['total'] for run in runs),
+        'python': statistics.median(run['python'] for run in runs),
+        'phases': {name: statistics.median(run['phases'].get(name, 0.0) for run in runs) for name in phase_names},
+    }
+
+
+def _print_results(results):
+    for name, result in results.items():
+        print(f"{name:<16} total {result['total'] * 1000:9.1f} ms   python overhead {result['python'] * 1000:9.1f} ms")
+        for phase, wall in result['phases'].items():
+            print(f"    {phase:<20} {wall * 1000:9.1f} ms")
+
+
+def _compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ('total', 'python'):
+            old, new = baseline[name][metric], result[metric]
+            # Ignore tiny absolute differences that are just timer noise
+            if new > old * (1 + tolerance) and new - old > 0.005:
+                regressions.append(f'{name} {metric}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pcra scaffolding against stub toolchains')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario (median is reported)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each stub command sleeps')
+    parser.add_argument('--jobs', type=int, default=1, help='value passed to --jobs')
+    parser.add_argument('--files', type=int, default=2000, help='extra files in the large template scenario')
+    parser.add_argument('--file-size', type=int, default=4096, help='size of each extra file in bytes')
+    parser.add_argument('--scenario', action='append', help='only run the named scenario(s)')
+    parser.add_argument('--save-baseline', action='store_true', help=f'write results to {BASELINE_FILE}')
+    parser.add_argument('--compare', action='store_true', help='fail if results regress against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before --compare fails')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='pcra-bench-')
+    saved_env = dict(os.environ)
+    saved_argv = sys.argv
+    saved_venv_create = venv.create
+    saved_version_check = pcra.check_python_version
+    try:
+        bin_dir = os.path.join(work_dir, 'bin')
+        os.makedirs(bin_dir)
+        _write_stub(bin_dir, 'git', STUB_GIT)
+        _write_stub(bin_dir, 'npm', STUB_NPM)
+        asset_file = os.path.join(work_dir, 'asset.js')
+        patch_name = 'asset.js.win.patch' if os.name == 'nt' else 'asset.js.patch'
+        with open(asset_file, 'wb') as f:
+            f.write(_unpatched_asset(os.path.join(project_folder, 'pcra', 'template', patch_name)))
+        os.environ['PCRA_STUB_ASSET'] = asset_file
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+        os.environ['PCRA_STUB_LATENCY'] = str(args.latency)
+        os.environ['PCRA_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        venv.create = _fake_venv_create
+        # The benchmark measures pcra itself, so it runs on whatever interpreter is at hand
+        pcra.check_python_version = lambda version: True
+
+        jobs = ['--jobs', str(args.jobs)]
+        scenarios = {
+            'default': jobs,
+            'client-only': ['--client-only'] + jobs,
+            'full-stack': ['--full-stack'] + jobs,
+            'large-template': ['--full-stack', '--template', _make_large_template(work_dir, args.files, args.file_size)] + jobs,
+        }
+        if args.scenario:
+            scenarios = {name: scenarios[name] for name in args.scenario}
+
+        results = {name: run_scenario(work_dir, cli_args, args.repeat) for name, cli_args in scenarios.items()}
+    finally:
+        venv.create = saved_venv_create
+        pcra.check_python_version = saved_version_check
+        sys.argv = saved_argv
+        os.environ.clear()
+        os.environ.update(saved_env)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    _print_results(results)
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            f.write(json.dumps(results, indent=2))
+        print(f'Baseline saved to {BASELINE_FILE}')
+
+    if args.compare:
+        if not os.path.isfile(BASELINE_FILE):
+            print(f'No baseline found at {BASELINE_FILE}')
+            sys.exit(1)
+        with open(BASELINE_FILE, 'r') as f:
+            regressions = _compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Measure the throughput and latency of a running app server from a generated full-stack project
+
+    python benchmarks/bench_server.py http://127.0.0.1:8000/api/ --connections 8 --duration 10
+
+Start the server first from the server folder of the project, with python -m appserver (and --prod with the
+numbers of workers and threads to compare).  Each connection is a thread sending requests back to back over a
+keep-alive connection, reconnecting whenever the server closes it like the Flask development server does after
+every response.
+"""
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+
+def _worker(url, deadline, latencies, errors):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    conn = None
+    while time.perf_counter() < deadline:
+        if conn is None:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+            latencies.append(time.perf_counter() - start)
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(repr(e))
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def run(url, connections=8, duration=10.0):
+    results = [([], []) for _ in range(connections)]
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_worker, args=(url, deadline, latencies, errors))
+               for latencies, errors in results]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = [error for _, result in results for error in result]
+    if not latencies:
+        return {'requests': 0, 'errors': len(errors)}
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {'requests': len(latencies), 'errors': len(errors), 'rps': len(latencies) / elapsed,
+            'p50_ms': percentile(0.50), 'p99_ms': percentile(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the throughput and latency of a running server')
+    parser.add_argument('url', help='URL to request, like http://127.0.0.1:8000/api/')
+    parser.add_argument('--connections', type=int, default=8, help='concurrent connections (default: 8)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run for (default: 10)')
+    args = parser.parse_args()
+
+    result = run(args.url, args.connections, args.duration)
+    if not result['requests']:
+        print(f"No successful requests ({result['errors']} errors)")
+        return
+    print(f"{result['requests']} requests, {result['rps']:.0f} req/s, "
+          f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, {result['errors']} errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Compare the per-request cost of session handling in the template's app server with and without throttled renewal
+
+    python benchmarks/bench_sessions.py --requests 2000 --store sqlite
+
+Runs the app from pcra/template/server in this process with Flask's test client, so only the time spent in the
+app is measured, once as it used to be (the session saved and its cookie sent again on every request, static
+files included) and once as it is now.  Needs the packages in the server's requirements.txt.  The secret key,
+the databases and a user made just for the benchmark are put in a temporary folder.
+"""
+import os
+import sys
+import time
+import secrets
+import argparse
+import tempfile
+import functools
+
+project_folder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+server_folder = os.path.join(project_folder, 'pcra', 'template', 'server')
+sys.path.insert(0, server_folder)
+
+USERNAME = 'bench'
+
+
+def legacy_app(appserver):
+    """The app with a session that is saved on every request, like before sessions were renewed lazily"""
+    app = appserver.create_app()
+    app.config.update(SESSION_REFRESH_EACH_REQUEST=True, SESSION_RENEW_AFTER=0)
+    for endpoint, view in list(app.view_functions.items()):
+        if getattr(view, 'session_exempt', False):
+            app.view_functions[endpoint] = functools.partial(view)  # The same view without the exempt mark
+    return app
+
+
+def measure(app, path, requests, password):
+    client = app.test_client()
+    client.post('/api/login', json={'username': USERNAME, 'password': password})
+    cookies_sent = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path)
+        if 'Set-Cookie' in response.headers:
+            cookies_sent += 1
+        response.close()
+    return (time.perf_counter() - start) / requests * 1e6, cookies_sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the per-request cost of session handling')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route (default: 2000)')
+    parser.add_argument('--store', default='sqlite', choices=['sqlite', 'memory', 'cookie'],
+                        help='session store (default: sqlite)')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench-sessions-')
+    os.environ['APPSERVER_SECRET_KEY_FILE'] = os.path.join(tmp_dir, 'secret_key')
+    os.environ['APPSERVER_SESSION_DB'] = os.path.join(tmp_dir, 'sessions.db')
+    os.environ['APPSERVER_USERS_DB'] = os.path.join(tmp_dir, 'users.db')
+    os.environ['APPSERVER_DB'] = os.path.join(tmp_dir, 'app.db')
+    with open(os.path.join(tmp_dir, 'index.html'), 'w') as f:
+        f.write('<!DOCTYPE html><html><body><div id="root"></div></body></html>')
+
+    import logging
+    import users
+    import appserver
+
+    # With a user in the database the app doesn't create its default admin user
+    password = secrets.token_urlsafe(16)
+    users.UserStore(os.environ['APPSERVER_USERS_DB']).add(USERNAME, password)
+
+    appserver.SESSION_STORE = args.store
+    appserver.SPA_DIR = tmp_dir
+    apps = [('every request', legacy_app(appserver)), ('throttled', appserver.create_app())]
+    logging.getLogger().setLevel(logging.WARNING)  # Leave the request log out of the timings
+    routes = [('/api/ping', 'logged in'), ('/api/', 'no login'), ('/', 'static')]
+    print(f"{args.requests} requests per route, {args.store} session store")
+    print(f"{'Route':<22}{'Sessions saved':<16}{'us/request':>12}{'Set-Cookie':>12}")
+    for path, description in routes:
+        for name, app in apps:
+            per_request, cookies_sent = measure(app, path, args.requests, password)
+            print(f"{path + ' (' + description + ')':<22}{name:<16}{per_request:>12.0f}{cookies_sent:>12}")
+
+
+if __name__ == '__main__':
+    main()
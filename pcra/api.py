@@ -0,0 +1,173 @@
+"""Library interface for creating projects without going through the command line
+
+    from pcra.api import ProjectOptions, create_project, create_projects
+
+    result = create_project(ProjectOptions('my_app', full_stack=True))
+    results = create_projects([ProjectOptions(f'mfe{i}', client_only=True) for i in range(20)], workers=4)
+
+Nothing here changes the working directory of the calling process, so it is safe to use from threads.
+"""
+import os
+import time
+import threading
+from dataclasses import dataclass, field, fields
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .pcra import PCRA, check_system
+from .utils import CommandError, set_output_prefix, get_output_prefix
+from .archive import ArchiveError
+from .patchcache import PatchError
+from .journal import ResumeError
+from .render import RenderError
+from .manifest import TemplateManifest
+from .venvcache import VenvCache
+from .npmcache import NpmCache
+from .wheelhouse import Wheelhouse
+
+
+@dataclass
+class ProjectOptions:
+    folder: str
+    client_only: bool = False
+    full_stack: bool = False
+    no_virtualenv: bool = False
+    no_javascript: bool = False
+    offline: bool = False
+    no_git: bool = False
+    template: Optional[str] = None
+    copy_mode: str = 'auto'
+    jobs: int = 1
+    no_cache: bool = False
+    refresh_cache: bool = False
+    variables: Optional[dict] = None  # Values for {{pcra:NAME}} template placeholders
+    resume: bool = False  # Finish a project whose journal shows it was interrupted
+    base_dir: Optional[str] = None  # Relative folder and template paths are resolved against this instead of the cwd
+
+    @classmethod
+    def from_args(cls, cli_args):
+        return cls(**{f.name: getattr(cli_args, f.name) for f in fields(cls) if hasattr(cli_args, f.name)})
+
+
+@dataclass
+class ProjectResult:
+    name: str
+    project_dir: str
+    success: bool
+    duration: float
+    error: Optional[str] = None
+    files_copied: int = 0
+    bytes_copied: int = 0
+
+
+@dataclass
+class _SharedState:
+    # Everything that can be reused between projects created by the same batch
+    venv_caches: dict = field(default_factory=dict)
+    npm_caches: dict = field(default_factory=dict)
+    wheelhouses: dict = field(default_factory=dict)
+    manifests: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def venv_cache(self, options):
+        with self.lock:
+            key = (options.no_cache, options.refresh_cache)
+            if key not in self.venv_caches:
+                self.venv_caches[key] = VenvCache(enabled=not options.no_cache, refresh=options.refresh_cache)
+            return self.venv_caches[key]
+
+    def npm_cache(self, options):
+        with self.lock:
+            key = (options.no_cache, options.refresh_cache, options.offline)
+            if key not in self.npm_caches:
+                self.npm_caches[key] = NpmCache(enabled=not options.no_cache, refresh=options.refresh_cache,
+                                                offline=options.offline)
+            return self.npm_caches[key]
+
+    def wheelhouse(self, options):
+        with self.lock:
+            key = (options.no_cache, options.refresh_cache, options.offline)
+            if key not in self.wheelhouses:
+                self.wheelhouses[key] = Wheelhouse(enabled=not options.no_cache, refresh=options.refresh_cache,
+                                                   offline=options.offline)
+            return self.wheelhouses[key]
+
+    def manifest(self, project):
+        # Scanning is done under the lock so the same template is only ever scanned once per batch
+        with self.lock:
+            key = (project.template_dir, project.fallback_dir)
+            if key not in self.manifests:
+                self.manifests[key] = TemplateManifest.load(project.template_dir, project.fallback_dir)
+            return self.manifests[key]
+
+    def close(self):
+        # Only once every project in the batch is done reading from the templates
+        for manifest in self.manifests.values():
+            manifest.close()
+
+
+def _create(options, shared, check_tools):
+    start = time.perf_counter()
+    error = check_system(options, check_tools=check_tools)
+    if error is not None:
+        project_dir = os.path.realpath(os.path.join(options.base_dir or os.getcwd(), options.folder))
+        return ProjectResult(os.path.basename(project_dir), project_dir, False, time.perf_counter() - start, error)
+
+    project = PCRA(options, venv_cache=shared.venv_cache(options), npm_cache=shared.npm_cache(options),
+                   wheelhouse=shared.wheelhouse(options))
+    try:
+        if os.path.exists(project.template_dir):
+            project.manifest = shared.manifest(project)
+        if not project.validate_template():
+            error = f'Supplied template folder at {project.template_dir} is not valid!'
+        else:
+            project.bootstrap(options.jobs)
+    except (CommandError, ArchiveError, PatchError, ResumeError, RenderError, OSError) as e:
+        error = str(e)
+
+    return ProjectResult(project.project_name, project.project_dir, error is None, time.perf_counter() - start, error,
+                         project.copier.stats.files, project.copier.stats.bytes)
+
+
+def create_project(options: ProjectOptions) -> ProjectResult:
+    """Create a single project, returning a result instead of raising or exiting on failure"""
+    shared = _SharedState()
+    try:
+        return _create(options, shared, check_tools=True)
+    finally:
+        shared.close()
+
+
+def create_projects(options_list: List[ProjectOptions], workers: int = 4) -> List[ProjectResult]:
+    """Create several projects concurrently, sharing template scans and caches between them
+
+    Results are returned in the same order as options_list.
+    """
+    shared = _SharedState()
+    tool_error = None
+    if options_list:
+        # Probe the toolchain once for the whole batch rather than once per project
+        tool_error = check_system(ProjectOptions(folder='',
+                                                 no_git=all(o.no_git for o in options_list),
+                                                 no_javascript=all(o.no_javascript for o in options_list),
+                                                 no_cache=any(o.no_cache for o in options_list)),
+                                  check_tools=True, check_folder=False)
+
+    prefix = get_output_prefix()
+
+    def worker(options):
+        set_output_prefix(os.path.basename(os.path.normpath(options.folder)) if prefix is None
+                          else f'{prefix}:{os.path.basename(os.path.normpath(options.folder))}')
+        try:
+            if tool_error is not None:
+                project_dir = os.path.realpath(os.path.join(options.base_dir or os.getcwd(), options.folder))
+                return ProjectResult(os.path.basename(project_dir), project_dir, False, 0.0, tool_error)
+            return _create(options, shared, check_tools=False)
+        finally:
+            set_output_prefix(prefix)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(worker, options_list))
+    finally:
+        shared.close()
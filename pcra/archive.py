@@ -0,0 +1,143 @@
+import os
+import struct
+
+ARCHIVE_MAGIC = b'PCRATPL1'
+ARCHIVE_EXTENSION = '.pcra'
+_HEADER = struct.Struct('<8sQ')  # magic, length of the JSON manifest that follows
+_CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def pack_template(source_dir, archive_file, extra_files=None):
+    """Pack a template folder into a single archive
+
+    The layout is a fixed header, a JSON manifest listing every folder and every file's offset, size,
+    sha256 and mode, then the raw file contents back to back, so the manifest can be read without touching
+    the data and the data can be extracted in one sequential pass.
+
+    extra_files maps archive paths to files outside the template folder that should be packed as well.
+    """
+    import json
+    from .cache import hash_file
+    from .manifest import TemplateManifest
+
+    manifest = TemplateManifest(source_dir, source_dir)
+    manifest.scan()
+    sources = {path: entry.source for path, entry in manifest.template.files.items()}
+    dirs = set(d for d in manifest.template.dirs if d)
+    for path, source in (extra_files or {}).items():
+        sources[path] = source
+        parts = path.split('/')[:-1]
+        dirs.update('/'.join(parts[:i]) for i in range(1, len(parts) + 1))
+
+    files = []
+    offset = 0
+    for path in sorted(sources):
+        st = os.stat(sources[path])
+        files.append({'path': path, 'offset': offset, 'size': st.st_size, 'mode': st.st_mode & 0o777,
+                      'sha256': hash_file(sources[path])})
+        offset += st.st_size
+
+    index = json.dumps({'version': 1, 'dirs': sorted(dirs), 'files': files}).encode()
+    with open(archive_file, 'wb') as out:
+        out.write(_HEADER.pack(ARCHIVE_MAGIC, len(index)))
+        out.write(index)
+        for entry in files:
+            with open(sources[entry['path']], 'rb') as f:
+                for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                    out.write(chunk)
+
+    return len(files), offset
+
+
+class TemplateArchive:
+    """Read access to a packed template, memory-mapped when the platform allows it"""
+
+    def __init__(self, archive_file):
+        import json
+        import mmap
+
+        self.path = archive_file
+        self._file = open(archive_file, 'rb')
+        header = self._file.read(_HEADER.size)
+        if len(header) != _HEADER.size or header[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self._file.close()
+            raise ArchiveError(f'{archive_file} is not a pcra template archive')
+
+        _, index_size = _HEADER.unpack(header)
+        try:
+            index = json.loads(self._file.read(index_size).decode())
+        except ValueError as e:
+            self._file.close()
+            raise ArchiveError(f'{archive_file} has a corrupt manifest: {e}')
+
+        self.data_offset = _HEADER.size + index_size
+        self.dirs = set(index['dirs'])
+        self.files = {entry['path']: entry for entry in index['files']}
+
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        except (OSError, ValueError):
+            self._map = None
+            self._view = None
+
+    def close(self):
+        """Unmap the archive and close its file, after which nothing more can be read from it"""
+        if self._view is not None:
+            self._view.release()
+            self._map.close()
+            self._view = None
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _chunks(self, entry):
+        start = self.data_offset + entry['offset']
+        end = start + entry['size']
+        if self._view is not None:
+            for pos in range(start, end, _CHUNK_SIZE):
+                yield self._view[pos:min(pos + _CHUNK_SIZE, end)]
+        else:
+            self._file.seek(start)
+            remaining = entry['size']
+            while remaining:
+                chunk = self._file.read(min(_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def read(self, path):
+        import hashlib
+
+        entry = self.files[path]
+        data = b''.join(bytes(chunk) for chunk in self._chunks(entry))
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise ArchiveError(f"Checksum mismatch for '{path}' in {self.path}")
+        return data
+
+    def extract(self, pairs):
+        """Write (archive path, destination file) pairs, verifying each file against its checksum"""
+        import hashlib
+
+        # Sorting by offset turns the extraction into one forward pass over the archive
+        for path, destination in sorted(pairs, key=lambda pair: self.files[pair[0]]['offset']):
+            entry = self.files[path]
+            digest = hashlib.sha256()
+            with open(destination, 'wb') as out:
+                for chunk in self._chunks(entry):
+                    digest.update(chunk)
+                    out.write(chunk)
+            if digest.hexdigest() != entry['sha256']:
+                os.remove(destination)
+                raise ArchiveError(f"Checksum mismatch for '{path}' in {self.path}")
+            os.chmod(destination, entry['mode'])
@@ -0,0 +1,441 @@
+import os
+import json
+import time
+import hashlib
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+is_windows = os.name == 'nt'
+
+DEFAULT_MAX_MB = 2048
+META_FILE = '.pcra-cache.json'
+LOCKS_FOLDER = '.locks'
+STALE_TMP_SECONDS = 60 * 60  # Temp folders left behind this long ago belong to a process that died
+
+
+class FileLock:
+    """Lock held through an open lock file, so it is released even if the process is killed
+
+    Each acquire opens its own handle, which makes it exclusive between threads as well as between processes.
+    A shared lock can be held by any number of holders at once, but not together with an exclusive one.
+    Windows has no shared locks, so there they are exclusive too.
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self, blocking=True) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                fcntl.flock(fd, operation if blocking else operation | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                # LK_LOCK gives up after 10 seconds, so poll instead
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(0.05)
+        except OSError:
+            os.close(fd)
+            if blocking:
+                raise
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            if fcntl is None and msvcrt is not None:
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            os.close(self._fd)  # Closing the file releases a flock
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def lock_file(section, key):
+    return os.path.join(cache_dir(section), LOCKS_FOLDER, hash_key(key) + '.lock')
+
+
+class _KeyLock:
+    def __init__(self, thread_lock, path):
+        self._thread_lock = thread_lock
+        self._file_lock = FileLock(path)
+
+    def __enter__(self):
+        # Threads queue up on the in-process lock so only one of them at a time waits on the file
+        self._thread_lock.acquire()
+        try:
+            self._file_lock.acquire()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._file_lock.release()
+        self._thread_lock.release()
+
+
+class KeyLocks:
+    """One lock per cache key shared by every thread and process using the cache section
+
+    Whoever gets the lock first builds the entry while everyone else waits for it and then reuses the result.
+    """
+
+    def __init__(self, section):
+        self.section = section
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def __call__(self, key):
+        with self._guard:
+            thread_lock = self._locks.setdefault(key, threading.Lock())
+        return _KeyLock(thread_lock, lock_file(self.section, key))
+
+
+def cache_root():
+    root = os.environ.get('PCRA_CACHE_DIR')
+    if root is None:
+        if is_windows:
+            base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+            root = os.path.join(base, 'pcra', 'cache')
+        else:
+            base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+            root = os.path.join(base, 'pcra')
+    return root
+
+
+def cache_dir(name, create=True):
+    path = os.path.join(cache_root(), name)
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def max_cache_bytes():
+    return int(os.environ.get('PCRA_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024
+
+
+def hash_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tree_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.lstat(os.path.join(root, file_name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def read_meta(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, META_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(entry_dir, meta):
+    with open(os.path.join(entry_dir, META_FILE), 'w') as f:
+        f.write(json.dumps(meta, indent=2))
+
+
+def mark_used(entry_dir):
+    # Entry directory mtime doubles as the last-used time for LRU eviction
+    now = time.time()
+    os.utime(entry_dir, (now, now))
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def link_tree(src, dst):
+    # Hardlink every file (falling back to a copy across filesystems) while keeping relative symlinks as-is
+    shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy)
+
+
+def unshare(path):
+    # Give a hardlinked file its own inode before it gets modified in place
+    if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+        tmp_file = tmp_path(path)
+        shutil.copy2(path, tmp_file)
+        os.replace(tmp_file, path)
+
+
+def tmp_path(path):
+    # Unique per process and thread, next to the final location so that renaming it into place is atomic
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+def publish(tmp_dir, entry_dir):
+    # Entries are built next to their final location and renamed into place so readers never see a partial entry
+    old_dir = None
+    if os.path.isdir(entry_dir):
+        # A folder can't be renamed over another one, so move the old entry out of the way in one step first
+        old_dir = tmp_path(entry_dir) + '.old'
+        os.rename(entry_dir, old_dir)
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        if not os.path.isdir(entry_dir):
+            raise
+        # Another process published the same entry first, and it's just as good as this one
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    mark_used(entry_dir)
+
+
+def is_tmp(name):
+    return name.endswith(('.tmp', '.tmp.old'))
+
+
+def evict(section_dir, max_bytes=None):
+    """Remove least recently used entries until the cache section fits within max_bytes"""
+    if max_bytes is None:
+        max_bytes = max_cache_bytes()
+
+    entries = []
+    for entry in os.scandir(section_dir):
+        if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.') and not is_tmp(entry.name):
+            meta = read_meta(entry.path) or {}
+            size = meta.get('size')
+            if size is None:
+                size = tree_size(entry.path)
+            entries.append((entry.stat().st_mtime, size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = []
+    section = os.path.basename(section_dir)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        # Entries that another process is restoring or building right now are left alone
+        lock = FileLock(lock_file(section, os.path.basename(path)))
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            lock.release()
+        total -= size
+        evicted.append(path)
+
+    return evicted
+
+
+def drop_meta(section_dir):
+    try:
+        os.remove(os.path.join(section_dir, META_FILE))
+    except OSError:
+        pass
+
+
+def evict_files(section_dir, max_bytes=None):
+    """Remove the oldest files until a section made of loose files (instead of entry folders) fits within max_bytes
+
+    The files' mtimes are their last-used times.  The section's metadata describes all of its files together, so
+    it goes as well once any of them is removed.  Nothing is removed while anyone else holds the lock for the whole
+    section, shared or not.
+    """
+    if max_bytes is None:
+        max_bytes = max_cache_bytes()
+
+    files = []
+    for entry in os.scandir(section_dir):
+        if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.') and not is_tmp(entry.name):
+            stat = entry.stat(follow_symlinks=False)
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    if total <= max_bytes:
+        return []
+
+    section = os.path.basename(section_dir)
+    lock = FileLock(lock_file(section, section))
+    if not lock.acquire(blocking=False):
+        return []
+    evicted = []
+    try:
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted.append(path)
+        if evicted:
+            drop_meta(section_dir)
+    finally:
+        lock.release()
+    return evicted
+
+
+# Files or folders that make up a complete entry in each section with entry folders
+_ENTRY_CONTENTS = {'venv': 'venv', 'npm': 'node_modules', 'npm-lock': 'package-lock.json', 'patch': 'files'}
+# Extension of the files in each section made of loose files, which are locked and evicted as a whole
+_FILE_ENTRIES = {'wheelhouse': '.whl'}
+
+
+def _section_items(section):
+    section_dir = cache_dir(section, create=False)
+    if not os.path.isdir(section_dir):
+        return []
+    return [entry for entry in os.scandir(section_dir) if not entry.name.startswith('.') and entry.name != META_FILE]
+
+
+def _item_size(entry):
+    if entry.is_dir(follow_symlinks=False):
+        size = (read_meta(entry.path) or {}).get('size')
+        return tree_size(entry.path) if size is None else size
+    return entry.stat(follow_symlinks=False).st_size
+
+
+def cache_info():
+    """[(section, entries, bytes)] for every section of the cache"""
+    root = cache_root()
+    sections = sorted(e.name for e in os.scandir(root) if e.is_dir()) if os.path.isdir(root) else []
+    info = []
+    for section in sections:
+        items = [entry for entry in _section_items(section) if not is_tmp(entry.name)]
+        info.append((section, len(items), sum(_item_size(entry) for entry in items)))
+    return info
+
+
+def _problem(section, entry):
+    if is_tmp(entry.name):
+        if time.time() - entry.stat(follow_symlinks=False).st_mtime > STALE_TMP_SECONDS:
+            return 'left behind by an interrupted build'
+        return None  # Most likely being built right now
+
+    if entry.is_dir(follow_symlinks=False):
+        contents = _ENTRY_CONTENTS.get(section)
+        if contents is None:
+            return None
+        meta = read_meta(entry.path)
+        if meta is None and section != 'npm-lock':
+            return 'has no metadata'
+        if not os.path.exists(os.path.join(entry.path, contents)):
+            return f'is missing {contents}'
+        if section == 'patch':
+            for target, checksums in meta.get('files', {}).items():
+                patched = os.path.join(entry.path, 'files', target)
+                if not os.path.isfile(patched) or hash_file(patched) != checksums['patched']:
+                    return f'has a corrupt copy of {target}'
+        return None
+
+    if section in _FILE_ENTRIES and entry.name.endswith(_FILE_ENTRIES[section]):
+        import zipfile
+        if not zipfile.is_zipfile(entry.path):
+            return 'is not a readable wheel'
+        return None
+
+    if entry.name.endswith('.json'):
+        try:
+            with open(entry.path, 'r') as f:
+                json.load(f)
+        except (OSError, ValueError):
+            return 'is not readable JSON'
+    return None
+
+
+def verify_cache():
+    """[(section, path, problem)] for every damaged or abandoned cache entry"""
+    problems = []
+    for section, _, _ in cache_info():
+        for entry in _section_items(section):
+            problem = _problem(section, entry)
+            if problem is not None:
+                problems.append((section, entry.path, problem))
+    return problems
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+
+def prune_cache(max_bytes=None):
+    """Remove damaged and abandoned entries, then evict the least recently used ones down to max_bytes per section
+
+    Returns the paths that were removed.  Entries locked by a running build are skipped.
+    """
+    removed = []
+    for section, path, _ in verify_cache():
+        # Stale temp folders have no owner left, but a damaged entry may be getting rebuilt right now
+        if is_tmp(os.path.basename(path)):
+            lock = None
+        else:
+            lock = FileLock(lock_file(section, section if section in _FILE_ENTRIES else os.path.basename(path)))
+            if not lock.acquire(blocking=False):
+                continue
+        try:
+            _remove(path)
+            removed.append(path)
+            if section in _FILE_ENTRIES:
+                drop_meta(os.path.dirname(path))
+        except OSError:
+            pass
+        finally:
+            if lock is not None:
+                lock.release()
+
+    for section in _ENTRY_CONTENTS:
+        section_dir = cache_dir(section, create=False)
+        if os.path.isdir(section_dir):
+            removed.extend(evict(section_dir, max_bytes))
+    for section in _FILE_ENTRIES:
+        section_dir = cache_dir(section, create=False)
+        if os.path.isdir(section_dir):
+            removed.extend(evict_files(section_dir, max_bytes))
+    return removed
@@ -0,0 +1,127 @@
+import os
+import errno
+import threading
+
+COPY_MODES = ('auto', 'reflink', 'hardlink', 'copy')
+
+# Binary assets that nothing in the scaffolding process (or a typical user) edits in place, so they can share an inode
+ASSET_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.ico', '.svg', '.webp', '.bmp',
+                    '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp3', '.mp4', '.webm', '.pdf', '.zip'}
+
+LARGE_FILE_SIZE = 1024 * 1024
+
+FICLONE = 0x40049409  # Linux ioctl that shares extents between two files on btrfs/xfs/etc.
+
+_NOT_SUPPORTED = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EPERM}
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class CopyStats:
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.reflinks = 0
+        self.hardlinks = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, size, method):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            if method == 'reflink':
+                self.reflinks += 1
+            elif method == 'hardlink':
+                self.hardlinks += 1
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-6)
+        text = (f'{self.files} files ({self.bytes / 1024 / 1024:.1f} MB) in {self.seconds:.2f}s, '
+                f'{self.files / seconds:.0f} files/s, {self.bytes / 1024 / 1024 / seconds:.1f} MB/s')
+        if self.reflinks or self.hardlinks:
+            text += f' ({self.reflinks} reflinked, {self.hardlinks} hardlinked)'
+        return text
+
+
+def _sendfile(src, dst):
+    # Let the kernel move the data instead of bouncing it through Python buffers
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+
+
+class CopyEngine:
+    """Copies template files using the cheapest method the filesystem allows"""
+
+    def __init__(self, mode='auto', workers=None):
+        if mode not in COPY_MODES:
+            raise ValueError(f"Unknown copy mode '{mode}'")
+        self.mode = mode
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.stats = CopyStats()
+        self._reflink_ok = fcntl is not None and mode in ('auto', 'reflink')
+        self._sendfile_ok = hasattr(os, 'sendfile') and os.name != 'nt'
+
+    def _try_reflink(self, src, dst):
+        if not self._reflink_ok:
+            return False
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError as e:
+            if e.errno in _NOT_SUPPORTED:
+                # Same answer for every other file on this filesystem, so stop asking
+                self._reflink_ok = False
+                return False
+            raise
+
+    def _try_hardlink(self, src, dst):
+        if self.mode != 'hardlink' or os.path.splitext(src)[1].lower() not in ASSET_EXTENSIONS:
+            return False
+        try:
+            os.link(src, dst)
+            return True
+        except OSError:
+            return False
+
+    def copy_file(self, src, dst):
+        """Copy a single file; dst may be a directory like with shutil.copy2"""
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+
+        size = os.stat(src).st_size
+        if self._try_hardlink(src, dst):
+            self.stats.add(size, 'hardlink')
+            return dst
+
+        import shutil
+
+        if self._try_reflink(src, dst):
+            method = 'reflink'
+        elif self._sendfile_ok and size >= LARGE_FILE_SIZE:
+            _sendfile(src, dst)
+            method = 'copy'
+        else:
+            shutil.copyfile(src, dst)
+            method = 'copy'
+        shutil.copystat(src, dst)
+        self.stats.add(size, method)
+        return dst
+
+    def copy_files(self, pairs):
+        """Copy (src, dst) file pairs in parallel; destination folders must already exist"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # list() re-raises the first copy error, if any
+            list(executor.map(lambda pair: self.copy_file(*pair), pairs))
@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import tempfile
+from fnmatch import fnmatchcase
+
+from .utils import run_cmd, get_cmd_output, CommandError
+from .journal import JOURNAL_FILE
+
+is_windows = os.name == 'nt'
+
+INITIAL_COMMIT_MESSAGE = '"Initial Commit"'
+# The template's npm "version" script, which is what gets emulated when folding `npm version minor` into the import
+VERSION_SCRIPT = "echo \"version = '$npm_package_version'\" > ./src/version.py;git add ./src/version.py"
+VERSION_FILE = os.path.join('src', 'version.py')
+
+
+class GitImportError(Exception):
+    """The project can't be committed with fast-import exactly like `git add` would, so use the git commands"""
+    pass
+
+
+class _IgnoreRules:
+    """The subset of .gitignore syntax used by project templates: globs, anchored paths and directory-only patterns"""
+
+    def __init__(self):
+        self.rules = []  # (base folder, pattern parts, anchored, directory only)
+
+    def add_file(self, ignore_file, base=''):
+        if not os.path.isfile(ignore_file):
+            return
+        with open(ignore_file, 'r') as f:
+            for line in f:
+                line = line.rstrip('\n').rstrip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith(('!', '\\')) or '**' in line:
+                    raise GitImportError(f"Unsupported pattern '{line}' in {ignore_file}")
+                dir_only = line.endswith('/')
+                pattern = line.rstrip('/')
+                anchored = '/' in pattern
+                self.rules.append((base, pattern.lstrip('/').split('/'), anchored, dir_only))
+
+    def ignored(self, rel_path, is_dir):
+        for base, parts, anchored, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel_path.startswith(base + '/'):
+                    continue
+                path = rel_path[len(base) + 1:]
+            else:
+                path = rel_path
+            path_parts = path.split('/')
+            if anchored:
+                # Wildcards never match a '/' in git, so compare one path component at a time
+                if len(parts) == len(path_parts) and all(fnmatchcase(p, g) for p, g in zip(path_parts, parts)):
+                    return True
+            elif fnmatchcase(path_parts[-1], parts[0]):
+                return True
+        return False
+
+
+def _git_config(project_dir):
+    # `git var -l` gives the identities and the effective config in one process
+    values = {}
+    for line in (get_cmd_output(['git', 'var', '-l'], cwd=project_dir) or '').splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            values[key.lower()] = value
+    return values
+
+
+def _check_config(config):
+    for ident in ('git_author_ident', 'git_committer_ident'):
+        # git commit refuses to guess an identity, so leave that error to it
+        if ident not in config or '(none)>' in config[ident] or config[ident].startswith('<'):
+            raise GitImportError('No Git user identity is configured')
+    if config.get('core.autocrlf', 'false').lower() not in ('false', ''):
+        raise GitImportError('core.autocrlf is enabled')
+    if config.get('core.filemode', 'true').lower() == 'false' or config.get('core.symlinks', 'true').lower() == 'false':
+        raise GitImportError('core.filemode or core.symlinks is disabled')
+    if config.get('core.ignorecase', 'false').lower() == 'true':
+        raise GitImportError('core.ignorecase is enabled')
+
+    excludes_file = config.get('core.excludesfile')
+    if excludes_file is None:
+        xdg_config = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+        excludes_file = os.path.join(xdg_config, 'git', 'ignore')
+    if os.path.isfile(os.path.expanduser(excludes_file)):
+        raise GitImportError('A global Git excludes file is configured')
+
+
+def _collect(project_dir, rules, rel_dir=''):
+    """(path, mode, source) for every file `git add .` would stage"""
+    files = []
+    current = os.path.join(project_dir, *rel_dir.split('/')) if rel_dir else project_dir
+    if rel_dir:
+        rules.add_file(os.path.join(current, '.gitignore'), rel_dir)
+
+    for entry in sorted(os.scandir(current), key=lambda e: e.name):
+        rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+        if entry.name == '.git':
+            # The empty client/.git folder only exists so that npm version works, anything else is a nested repo
+            if rel_dir and (not entry.is_dir(follow_symlinks=False) or os.listdir(entry.path)):
+                raise GitImportError(f'{rel_path} looks like a nested repository')
+            continue
+        if rel_path == JOURNAL_FILE:
+            continue  # Removed once the project is complete
+        if entry.name == '.gitattributes':
+            raise GitImportError(f'{rel_path} may change how files are stored')
+        if '\n' in rel_path or rel_path.startswith('"'):
+            raise GitImportError(f'{rel_path!r} would need quoting')
+
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if rules.ignored(rel_path, is_dir):
+            continue
+        if is_dir:
+            files.extend(_collect(project_dir, rules, rel_path))
+        elif entry.is_symlink():
+            files.append((rel_path, '120000', entry.path))
+        elif entry.is_file(follow_symlinks=False):
+            mode = '100755' if entry.stat(follow_symlinks=False).st_mode & 0o100 else '100644'
+            files.append((rel_path, mode, entry.path))
+    return files
+
+
+def _bump_minor(version):
+    match = re.fullmatch(r'(\d+)\.(\d+)\.(\d+)(-[0-9A-Za-z.-]+)?', version)
+    if match is None:
+        raise GitImportError(f"Can't bump the package version '{version}'")
+    major, minor, patch, prerelease = match.groups()
+    # Same as npm: a prerelease of x.y.0 is released as x.y.0 rather than skipping ahead
+    if prerelease and patch == '0':
+        return f'{major}.{minor}.0'
+    return f'{major}.{int(minor) + 1}.0'
+
+
+def _dump_json(data):
+    return (json.dumps(data, indent=2, ensure_ascii=False) + '\n').encode()
+
+
+def npm_version_files(client_dir):
+    """New version and {file: contents} of what `npm version minor` would change and commit"""
+    if is_windows:
+        raise GitImportError('the npm version script runs in a different shell on Windows')
+    if os.path.isfile(os.path.join(client_dir, 'npm-shrinkwrap.json')):
+        raise GitImportError('npm-shrinkwrap.json is present')
+
+    package_file = os.path.join(client_dir, 'package.json')
+    with open(package_file, 'r') as f:
+        package_data = json.load(f)
+    scripts = package_data.get('scripts', {})
+    if 'preversion' in scripts or 'postversion' in scripts or scripts.get('version', VERSION_SCRIPT) != VERSION_SCRIPT:
+        raise GitImportError('package.json has custom version scripts')
+    if 'version' in scripts and not os.path.isdir(os.path.join(client_dir, 'src')):
+        raise GitImportError('the version script needs a src folder')
+
+    version = _bump_minor(package_data.get('version', '0.0.0'))
+    package_data['version'] = version
+    files = {package_file: _dump_json(package_data)}
+
+    lock_file = os.path.join(client_dir, 'package-lock.json')
+    if os.path.isfile(lock_file):
+        with open(lock_file, 'r') as f:
+            lock_data = json.load(f)
+        if lock_data.get('lockfileVersion', 1) not in (1, 2, 3):
+            raise GitImportError(f"package-lock.json has an unknown lockfileVersion {lock_data['lockfileVersion']}")
+        lock_data['version'] = version
+        # Version 2 and 3 lockfiles also describe the root package, and npm bumps its version there too
+        root_package = lock_data.get('packages', {}).get('')
+        if root_package is not None:
+            root_package['version'] = version
+        files[lock_file] = _dump_json(lock_data)
+
+    if 'version' in scripts:
+        files[os.path.join(client_dir, VERSION_FILE)] = f"version = '{version}'\n".encode()
+    return version, files
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _data(out, payload):
+    out.write(b'data %d\n' % len(payload))
+    out.write(payload)
+    out.write(b'\n')
+
+
+def initial_commit(project_dir, client_dir=None):
+    """Create the repository and its initial commit with one `git fast-import` run
+
+    With a client_dir, the version bump commit and tag that `npm version minor` makes are written in the same
+    stream and the new version is returned.  Raises GitImportError if the result might not match what the
+    git and npm commands would have produced.
+    """
+    run_cmd(['git', 'init'], cwd=project_dir)
+    git_dir = os.path.join(project_dir, '.git')
+    config = _git_config(project_dir)
+    _check_config(config)
+
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+        head = f.read().strip()
+    if not head.startswith('ref: refs/heads/'):
+        raise GitImportError(f'Unexpected HEAD: {head}')
+    branch = head[len('ref: '):].encode()
+
+    rules = _IgnoreRules()
+    rules.add_file(os.path.join(project_dir, '.gitignore'))
+    rules.add_file(os.path.join(git_dir, 'info', 'exclude'))
+    files = _collect(project_dir, rules)
+
+    version, version_files = None, {}
+    if client_dir is not None:
+        try:
+            version, version_files = npm_version_files(client_dir)
+        except GitImportError:
+            pass  # Only the initial commit is imported and npm version runs as usual
+
+    author = config['git_author_ident'].encode()
+    committer = config['git_committer_ident'].encode()
+
+    fd, stream_file = tempfile.mkstemp(prefix='pcra-fast-import-', dir=git_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(b'feature done\n')
+            mark = 0
+            tree = []
+            for rel_path, mode, source in files:
+                mark += 1
+                out.write(b'blob\nmark :%d\n' % mark)
+                _data(out, os.fsencode(os.readlink(source)) if mode == '120000' else _read(source))
+                tree.append((os.fsencode(rel_path), mode.encode(), mark))
+
+            initial_mark = mark + 1
+            out.write(b'commit %s\nmark :%d\nauthor %s\ncommitter %s\n' % (branch, initial_mark, author, committer))
+            _data(out, INITIAL_COMMIT_MESSAGE.encode() + b'\n')
+            for rel_path, mode, blob in tree:
+                out.write(b'M %s :%d %s\n' % (mode, blob, rel_path))
+            out.write(b'\n')
+
+            if version is not None:
+                version_mark = initial_mark + 1
+                out.write(b'commit %s\nmark :%d\nauthor %s\ncommitter %s\n' % (branch, version_mark, author, committer))
+                _data(out, version.encode() + b'\n')
+                out.write(b'from :%d\n' % initial_mark)
+                for path, contents in version_files.items():
+                    rel_path = os.path.relpath(path, project_dir).replace(os.sep, '/')
+                    out.write(b'M 100644 inline %s\n' % os.fsencode(rel_path))
+                    _data(out, contents)
+                out.write(b'\n')
+
+                out.write(b'tag v%s\nfrom :%d\ntagger %s\n' % (version.encode(), version_mark, committer))
+                _data(out, version.encode() + b'\n')
+
+            out.write(b'done\n')
+
+        try:
+            with open(stream_file, 'rb') as stream:
+                run_cmd(['git', 'fast-import', '--quiet'], cwd=project_dir, stdin=stream)
+        except CommandError as e:
+            raise GitImportError(f'git fast-import failed: {e}')
+    finally:
+        os.remove(stream_file)
+
+    # The working tree and index have to end up where the commands would have left them
+    for path, contents in version_files.items() if version is not None else ():
+        with open(path, 'wb') as f:
+            f.write(contents)
+    run_cmd(['git', 'reset', '-q'], cwd=project_dir)
+    return version
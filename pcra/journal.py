@@ -0,0 +1,59 @@
+import os
+import json
+import time
+import threading
+
+JOURNAL_FILE = '.pcra-journal.json'
+JOURNAL_VERSION = 1
+
+
+class ResumeError(Exception):
+    pass
+
+
+class Journal:
+    """Phases completed in a project folder and the inputs they ran with, so an interrupted run can be resumed
+
+    The file only exists while a project is being created and is removed once everything has completed.
+    """
+
+    def __init__(self, project_dir):
+        self.path = os.path.join(project_dir, JOURNAL_FILE)
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def exists(project_dir):
+        return os.path.isfile(os.path.join(project_dir, JOURNAL_FILE))
+
+    @classmethod
+    def load(cls, project_dir):
+        journal = cls(project_dir)
+        try:
+            with open(journal.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ResumeError(f'Unable to read {journal.path}: {e}')
+        if data.get('version') != JOURNAL_VERSION:
+            raise ResumeError(f'{journal.path} was written by a different version of pcra')
+        journal.phases = data.get('phases', {})
+        return journal
+
+    def is_complete(self, phase, inputs):
+        entry = self.phases.get(phase)
+        return entry is not None and entry['inputs'] == inputs
+
+    def complete(self, phase, inputs):
+        # Phases finish on different threads, and a crash mid-write mustn't lose the ones already recorded
+        with self._lock:
+            self.phases[phase] = {'inputs': inputs, 'completed': time.time()}
+            tmp_file = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w') as f:
+                f.write(json.dumps({'version': JOURNAL_VERSION, 'phases': self.phases}, indent=2))
+            os.replace(tmp_file, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
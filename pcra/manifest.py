@@ -0,0 +1,131 @@
+import os
+
+from .archive import TemplateArchive
+
+IGNORED_DIRS = {'__pycache__'}
+
+
+class ManifestEntry:
+    def __init__(self, path, layer, source, size, mtime, digest=None, archive=None):
+        self.path = path
+        self.layer = layer
+        self.source = source  # File path, or None for entries inside a packed template
+        self.size = size
+        self.mtime = mtime
+        self.archive = archive
+        self.digest = digest  # Only packed entries have one, from the archive's manifest
+
+    @property
+    def signature(self):
+        # Cheap stand-in for the contents: packed entries always carry a digest, loose files go by size and mtime
+        return self.digest if self.archive is not None else f'{self.size}:{self.mtime}'
+
+    def read_bytes(self):
+        if self.archive is not None:
+            return self.archive.read(self.path)
+        with open(self.source, 'rb') as f:
+            return f.read()
+
+
+class _Layer:
+    def __init__(self, name, root):
+        self.name = name
+        self.root = root
+        self.files = {}
+        self.dirs = set()
+
+    def scan(self):
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            self.dirs.add(rel_dir)
+            with os.scandir(os.path.join(self.root, rel_dir)) as it:
+                for entry in it:
+                    rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                    if entry.is_dir():
+                        if entry.name not in IGNORED_DIRS:
+                            stack.append(rel_path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        self.files[rel_path] = ManifestEntry(rel_path, self.name, entry.path, st.st_size, st.st_mtime_ns)
+
+
+class _ArchiveLayer:
+    """A packed template: its embedded manifest is the index, so there is nothing to scan"""
+
+    def __init__(self, name, archive):
+        self.name = name
+        self.root = archive.path
+        self.archive = archive
+        self.dirs = set(archive.dirs) | {''}
+        self.files = {path: ManifestEntry(path, name, None, info['size'], None, info['sha256'], archive)
+                      for path, info in archive.files.items()}
+
+    def scan(self):
+        pass
+
+
+class TemplateManifest:
+    """Index of a template overlaid on the bundled fallback template
+
+    Lookups that aren't in the custom template resolve to the bundled one, so callers never have to check
+    the filesystem themselves to decide where a file comes from.
+    """
+
+    def __init__(self, template_dir, fallback_dir):
+        if os.path.isfile(template_dir):
+            self.layers = [_ArchiveLayer('template', TemplateArchive(template_dir))]
+        else:
+            self.layers = [_Layer('template', template_dir)]
+        if os.path.realpath(fallback_dir) != os.path.realpath(template_dir):
+            self.layers.append(_Layer('fallback', fallback_dir))
+
+    @property
+    def archive(self):
+        return getattr(self.template, 'archive', None)
+
+    def close(self):
+        # Releases the packed template, which on Windows stays locked for as long as it is open
+        if self.archive is not None:
+            self.archive.close()
+
+    @property
+    def template(self):
+        return self.layers[0]
+
+    def is_dir(self, rel_path):
+        return rel_path in self.template.dirs
+
+    def is_file(self, rel_path):
+        return rel_path in self.template.files
+
+    def resolve(self, rel_path):
+        """The entry for rel_path from the first layer that has it, or None"""
+        for layer in self.layers:
+            entry = layer.files.get(rel_path)
+            if entry is not None:
+                return entry
+        return None
+
+    def fallback(self, rel_path):
+        """The entry for rel_path in the bundled template"""
+        return self.layers[-1].files.get(rel_path)
+
+    def subtree(self, rel_dir):
+        """Folders and files under rel_dir in the custom template, as paths relative to rel_dir"""
+        prefix = f'{rel_dir}/'
+        dirs = sorted(d[len(prefix):] for d in self.template.dirs if d.startswith(prefix))
+        files = [entry for path, entry in self.template.files.items() if path.startswith(prefix)]
+        return dirs, files
+
+    def scan(self):
+        for layer in self.layers:
+            layer.scan()
+
+    @classmethod
+    def load(cls, template_dir, fallback_dir):
+        # Nothing is cached on disk: checking that a saved index still matches the files would take a stat of
+        # every file, which is all a scan costs
+        manifest = cls(template_dir, fallback_dir)
+        manifest.scan()
+        return manifest
@@ -0,0 +1,184 @@
+import os
+import json
+import shutil
+import platform
+
+from . import cache, profiler
+from .utils import printmsg, printwarn, run_cmd, get_cmd_output
+
+LOCK_FILE = 'package-lock.json'
+
+
+def _normalized_json(path, drop=('name', 'version')):
+    with open(path, 'r') as f:
+        return _normalize(json.load(f), drop)
+
+
+def _normalize(data, drop=('name', 'version')):
+    # Project name and version don't affect what gets installed, so leave them out of cache keys
+    data = {k: v for k, v in data.items() if k not in drop}
+    if '' in data.get('packages', {}):
+        # Version 2 and 3 lockfiles repeat them for the root package
+        packages = dict(data['packages'])
+        packages[''] = {k: v for k, v in packages[''].items() if k not in drop}
+        data['packages'] = packages
+    return json.dumps(data, sort_keys=True)
+
+
+class NpmCache:
+    """Local node_modules store keyed by lockfile so repeat scaffolds don't hit the npm registry"""
+
+    def __init__(self, enabled=True, refresh=False, offline=False):
+        self.enabled = enabled
+        self.refresh = refresh
+        self.offline = offline
+        self._node_version = None
+        self._locks = cache.KeyLocks('npm')
+
+    @property
+    def node_version(self):
+        if self._node_version is None:
+            self._node_version = get_cmd_output(['node', '--version']) or 'unknown'
+        return self._node_version
+
+    def key(self, lock_file):
+        # Native add-ons are built per platform and node ABI
+        return cache.hash_key(_normalized_json(lock_file), self.node_version, platform.system(), platform.machine())
+
+    @staticmethod
+    def _lock_dir(package_file):
+        return os.path.join(cache.cache_dir('npm-lock'), cache.hash_key(_normalized_json(package_file)))
+
+    def plan(self, package_data, lock_data=None):
+        """Predict what install() will do for the given package.json (and lockfile) contents without running anything
+
+        Returns the expected cache result ('hit', 'miss' or None when caching is off) and the npm command that
+        would run, if any.  A hit assumes node hasn't been upgraded since the modules were cached.
+        """
+        npm_flags = ['--offline'] if self.offline else []
+        use_cache = self.enabled and not self.refresh
+
+        if lock_data is None and use_cache:
+            cached_lock = os.path.join(cache.cache_dir('npm-lock', create=False),
+                                       cache.hash_key(_normalize(package_data)), LOCK_FILE)
+            if os.path.isfile(cached_lock):
+                with open(cached_lock, 'r') as f:
+                    lock_data = json.load(f)
+
+        if lock_data is None:
+            return ('miss' if self.enabled else None), ['npm', 'install'] + npm_flags
+
+        if use_cache and self._find_modules(cache.hash_key(_normalize(lock_data))):
+            return 'hit', None
+        return ('miss' if self.enabled else None), ['npm', 'ci'] + npm_flags
+
+    @staticmethod
+    def _find_modules(lock_hash):
+        section_dir = cache.cache_dir('npm', create=False)
+        if not os.path.isdir(section_dir):
+            return False
+        for entry in os.scandir(section_dir):
+            meta = cache.read_meta(entry.path) if entry.is_dir() else None
+            if meta and meta.get('lock') == lock_hash and meta.get('platform') == [platform.system(), platform.machine()]:
+                return True
+        return False
+
+    def _restore_lockfile(self, client_dir, project_name):
+        # A lockfile recorded from an earlier install of the same package.json pins the exact same tree
+        lock_dir = self._lock_dir(os.path.join(client_dir, 'package.json'))
+        cached_lock = os.path.join(lock_dir, LOCK_FILE)
+        if not os.path.isfile(cached_lock):
+            return False
+
+        with open(cached_lock, 'r') as f:
+            lock_data = json.load(f)
+        with open(os.path.join(client_dir, 'package.json'), 'r') as f:
+            version = json.load(f).get('version')
+        # The cached lockfile comes from whichever project filled the cache first
+        for package in (lock_data, lock_data.get('packages', {}).get('')):
+            if package is not None:
+                package['name'] = project_name
+                if version is not None and 'version' in package:
+                    package['version'] = version
+        with open(os.path.join(client_dir, LOCK_FILE), 'w') as f:
+            f.write(json.dumps(lock_data, indent=2))
+        return True
+
+    def _save_lockfile(self, client_dir):
+        lock_file = os.path.join(client_dir, LOCK_FILE)
+        if not os.path.isfile(lock_file):
+            return
+        lock_dir = self._lock_dir(os.path.join(client_dir, 'package.json'))
+        tmp_dir = cache.tmp_path(lock_dir)
+        os.makedirs(tmp_dir, exist_ok=True)
+        shutil.copy2(lock_file, tmp_dir)
+        cache.publish(tmp_dir, lock_dir)
+
+    def _restore_modules(self, key, client_dir) -> bool:
+        entry_dir = os.path.join(cache.cache_dir('npm'), key)
+        # Held so that another process can't evict the entry halfway through linking it
+        with self._locks(key):
+            meta = cache.read_meta(entry_dir)
+            if meta is None:
+                return False
+            if 'lock' not in meta:
+                # Entries from older versions don't record what plan() needs to find them
+                meta.update(lock=cache.hash_key(_normalized_json(os.path.join(client_dir, LOCK_FILE))),
+                            node=self.node_version, platform=[platform.system(), platform.machine()])
+                cache.write_meta(entry_dir, meta)
+
+            cache.link_tree(os.path.join(entry_dir, 'node_modules'), os.path.join(client_dir, 'node_modules'))
+            cache.mark_used(entry_dir)
+        printmsg('Restored JavaScript dependencies from cache')
+        return True
+
+    def _save_modules(self, key, client_dir):
+        entry_dir = os.path.join(cache.cache_dir('npm'), key)
+        tmp_dir = cache.tmp_path(entry_dir)
+        try:
+            cache.link_tree(os.path.join(client_dir, 'node_modules'), os.path.join(tmp_dir, 'node_modules'))
+            # The lockfile hash and platform let a dry run predict a hit without asking node for its version
+            cache.write_meta(tmp_dir, {'size': cache.tree_size(tmp_dir),
+                                       'lock': cache.hash_key(_normalized_json(os.path.join(client_dir, LOCK_FILE))),
+                                       'node': self.node_version,
+                                       'platform': [platform.system(), platform.machine()]})
+            with self._locks(key):
+                cache.publish(tmp_dir, entry_dir)
+                cache.evict(os.path.dirname(entry_dir))
+        except OSError as e:
+            printwarn(f'Unable to cache JavaScript dependencies: {e}')
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def install(self, client_dir, project_name):
+        with profiler.span('npm', 'step') as step:
+            # Projects created side by side with the same dependencies wait for the first install and reuse it
+            if not self.enabled:
+                restored = self._install(client_dir, project_name)
+            else:
+                with self._locks(_normalized_json(os.path.join(client_dir, 'package.json'))):
+                    restored = self._install(client_dir, project_name)
+            step['cache'] = 'hit' if restored else 'miss'
+
+    def _install(self, client_dir, project_name) -> bool:
+        lock_file = os.path.join(client_dir, LOCK_FILE)
+        npm_flags = ['--offline'] if self.offline else []
+
+        if self.enabled and not self.refresh and not os.path.isfile(lock_file):
+            self._restore_lockfile(client_dir, project_name)
+
+        if os.path.isfile(lock_file):
+            key = self.key(lock_file)
+            if self.enabled and not self.refresh and self._restore_modules(key, client_dir):
+                return True
+            # Install exactly what the lockfile pins instead of re-resolving the dependency ranges
+            run_cmd(['npm', 'ci'] + npm_flags, cwd=client_dir)
+        else:
+            run_cmd(['npm', 'install'] + npm_flags, cwd=client_dir)
+            if not os.path.isfile(lock_file):
+                return False
+            key = self.key(lock_file)
+
+        if self.enabled:
+            self._save_lockfile(client_dir)
+            self._save_modules(key, client_dir)
+        return False
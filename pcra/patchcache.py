@@ -0,0 +1,137 @@
+import os
+import json
+import shutil
+from contextlib import nullcontext
+
+from . import cache, profiler
+from .utils import printmsg
+
+PLUGIN_NAME = 'parcel-plugin-transcrypt'
+
+
+class PatchError(Exception):
+    pass
+
+
+def _plugin_version(plugin_dir):
+    try:
+        with open(os.path.join(plugin_dir, 'package.json'), 'r') as f:
+            return json.load(f).get('version', 'unknown')
+    except (OSError, ValueError):
+        raise PatchError(f"Unable to read the {PLUGIN_NAME} version from {plugin_dir}")
+
+
+class PatchCache:
+    """Already-patched plugin files keyed by plugin version and patch contents
+
+    A hit copies the patched files straight into node_modules without loading the patch library.
+    """
+
+    def __init__(self, enabled=True, refresh=False):
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._locks = cache.KeyLocks('patch')
+
+    def apply(self, plugin_dir, patch_data):
+        key = cache.hash_key(PLUGIN_NAME, _plugin_version(plugin_dir), patch_data)
+        entry_dir = os.path.join(cache.cache_dir('patch', create=self.enabled), key)
+
+        # Without the cache there's nothing shared to lock, and the lock file would create the cache folder
+        with self._locks(key) if self.enabled else nullcontext(), profiler.span('patch', 'step') as step:
+            if self.enabled and not self.refresh and self._restore(entry_dir, plugin_dir, cache.hash_key(patch_data)):
+                self.hits += 1
+                step['cache'] = 'hit'
+                printmsg('Transcrypt Parcel Plugin patch restored from cache (hit)')
+                return
+
+            self.misses += 1
+            step['cache'] = 'miss'
+            originals = self._patch(plugin_dir, patch_data)
+            printmsg('Transcrypt Parcel Plugin patched (cache miss)')
+            if self.enabled:
+                self._save(entry_dir, plugin_dir, originals, cache.hash_key(patch_data))
+
+    def plan(self, patch_data):
+        """Expected cache result for applying patch_data ('hit', 'miss' or None when caching is off)
+
+        The plugin version isn't known until npm has run, so any cached result for the same patch counts as a hit.
+        """
+        if not self.enabled:
+            return None
+        section_dir = cache.cache_dir('patch', create=False)
+        if self.refresh or not os.path.isdir(section_dir):
+            return 'miss'
+        patch_hash = cache.hash_key(patch_data)
+        for entry in os.scandir(section_dir):
+            meta = cache.read_meta(entry.path) if entry.is_dir() else None
+            if meta and meta.get('patch') == patch_hash:
+                return 'hit'
+        return 'miss'
+
+    @staticmethod
+    def _patch(plugin_dir, patch_data):
+        import patch
+
+        patch_set = patch.fromstring(patch_data)
+        if not patch_set:
+            raise PatchError('The Transcrypt Parcel Plugin patch file could not be parsed')
+
+        originals = {}
+        for target in sorted({item.target.decode() for item in patch_set.items}):
+            target_file = os.path.join(plugin_dir, target)
+            if not os.path.isfile(target_file):
+                raise PatchError(f"The Transcrypt Parcel Plugin patch target '{target}' does not exist in {plugin_dir}")
+            originals[target] = cache.hash_file(target_file)
+            # node_modules may be hardlinked from the cache so don't patch the shared copy
+            cache.unshare(target_file)
+
+        if not patch_set.apply(root=plugin_dir):
+            raise PatchError(f'The Transcrypt Parcel Plugin patch did not apply cleanly to {plugin_dir}')
+        return originals
+
+    @staticmethod
+    def _restore(entry_dir, plugin_dir, patch_hash) -> bool:
+        meta = cache.read_meta(entry_dir)
+        if meta is None:
+            return False
+
+        for target, checksums in meta['files'].items():
+            # The cached result is only valid for the same unpatched file it was made from
+            if cache.hash_file(os.path.join(plugin_dir, target)) != checksums['original']:
+                return False
+
+        for target, checksums in meta['files'].items():
+            destination = os.path.join(plugin_dir, target)
+            tmp_file = cache.tmp_path(destination)
+            shutil.copyfile(os.path.join(entry_dir, 'files', target), tmp_file)
+            shutil.copymode(destination, tmp_file)
+            os.replace(tmp_file, destination)
+            if cache.hash_file(destination) != checksums['patched']:
+                raise PatchError(f"Checksum mismatch for cached patch result '{target}' in {entry_dir}")
+
+        if meta.get('patch') != patch_hash:
+            # Entries from older versions don't record what plan() needs to find them
+            meta['patch'] = patch_hash
+            cache.write_meta(entry_dir, meta)
+        cache.mark_used(entry_dir)
+        return True
+
+    @staticmethod
+    def _save(entry_dir, plugin_dir, originals, patch_hash):
+        tmp_dir = cache.tmp_path(entry_dir)
+        files = {}
+        try:
+            for target, original in originals.items():
+                source = os.path.join(plugin_dir, target)
+                destination = os.path.join(tmp_dir, 'files', target)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(source, destination)
+                files[target] = {'original': original, 'patched': cache.hash_file(destination)}
+            cache.write_meta(tmp_dir, {'files': files, 'patch': patch_hash})
+            cache.publish(tmp_dir, entry_dir)
+        except OSError:
+            pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
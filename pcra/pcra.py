@@ -1,14 +1,14 @@
 import os
 import sys
 import argparse
-import shutil
-import json
-import venv
 
-# import patch
+# Everything else is imported where it's used so that --help and argument errors don't pay for it
 
-from .utils import printerr, printmsg, printwarn, Fore, Style
-from .utils import check_python_version, check_git_installed, check_npm_installed, run_cmd
+from .utils import printerr, printmsg, printwarn, colors
+from .utils import check_python_version, probe_toolchain, run_cmd
+from .copyengine import COPY_MODES
+from .archive import ARCHIVE_EXTENSION
+from . import profiler
 
 PYTHON_VERSION_REQUIRED = '3.7'
 
@@ -16,14 +16,33 @@ is_windows = os.name == 'nt'
 
 
 class PCRA:
-    def __init__(self, cli_args):
-        self.current_dir = os.getcwd()
-        self.has_client = cli_args.client_only or cli_args.full_stack
-        self.has_server = cli_args.full_stack
-        self.has_venv = not cli_args.no_virtualenv
-        self.has_npm = not cli_args.no_javascript
-        self.has_git = not cli_args.no_git
-        self.template_dir = cli_args.template
+    def __init__(self, options, venv_cache=None, npm_cache=None, wheelhouse=None):
+        # Never chdir: relative paths are resolved here and every subprocess gets an explicit cwd
+        self.current_dir = options.base_dir or os.getcwd()
+        self.has_client = options.client_only or options.full_stack
+        self.has_server = options.full_stack
+        self.has_venv = not options.no_virtualenv
+        self.has_npm = not options.no_javascript
+        self.has_git = not options.no_git
+        self.template_dir = options.template
+        self.use_cache = not options.no_cache
+        self.offline = options.offline
+        self.resume = options.resume
+        self._manifest = None
+        from .venvcache import VenvCache
+        from .npmcache import NpmCache
+        from .copyengine import CopyEngine
+        from .patchcache import PatchCache
+        from .wheelhouse import Wheelhouse
+        from .render import TemplateRenderer
+
+        self.venv_cache = venv_cache or VenvCache(enabled=not options.no_cache, refresh=options.refresh_cache)
+        self.wheelhouse = wheelhouse or Wheelhouse(enabled=not options.no_cache, refresh=options.refresh_cache,
+                                                   offline=options.offline)
+        self.copier = CopyEngine(options.copy_mode)
+        self.npm_cache = npm_cache or NpmCache(enabled=not options.no_cache, refresh=options.refresh_cache,
+                                               offline=options.offline)
+        self.patch_cache = PatchCache(enabled=not options.no_cache, refresh=options.refresh_cache)
 
         self.client_source_dir = 'client' if self.has_client else 'default'
 
@@ -35,7 +54,7 @@ class PCRA:
             printmsg("Installing basic react app...")
 
 
-        self.project_dir = cli_args.folder
+        self.project_dir = options.folder
         if not os.path.isabs(self.project_dir):
             self.project_dir = os.path.realpath(os.path.join(self.current_dir, self.project_dir))
 
@@ -55,167 +74,400 @@ class PCRA:
             if not os.path.isabs(self.template_dir):
                 self.template_dir = os.path.realpath(os.path.join(self.current_dir, self.template_dir))
 
-    def _update_project_name(self):
-        with open('package.json', 'r') as f:
-            json_data = json.load(f)
-            json_data['name'] = self.project_name
+        # Values for the {{pcra:NAME}} placeholders in template files
+        self.variables = {'project_name': self.project_name, 'app_title': self.project_name}
+        self.variables.update(options.variables or {})
+        self.renderer = TemplateRenderer(self.variables, use_cache=self.use_cache)
+
+    def _set_project_name(self, data):
+        import json
+
+        json_data = json.loads(data)
+        json_data['name'] = self.project_name
+        return json.dumps(json_data, indent=2).encode()
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            from .manifest import TemplateManifest
+            self._manifest = TemplateManifest.load(self.template_dir, self.fallback_dir)
+        return self._manifest
+
+    @manifest.setter
+    def manifest(self, manifest):
+        self._manifest = manifest
+
+    def close(self):
+        """Release the template once every step that reads from it (including the bundled wheels) has run"""
+        if self._manifest is not None:
+            self._manifest.close()
+
+    def _copy_entries(self, pairs):
+        # Files with placeholders are rendered on the way, and package.json gets the project name before it's written
+        transforms = {os.path.join(self.client_dir, 'package.json'): self._set_project_name}
+        pairs = self.renderer.write(self.manifest, pairs, transforms, self.copier.stats)
+
+        # Entries from a packed template are streamed out of the archive, loose files go through the copy engine
+        archive_pairs = [(entry.path, destination) for entry, destination in pairs if entry.archive is not None]
+        if archive_pairs:
+            self.manifest.archive.extract(archive_pairs)
+            for entry, _ in pairs:
+                if entry.archive is not None:
+                    self.copier.stats.add(entry.size, 'extract')
+
+        self.copier.copy_files([(entry.source, destination) for entry, destination in pairs if entry.archive is None])
+
+    def _copy_fallback_file(self, destination_dir, file_name):
+        entry = self.manifest.fallback(file_name)
+        self._copy_entries([(entry, os.path.join(destination_dir, os.path.basename(file_name)))])
+
+    def _template_file_plan(self, destination_dir, file_name):
+        return self.manifest.resolve(file_name), os.path.join(destination_dir, os.path.basename(file_name))
+
+    def _template_tree_plan(self, folder_name, destination_dir):
+        dirs, entries = self.manifest.subtree(folder_name)
+        prefix_len = len(folder_name) + 1
+        return ([destination_dir] + [os.path.join(destination_dir, *rel_dir.split('/')) for rel_dir in dirs],
+                [(entry, os.path.join(destination_dir, *entry.path[prefix_len:].split('/'))) for entry in entries])
+
+    def copy_plan(self):
+        """Folders to create and (manifest entry, destination file) pairs that copy_template will copy"""
+        dirs, pairs = self._template_tree_plan(self.client_source_dir, self.client_dir)
 
-        with open('package.json', 'w') as f:
-            f.write(json.dumps(json_data, indent=2))
+        if self.has_server:
+            pairs.append(self._template_file_plan(self.client_dir, 'dev-server.js'))
+            if self.has_npm:
+                dirs.append(os.path.join(self.client_dir, '.git'))  # Empty folder so that npm version works
+            server_dirs, server_pairs = self._template_tree_plan('server', os.path.join(self.project_dir, 'server'))
+            dirs.extend(server_dirs)
+            pairs.extend(server_pairs)
 
-    def _copy_template_file(self, destination_dir, file_name):
-        if os.path.isfile(os.path.join(self.template_dir, file_name)):
-            shutil.copy2(os.path.join(self.template_dir, file_name), destination_dir)
-        else:
-            shutil.copy2(os.path.join(self.fallback_dir, file_name), destination_dir)
+        if self.has_git:
+            pairs.append(self._template_file_plan(self.project_dir, '.gitignore'))
+
+        if self.manifest.is_file('README.md'):
+            pairs.append(self._template_file_plan(self.project_dir, 'README.md'))
+
+        return dirs, pairs
 
     def validate_template(self) -> bool:
+        from .archive import ArchiveError
+
         printmsg('Validating template...')
 
-        if not os.path.isdir(self.template_dir):
+        if not os.path.exists(self.template_dir):
             printerr("The template path specified does not exist!")
             return False
 
-        if not os.path.isdir(os.path.join(self.template_dir, self.client_source_dir)):
+        try:
+            manifest = self.manifest
+        except (ArchiveError, OSError) as e:
+            printerr(e)
+            return False
+
+        if not manifest.is_dir(self.client_source_dir):
             printerr(f"The '{self.client_source_dir}' folder does not exist in the template!")
             return False
 
-        if self.has_git and self.has_npm and not os.path.isdir(os.path.join(self.template_dir, self.client_source_dir, 'src')):
+        if self.has_git and self.has_npm and not manifest.is_dir(f'{self.client_source_dir}/src'):
             printerr(f"The '{self.client_source_dir}' folder does not have a src folder in the template!")
             return False
 
-        if self.has_server and not os.path.isdir(os.path.join(self.template_dir, 'server')):
+        if self.has_server and not manifest.is_dir('server'):
             printerr("The 'server' folder does not exist in the template!")
             return False
 
-        if self.has_venv and not os.path.isfile(os.path.join(self.template_dir, 'client', 'requirements.txt')):
+        if self.has_venv and not manifest.is_file('client/requirements.txt'):
             printwarn("The client 'requirements.txt' pip dependency file does not exist in the template...using default")
 
-        if self.has_npm and not os.path.isfile(os.path.join(self.template_dir, 'client', 'package.json')):
+        if self.has_npm and not manifest.is_file('client/package.json'):
             printwarn("The client 'package.json' file does not exist in the template...using default")
 
         patch_name = 'asset.js.win.patch' if is_windows else 'asset.js.patch'
-        if self.has_npm and not os.path.isfile(os.path.join(self.template_dir, patch_name)):
+        if self.has_npm and not manifest.is_file(patch_name):
             printwarn(f"The '{patch_name}' file does not exist in the template...using default")
 
-        if self.has_server and not os.path.isfile(os.path.join(self.template_dir, 'dev-server.js')):
+        if self.has_server and not manifest.is_file('dev-server.js'):
             printwarn("The 'dev-server.js' middleware proxy file does not exist in the template...using default")
 
-        if self.has_server and self.has_venv and not os.path.isfile(os.path.join(self.template_dir, 'server', 'requirements.txt')):
+        if self.has_server and self.has_venv and not manifest.is_file('server/requirements.txt'):
             printwarn("The server 'requirements.txt' pip dependency file does not exist in the template...using default")
 
-        if self.has_git and not os.path.isfile(os.path.join(self.template_dir, '.gitignore')):
+        if self.has_git and not manifest.is_file('.gitignore'):
             printwarn("The '.gitignore' file does not exist in the template...using default")
 
         return True
 
     def copy_template(self):
-        printmsg('Copying template...')
-        if self.has_client:
-            shutil.copytree(os.path.join(self.template_dir, 'client'), self.client_dir,
-                            ignore=shutil.ignore_patterns('__pycache__'))
-        else:
-            shutil.copytree(os.path.join(self.template_dir, 'default'), self.client_dir,
-                            ignore=shutil.ignore_patterns('__pycache__'))
-
-        if self.has_server:
-            self._copy_template_file(self.client_dir, 'dev-server.js')
-
-            if self.has_npm:
-                os.mkdir(os.path.join(self.client_dir, '.git'))  # Empty folder so that npm version works
-            printmsg('Copying server template...')
-            shutil.copytree(os.path.join(self.template_dir, 'server'), os.path.join(self.project_dir, 'server'))
+        import time
 
-        if self.has_git:
-            self._copy_template_file(self.project_dir, '.gitignore')
+        printmsg('Copying template...')
+        start = time.perf_counter()
+        with profiler.span('copy', 'step') as step:
+            dirs, pairs = self.copy_plan()
+            for folder in dirs:
+                os.makedirs(folder)
+            self._copy_entries(pairs)
+            step['files'] = len(pairs)
+
+        self.copier.stats.seconds = time.perf_counter() - start
+        printmsg(f'Copied {self.copier.stats}')
+        if self.renderer.rendered:
+            printmsg(f'Filled in template variables in {self.renderer.rendered} files')
+
+    def _requirements_file(self, target_dir, source_file, fallback_file):
+        # Use the default requirements.txt if the supplied template doesn't have one
+        requirements_file = os.path.join(target_dir, 'requirements.txt')
+        if not os.path.isfile(requirements_file) and not self.manifest.is_file(source_file):
+            self._copy_fallback_file(target_dir, fallback_file)
+        return requirements_file
+
+    def _client_requirements(self):
+        return self._requirements_file(self.client_dir, f'{self.client_source_dir}/requirements.txt',
+                                       'client/requirements.txt')
+
+    def _server_requirements(self):
+        return self._requirements_file(os.path.join(self.project_dir, 'server'), 'server/requirements.txt',
+                                       'server/requirements.txt')
+
+    def _install_requirements(self, target_dir):
+        import venv
 
-        if os.path.isfile(os.path.join(self.template_dir, 'README.md')):
-            shutil.copy2(os.path.join(self.template_dir, 'README.md'), self.project_dir)
+        script_folder = 'Scripts' if is_windows else 'bin'
+        venv_dir = os.path.join(target_dir, 'venv')
+        requirements_file = os.path.join(target_dir, 'requirements.txt')
 
-    def make_venv(self):
-        os.chdir(self.client_dir)
+        with self.venv_cache.lock(requirements_file), profiler.span('venv', 'step') as step:
+            if self.venv_cache.restore(requirements_file, venv_dir):
+                step['cache'] = 'hit'
+                return
+            step['cache'] = 'miss'
 
-        if self.has_venv:
-            printmsg('Creating virtual environment...')
-            venv.create('venv', with_pip=True)
+            venv.create(venv_dir, with_pip=True)
             printmsg('Installing Python dependencies...')
-            script_folder = 'Scripts' if is_windows else 'bin'
+            with self.wheelhouse.installing(requirements_file, venv_dir) as install_args:
+                run_cmd([os.path.join('.', 'venv', script_folder, 'pip'), 'install'] + install_args
+                        + ['-r', 'requirements.txt'], cwd=target_dir)
+            self.venv_cache.save(requirements_file, venv_dir)
 
-            # Use the default requirements.txt if the supplied template doesn't have one
-            if not os.path.isfile(os.path.join(self.template_dir, self.client_source_dir, 'requirements.txt')):
-                shutil.copy2(os.path.join(self.fallback_dir, 'client', 'requirements.txt'), '.')
+    def make_wheelhouse(self):
+        from .wheelhouse import WHEELHOUSE_FOLDER
 
-            run_cmd([os.path.join('.', 'venv', script_folder, 'pip'), 'install', '-r', 'requirements.txt'])
+        if not self.has_venv or not self.wheelhouse.enabled:
+            return
 
-            if self.has_server:
-                printmsg('Creating server virtual environment...')
-                os.chdir(os.path.join(self.project_dir, 'server'))
-                venv.create('venv', with_pip=True)
-                printmsg('Installing Python dependencies...')
+        requirements_files = [self._client_requirements()]
+        if self.has_server:
+            requirements_files.append(self._server_requirements())
+
+        # Environments that will come straight out of the venv cache don't need any wheels
+        requirements_files = [f for f in requirements_files if not self.venv_cache.has(f)]
+        if not requirements_files:
+            return
 
-                # Use the default requirements.txt if the supplied template doesn't have one
-                if not os.path.isfile(os.path.join(self.template_dir, 'server', 'requirements.txt')):
-                    shutil.copy2(os.path.join(self.fallback_dir, 'server', 'requirements.txt'), '.')
+        _, bundled = self.manifest.subtree(WHEELHOUSE_FOLDER)
+        if bundled:
+            self.wheelhouse.add_bundled(entry for entry in bundled if entry.path.endswith('.whl'))
+        self.wheelhouse.prepare(requirements_files, bundled=bool(bundled))
 
-                run_cmd([os.path.join('.', 'venv', script_folder, 'pip'), 'install', '-r', 'requirements.txt'])
-                os.chdir(self.client_dir)
+    def make_client_venv(self):
+        if self.has_venv:
+            printmsg('Creating virtual environment...')
+            self._client_requirements()
+            self._install_requirements(self.client_dir)
         else:
             printwarn('SKIPPING virtual environment creation!')
 
-    def make_npm(self):
-        os.chdir(self.client_dir)
+    def make_server_venv(self):
+        if self.has_venv and self.has_server:
+            printmsg('Creating server virtual environment...')
+            self._server_requirements()
+            self._install_requirements(os.path.join(self.project_dir, 'server'))
+
+    def make_venv(self):
+        self.make_wheelhouse()
+        self.make_client_venv()
+        self.make_server_venv()
 
+    def make_npm(self):
         if self.has_npm:
             printmsg('Installing JavaScript dependencies...')
 
             # Use the default package.json if the supplied template doesn't have one
-            if not os.path.isfile(os.path.join(self.template_dir, self.client_source_dir, 'package.json')):
-                shutil.copy2(os.path.join(self.fallback_dir, 'client', 'package.json'), '.')
+            package_file = os.path.join(self.client_dir, 'package.json')
+            if not os.path.isfile(package_file) and not self.manifest.is_file(f'{self.client_source_dir}/package.json'):
+                self._copy_fallback_file(self.client_dir, 'client/package.json')
 
-            self._update_project_name()
-            run_cmd(['npm', 'install'])
+            self.npm_cache.install(self.client_dir, self.project_name)
 
             printmsg('Patching Transcrypt Parcel Plugin...')
             patch_name = 'asset.js.win.patch' if is_windows else 'asset.js.patch'
+            plugin_dir = os.path.join(self.client_dir, 'node_modules', 'parcel-plugin-transcrypt')
 
-            try:
-                import patch
-
-                # Use the default patch if the supplied template doesn't have one
-                if not os.path.isfile(os.path.join(self.template_dir, patch_name)):
-                    patch_set = patch.fromfile(os.path.join(self.fallback_dir, patch_name))
-                else:
-                    patch_set = patch.fromfile(os.path.join(self.template_dir, patch_name))
-
-                patch_set.apply(root=os.path.join('.', 'node_modules', 'parcel-plugin-transcrypt'))
-            except Exception as e:
-                printerr("Transcrypt Parcel Plugin patch failed!")
-                printerr(e)
+            # Use the default patch if the supplied template doesn't have one
+            self.patch_cache.apply(plugin_dir, self.manifest.resolve(patch_name).read_bytes())
         else:
             printwarn('SKIPPING JavaScript dependencies!')
-            if os.path.isfile(os.path.join(self.client_dir, 'package.json')):
-                os.remove(os.path.join(self.client_dir, 'package.json'))
+            for file_name in ('package.json', 'package-lock.json'):
+                if os.path.isfile(os.path.join(self.client_dir, file_name)):
+                    os.remove(os.path.join(self.client_dir, file_name))
 
-    def make_git(self):
-        os.chdir(self.project_dir)
+    def _git_commands(self):
+        from .journal import JOURNAL_FILE
+
+        run_cmd(['git', 'init'], cwd=self.project_dir)
+        run_cmd(['git', 'add', '--', '.', f':(exclude){JOURNAL_FILE}'], cwd=self.project_dir)
+        run_cmd(['git', 'commit', '-m', '"Initial Commit"'], cwd=self.project_dir)
 
+    def make_git(self):
+        version = None
         if self.has_git:
+            import shutil
+            from .gitimport import initial_commit, GitImportError
+
             printmsg('Committing project to local Git repository...')
-            run_cmd(['git', 'init'])
-            run_cmd(['git', 'add', '.'])
-            run_cmd(['git', 'commit', '-m', '"Initial Commit"'])
+            with profiler.span('git', 'step') as step:
+                try:
+                    # Streams the initial commit (and the npm version commit and tag) into a single git process
+                    version = initial_commit(self.project_dir, self.client_dir if self.has_npm else None)
+                    step['method'] = 'fast-import'
+                except GitImportError as e:
+                    printwarn(f'{e}...using git commands instead')
+                    shutil.rmtree(os.path.join(self.project_dir, '.git'), ignore_errors=True)
+                    self._git_commands()
+                    step['method'] = 'commands'
         else:
             printwarn('SKIPPING Git repository creation!')
 
         if self.has_npm and self.has_git:
-            printmsg('Setting npm version...')
-            os.chdir(self.client_dir)
-            run_cmd(['npm', 'version', 'minor'])
+            if version is None:
+                printmsg('Setting npm version...')
+                run_cmd(['npm', 'version', 'minor'], cwd=self.client_dir)
+            else:
+                printmsg(f'Set npm version to v{version}')
         else:
             printwarn('SKIPPING npm version!')
 
+    # Phase name, method and the phases it has to wait for
+    PHASES = [('copy', 'copy_template', ()),
+              ('wheelhouse', 'make_wheelhouse', ('copy',)),
+              ('client-venv', 'make_client_venv', ('wheelhouse',)),
+              ('server-venv', 'make_server_venv', ('wheelhouse',)),
+              ('npm', 'make_npm', ('copy',)),
+              ('git', 'make_git', ('client-venv', 'server-venv', 'npm'))]
+
+    def _source_entry(self, source_file, fallback_file):
+        # Manifest entry of a file that is copied from the default template when the supplied one doesn't have it
+        if self.manifest.is_file(source_file):
+            return self.manifest.resolve(source_file)
+        return self.manifest.fallback(fallback_file)
+
+    def phase_inputs(self):
+        """{phase: hash} of everything each phase depends on, to tell whether a journaled phase is still valid"""
+        from .cache import hash_key
+
+        flags = f'{self.has_client}:{self.has_server}:{self.has_venv}:{self.has_npm}:{self.has_git}'
+        variables = [f'{name}={value}' for name, value in sorted(self.variables.items())]
+        dirs, pairs = self.copy_plan()
+        copy = hash_key(flags, *variables, *dirs, *(f'{destination}:{entry.layer}:{entry.signature}' for entry, destination in pairs))
+
+        python = f'{sys.executable}:{sys.version}'
+        client = self._source_entry(f'{self.client_source_dir}/requirements.txt', 'client/requirements.txt').signature
+        server = self._source_entry('server/requirements.txt', 'server/requirements.txt').signature if self.has_server else ''
+
+        npm = ''
+        if self.has_npm:
+            lock_file = f'{self.client_source_dir}/package-lock.json'
+            patch_name = 'asset.js.win.patch' if is_windows else 'asset.js.patch'
+            npm = hash_key(self._source_entry(f'{self.client_source_dir}/package.json', 'client/package.json').signature,
+                           self.manifest.resolve(lock_file).signature if self.manifest.is_file(lock_file) else '',
+                           self.manifest.resolve(patch_name).signature, str(self.offline))
+
+        return {'copy': copy,
+                'wheelhouse': hash_key(copy, python, client, server),
+                'client-venv': hash_key(copy, python, client),
+                'server-venv': hash_key(copy, python, server),
+                'npm': hash_key(copy, npm),
+                'git': copy}
+
+    def _venv_python(self, target_dir):
+        return os.path.join(target_dir, 'venv', 'Scripts' if is_windows else 'bin',
+                            'python.exe' if is_windows else 'python')
+
+    def _phase_outputs(self, phase):
+        """Whether what a completed phase left behind is still there"""
+        if phase == 'copy':
+            return all(os.path.isfile(destination) for _, destination in self.copy_plan()[1])
+        if phase == 'client-venv' and self.has_venv:
+            return os.path.isfile(self._venv_python(self.client_dir))
+        if phase == 'server-venv' and self.has_venv and self.has_server:
+            return os.path.isfile(self._venv_python(os.path.join(self.project_dir, 'server')))
+        if phase == 'npm' and self.has_npm:
+            return os.path.isfile(os.path.join(self.client_dir, 'node_modules', 'parcel-plugin-transcrypt', 'asset.js'))
+        if phase == 'git' and self.has_git:
+            return os.path.isfile(os.path.join(self.project_dir, '.git', 'HEAD'))
+        return True
+
+    def _reset_phase(self, phase):
+        # Clear out whatever an interrupted attempt at the phase left behind
+        import shutil
+
+        folders = {'client-venv': os.path.join(self.client_dir, 'venv'),
+                   'server-venv': os.path.join(self.project_dir, 'server', 'venv'),
+                   'npm': os.path.join(self.client_dir, 'node_modules'),
+                   'git': os.path.join(self.project_dir, '.git')}
+        if phase in folders and os.path.isdir(folders[phase]):
+            shutil.rmtree(folders[phase])
+
+    def _completed_phases(self, journal, inputs):
+        from .journal import ResumeError
+
+        # Later phases all work on the copied files, so a changed template or changed options can't be resumed
+        if not journal.is_complete('copy', inputs['copy']) or not self._phase_outputs('copy'):
+            raise ResumeError(f'The template or options have changed since {self.project_dir} was started, '
+                              f'delete it and start again')
+
+        # A phase is only skipped if everything it waits for is skipped as well
+        completed = set()
+        for phase, _, depends in self.PHASES:
+            if all(d in completed for d in depends) and journal.is_complete(phase, inputs[phase]) \
+                    and self._phase_outputs(phase):
+                completed.add(phase)
+        return completed
+
+    def bootstrap(self, jobs=1):
+        from .scheduler import TaskScheduler
+        from .journal import Journal
+
+        # Every phase is recorded in the project's journal as it completes, so --resume can skip it next time
+        inputs = self.phase_inputs()
+        journal = Journal(self.project_dir)
+        completed = set()
+        if self.resume and Journal.exists(self.project_dir):
+            journal = Journal.load(self.project_dir)
+            completed = self._completed_phases(journal, inputs)
+            printmsg(f"Resuming, already completed: {', '.join(p for p, _, _ in self.PHASES if p in completed)}")
+
+        def run_phase(phase, func):
+            def run():
+                if phase in completed:
+                    return
+                if self.resume:
+                    self._reset_phase(phase)
+                func()
+                journal.complete(phase, inputs[phase])
+            return run
+
+        # The venvs and npm install only depend on the copied template (and the venvs on the shared wheels),
+        # so they can run side by side
+        scheduler = TaskScheduler(jobs)
+        for phase, method, depends in self.PHASES:
+            scheduler.add(phase, run_phase(phase, getattr(self, method)), depends=list(depends))
+        scheduler.run()
+        journal.remove()
+
     def print_instructions(self):
-        os.chdir(self.current_dir)
+        Fore, Style = colors()
         printmsg(f'Project [{self.project_name}] created in:')
         print(f'  {self.project_dir}')
 
@@ -257,21 +509,39 @@ class PCRA:
         print(f"{Style.RESET_ALL}")
 
 
-def _validate_system(cli_args) -> bool:
+def check_system(options, check_tools=True, check_folder=True):
+    """Returns an error message if the project can't be created, otherwise None"""
     if not check_python_version(PYTHON_VERSION_REQUIRED):
-        printerr(f'This command requires Python {PYTHON_VERSION_REQUIRED} and you are using Python {sys.version.split()[0]}')
-        return False
+        return f'This command requires Python {PYTHON_VERSION_REQUIRED} and you are using Python {sys.version.split()[0]}'
 
-    if os.path.isdir(cli_args.folder):
-        printerr('The path specified already exists!')
-        return False
+    project_dir = os.path.join(options.base_dir or os.getcwd(), options.folder)
+    if check_folder and os.path.isdir(project_dir):
+        from .journal import Journal
+        if not options.resume:
+            if Journal.exists(project_dir):
+                return 'The path specified already exists! Use --resume to finish creating the project'
+            return 'The path specified already exists!'
+        if not Journal.exists(project_dir):
+            return 'The path specified already exists and has nothing to resume!'
+
+    if check_tools:
+        # Both probes run at the same time and successful results are cached for a few minutes
+        needed = [tool for tool, skip in (('git', options.no_git), ('npm', options.no_javascript)) if not skip]
+        found = probe_toolchain(*needed, use_cache=not options.no_cache) if needed else {}
+
+        if not found.get('git', True):
+            return 'This command requires git to be installed.  Please install it and try again.'
+
+        if not found.get('npm', True):
+            return 'This command requires npm to be installed.  Please install Node.js and try again.'
+
+    return None
 
-    if not cli_args.no_git and not check_git_installed():
-        printerr('This command requires git to be installed.  Please install it and try again.')
-        return False
 
-    if not cli_args.no_javascript and not check_npm_installed():
-        printerr('This command requires npm to be installed.  Please install Node.js and try again.')
+def _validate_system(options) -> bool:
+    error = check_system(options)
+    if error is not None:
+        printerr(error)
         return False
 
     return True
@@ -279,21 +549,153 @@ def _validate_system(cli_args) -> bool:
 
 class WideFormatter(argparse.HelpFormatter):
     def __init__(self, prog):
+        import shutil
+
         width = shutil.get_terminal_size()[0]
         super().__init__(prog, max_help_position=40, width=width)
 
 
+def _template_variable(text):
+    import re
+
+    name, sep, value = text.partition('=')
+    if not sep or not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name):
+        raise argparse.ArgumentTypeError(f"'{text}' is not in NAME=VALUE form")
+    return name, value
+
+
+def pack_main(argv):
+    parser = argparse.ArgumentParser(prog='py-create-react-app pack',
+                                     description='Pack a template folder into a single template archive',
+                                     formatter_class=WideFormatter,
+                                     allow_abbrev=False,
+                                     )
+    parser.add_argument('source',
+                        metavar='TEMPLATE_FOLDER',
+                        type=str,
+                        help='template folder to pack')
+
+    parser.add_argument('archive',
+                        metavar='ARCHIVE_FILE',
+                        type=str,
+                        nargs='?',
+                        help=f'archive file to create (default: TEMPLATE_FOLDER{ARCHIVE_EXTENSION})')
+
+    parser.add_argument('-w',
+                        '--wheelhouse',
+                        action='store_true',
+                        help="bundle wheels for the template's Python requirements so it can be used offline")
+
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.source):
+        printerr('The template folder specified does not exist!')
+        sys.exit(1)
+
+    import tempfile
+    from .archive import pack_template
+    from .utils import CommandError
+
+    archive_file = args.archive or os.path.normpath(args.source) + ARCHIVE_EXTENSION
+    with tempfile.TemporaryDirectory() as wheel_dir:
+        extra_files = {}
+        if args.wheelhouse:
+            try:
+                extra_files = _build_wheelhouse(args.source, wheel_dir)
+            except CommandError as e:
+                printerr(e)
+                printerr('Unable to build the wheelhouse!')
+                sys.exit(1)
+
+        printmsg(f'Packing template {args.source}...')
+        file_count, total_size = pack_template(args.source, archive_file, extra_files)
+    printmsg(f'Packed {file_count} files ({total_size / 1024 / 1024:.1f} MB) into {archive_file}')
+
+
+def _build_wheelhouse(template_dir, wheel_dir):
+    from .manifest import TemplateManifest
+    from .wheelhouse import WHEELHOUSE_FOLDER, fetch_wheels
+
+    # Requirements missing from the template are taken from the default template, same as when scaffolding
+    manifest = TemplateManifest(template_dir, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'template'))
+    manifest.scan()
+    requirements_files = [manifest.resolve(f).source for f in ('client/requirements.txt', 'server/requirements.txt')]
+
+    printmsg('Building wheels for the Python requirements...')
+    fetch_wheels(requirements_files, wheel_dir)
+    wheels = sorted(f for f in os.listdir(wheel_dir) if f.endswith('.whl'))
+    printmsg(f'Bundling {len(wheels)} wheels')
+    return {f'{WHEELHOUSE_FOLDER}/{f}': os.path.join(wheel_dir, f) for f in wheels}
+
+
+def cache_main(argv):
+    parser = argparse.ArgumentParser(prog='py-create-react-app cache',
+                                     description='Inspect, check or clean up the local build cache',
+                                     formatter_class=WideFormatter,
+                                     allow_abbrev=False,
+                                     )
+    parser.add_argument('action',
+                        metavar='ACTION',
+                        nargs='?',
+                        default='info',
+                        choices=('info', 'verify', 'prune'),
+                        help='info: show what is cached (default), verify: check cached entries for damage, '
+                             'prune: remove damaged entries and evict the least recently used ones')
+
+    parser.add_argument('-m',
+                        '--max-mb',
+                        action='store',
+                        type=int,
+                        metavar='MB',
+                        help='size to prune each cache section down to (default: PCRA_CACHE_MAX_MB or 2048)')
+
+    args = parser.parse_args(argv)
+
+    from . import cache
+
+    if args.action == 'info':
+        printmsg(f'Cache folder: {cache.cache_root()}')
+        info = cache.cache_info()
+        for section, entries, size in info:
+            print(f'  {section:<12}{entries:>6} entries {size / 1024 / 1024:>10.1f} MB')
+        print(f"  {'total':<12}{sum(i[1] for i in info):>6} entries {sum(i[2] for i in info) / 1024 / 1024:>10.1f} MB")
+
+    elif args.action == 'verify':
+        problems = cache.verify_cache()
+        for section, path, problem in problems:
+            printwarn(f'{section}: {os.path.basename(path)} {problem}')
+        if problems:
+            printerr(f'{len(problems)} damaged or abandoned cache entries, '
+                     f'use "py-create-react-app cache prune" to remove them')
+            sys.exit(1)
+        printmsg('Cache OK')
+
+    else:
+        removed = cache.prune_cache(None if args.max_mb is None else args.max_mb * 1024 * 1024)
+        printmsg(f'Removed {len(removed)} cache entries')
+
+
 def main():
+    if sys.argv[1:2] == ['pack']:
+        pack_main(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ['cache']:
+        cache_main(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(prog='py-create-react-app',
                                      description='Python Create React App: Template-based Python React project scaffolding creator',
-                                     epilog=f'NOTE: Must be run with Python version {PYTHON_VERSION_REQUIRED}',
+                                     epilog=f'NOTE: Must be run with Python version {PYTHON_VERSION_REQUIRED}.  '
+                                            f'Use "py-create-react-app pack" to pack a template folder into a single file '
+                                            f'and "py-create-react-app cache" to manage the build cache.',
                                      formatter_class=WideFormatter,
                                      allow_abbrev=False,
                                      )
     parser.add_argument('folder',
                         metavar='FOLDER_NAME',
                         type=str,
-                        help='name of the project folder (must not already exist)')
+                        help='name of the project folder (must not already exist unless resuming)')
 
     option_group = parser.add_mutually_exclusive_group(required=False)
 
@@ -317,6 +719,11 @@ def main():
                         action='store_true',
                         help='DO NOT install JavaScript libraries')
 
+    parser.add_argument('-off',
+                        '--offline',
+                        action='store_true',
+                        help='install JavaScript and Python libraries without network access')
+
     parser.add_argument('-ng',
                         '--no-git',
                         action='store_true',
@@ -325,21 +732,151 @@ def main():
     parser.add_argument('-t',
                         '--template',
                         action='store',
-                        help='alternate template folder to use')
+                        help=f'alternate template folder or packed template ({ARCHIVE_EXTENSION} file) to use')
 
-    args = parser.parse_args()
+    parser.add_argument('-cm',
+                        '--copy-mode',
+                        action='store',
+                        choices=COPY_MODES,
+                        default='auto',
+                        help='how template files are copied: reflink (copy-on-write) when supported, '
+                             'hardlink binary assets, or plain copy (default: auto)')
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        metavar='N',
+                        help='run independent setup steps in parallel using N jobs')
+
+    parser.add_argument('-p',
+                        '--profile',
+                        action='store',
+                        nargs='?',
+                        const='.',
+                        metavar='DIR',
+                        help='write phase timings and a Chrome trace file to DIR (default: current folder)')
+
+    parser.add_argument('-dr',
+                        '--dry-run',
+                        action='store',
+                        nargs='?',
+                        const='table',
+                        choices=('table', 'json'),
+                        metavar='FORMAT',
+                        help='show what would be done and how long it should take without doing it '
+                             '(FORMAT: table or json, default: table)')
+
+    parser.add_argument('-var',
+                        '--var',
+                        action='append',
+                        dest='variables',
+                        type=_template_variable,
+                        metavar='NAME=VALUE',
+                        help='set a {{pcra:NAME}} template variable (can be used more than once)')
+
+    parser.add_argument('-rs',
+                        '--resume',
+                        action='store_true',
+                        help='finish a project whose creation was interrupted, skipping the steps that already completed')
 
-    if _validate_system(args):
-        project = PCRA(args)
+    cache_group = parser.add_mutually_exclusive_group(required=False)
 
-        if not project.validate_template():
-            printerr(f"Supplied template folder at {project.template_dir} is not valid!")
+    cache_group.add_argument('-nc',
+                             '--no-cache',
+                             action='store_true',
+                             help='DO NOT use or update the local build cache')
+
+    cache_group.add_argument('-rc',
+                             '--refresh-cache',
+                             action='store_true',
+                             help='rebuild cached items instead of reusing them')
+
+    args = parser.parse_args()
+
+    # Always profiled: the step timings of completed runs are what --dry-run estimates are based on
+    owns_profiler = profiler.active() is None
+    active_profiler = profiler.start() if owns_profiler else profiler.active()
+
+    from .api import ProjectOptions
+
+    try:
+        _run(ProjectOptions.from_args(args), args.dry_run)
+    finally:
+        if owns_profiler:
+            profiler.stop()
+        if args.profile is not None:
+            summary_file, trace_file = active_profiler.write(args.profile)
+            printmsg(f'Profile written to {summary_file} (trace events in {trace_file})')
+
+    # Only runs that built something are worth learning from, and --no-cache leaves the cache folder alone
+    summary = active_profiler.summary()
+    if args.dry_run is None and not args.no_cache and summary['steps']:
+        from .planner import record_history
+        record_history(summary)
+
+
+def _dry_run(options, output_format):
+    import contextlib
+    from .planner import History, build_plan, print_plan
+
+    # Messages go to stderr when printing JSON so that stdout can be piped straight into another tool
+    with contextlib.redirect_stdout(sys.stderr if output_format == 'json' else sys.stdout):
+        # The toolchain probes would run git and npm, and nothing gets run in a dry run
+        error = check_system(options, check_tools=False)
+        if error is not None:
+            printerr(error)
             sys.exit()
 
-        project.copy_template()
-        project.make_venv()
-        project.make_npm()
-        project.make_git()
+        project = PCRA(options)
+        try:
+            if not project.validate_template():
+                printerr(f"Supplied template folder at {project.template_dir} is not valid!")
+                sys.exit()
+
+            plan = build_plan(project, History.load(), options.jobs)
+        finally:
+            project.close()
+
+    print_plan(plan, output_format)
+
+
+def _run(options, dry_run=None):
+    from .utils import CommandError
+    from .patchcache import PatchError
+    from .journal import Journal, ResumeError
+    from .render import RenderError
+    from .archive import ArchiveError
+
+    if dry_run is not None:
+        _dry_run(options, dry_run)
+        return
+
+    with profiler.span('validate-system', 'phase'):
+        system_ok = _validate_system(options)
+
+    if system_ok:
+        project = PCRA(options)
+
+        try:
+            with profiler.span('validate-template', 'phase'):
+                template_ok = project.validate_template()
+            if not template_ok:
+                printerr(f"Supplied template folder at {project.template_dir} is not valid!")
+                sys.exit()
+
+            try:
+                project.bootstrap(options.jobs)
+            except (CommandError, ArchiveError, PatchError, ResumeError, RenderError, OSError) as e:
+                printerr(e)
+                printerr(f"Project creation in {project.project_dir} did not complete!")
+                if not isinstance(e, ResumeError) and Journal.exists(project.project_dir):
+                    printerr("Run the same command again with --resume to continue from where it stopped")
+                sys.exit(1)
+        finally:
+            project.close()
+
         project.print_instructions()
     else:
         sys.exit()
@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import shlex
+import statistics
+
+from . import cache
+from .utils import colors
+
+HISTORY_FILE = 'history.json'
+HISTORY_SAMPLES = 20  # Most recent durations kept for each step
+
+is_windows = os.name == 'nt'
+
+
+def _history_file():
+    return os.path.join(cache.cache_dir('history', create=False), HISTORY_FILE)
+
+
+def step_key(name, args):
+    # Cache hits and misses of the same step take very different amounts of time, so they're tracked apart
+    outcome = args.get('cache') or args.get('method')
+    return f'{name}:{outcome}' if outcome else name
+
+
+class History:
+    """Durations of the steps of earlier runs, used to estimate how long a plan will take"""
+
+    def __init__(self, samples=None):
+        self.samples = samples or {}
+
+    @classmethod
+    def load(cls):
+        try:
+            with open(_history_file(), 'r') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return cls()
+
+    def add(self, key, seconds):
+        values = self.samples.setdefault(key, [])
+        values.append(round(seconds, 6))
+        del values[:-HISTORY_SAMPLES]
+
+    def record(self, summary):
+        """Add the steps from a Profiler summary of a completed run"""
+        for step in summary.get('steps', []):
+            wall = step['wall']
+            if 'files' in step:
+                # Copy time grows with the size of the template, so it's kept per file
+                if not step['files']:
+                    continue
+                wall /= step['files']
+            self.add(step_key(step['name'], step), wall)
+
+    def estimate(self, key, units=1):
+        values = self.samples.get(key)
+        if not values:
+            return None
+        return statistics.median(values) * units
+
+    def save(self):
+        path = _history_file()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = cache.tmp_path(path)
+        with open(tmp_file, 'w') as f:
+            f.write(json.dumps(self.samples, indent=2))
+        os.replace(tmp_file, path)
+
+
+def record_history(summary):
+    # Runs finishing at the same time would otherwise drop each other's samples
+    try:
+        with cache.KeyLocks('history')(HISTORY_FILE):
+            history = History.load()
+            history.record(summary)
+            history.save()
+    except OSError:
+        pass
+
+
+class PlanStep:
+    def __init__(self, phase, action, key=None, units=1, cache_result=None, commands=None, operations=None):
+        self.phase = phase
+        self.action = action
+        self.key = key
+        self.units = units
+        self.cache = cache_result
+        self.commands = commands or []
+        self.operations = operations or []
+        self.estimate = None
+
+    def to_dict(self):
+        return {'phase': self.phase, 'action': self.action, 'cache': self.cache,
+                'estimate': None if self.estimate is None else round(self.estimate, 3),
+                'commands': self.commands, 'operations': self.operations}
+
+
+class Plan:
+    def __init__(self, project_dir, jobs, steps):
+        self.project_dir = project_dir
+        self.jobs = jobs
+        self.steps = steps
+
+    @property
+    def unestimated(self):
+        return [step for step in self.steps if step.key is not None and step.estimate is None]
+
+    def total(self):
+        phases = {}
+        for step in self.steps:
+            phases[step.phase] = phases.get(step.phase, 0.0) + (step.estimate or 0.0)
+        if self.jobs <= 1:
+            return sum(phases.values())
+
+        # Same dependencies as PCRA.bootstrap: the venvs wait for the wheelhouse, npm only for the copy
+        venvs = phases.get('wheelhouse', 0.0) + max(phases.get('client-venv', 0.0), phases.get('server-venv', 0.0))
+        return phases.get('copy', 0.0) + max(venvs, phases.get('npm', 0.0)) + phases.get('git', 0.0)
+
+    def to_dict(self):
+        return {'project_dir': self.project_dir, 'jobs': self.jobs,
+                'estimated_total': round(self.total(), 3),
+                'steps_without_history': len(self.unestimated),
+                'steps': [step.to_dict() for step in self.steps]}
+
+    def print(self):
+        Fore, Style = colors()
+        print(f'{Fore.CYAN}Plan for {self.project_dir} ({self.jobs} job{"s" if self.jobs != 1 else ""}){Style.RESET_ALL}')
+        print(f"{'PHASE':<13}{'STEP':<58}{'CACHE':<7}{'ESTIMATE':>9}")
+        for step in self.steps:
+            estimate = '' if step.estimate is None else _format_seconds(step.estimate)
+            if step.key is not None and step.estimate is None:
+                estimate = '?'
+            print(f"{step.phase:<13}{step.action:<58}{step.cache or '':<7}{estimate:>9}")
+            for command in step.commands:
+                print(f"{'':<13}$ {' '.join(shlex.quote(str(arg)) for arg in command)}")
+
+        unestimated = len(self.unestimated)
+        note = f' ({unestimated} step{"s" if unestimated != 1 else ""} with no history yet)' if unestimated else ''
+        print(f'{Fore.CYAN}Estimated total: {_format_seconds(self.total())}{note}{Style.RESET_ALL}')
+
+
+def _format_seconds(seconds):
+    return f'{seconds * 1000:.0f}ms' if seconds < 1 else f'{seconds:.1f}s'
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024 or unit == 'MB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def _copy_operation(entry, destination):
+    return {'op': 'copy' if entry.archive is None else 'extract', 'layer': entry.layer,
+            'source': entry.source if entry.archive is None else f'{entry.archive.path}:{entry.path}',
+            'destination': destination, 'size': entry.size}
+
+
+def _template_source(project, source_file, fallback_file, target_dir):
+    # (entry, operations): files missing from the template are copied from the default one when they're needed
+    if project.manifest.is_file(source_file):
+        return project.manifest.resolve(source_file), []
+    entry = project.manifest.fallback(fallback_file)
+    return entry, [_copy_operation(entry, os.path.join(target_dir, os.path.basename(fallback_file)))]
+
+
+def _copy_steps(project):
+    dirs, pairs = project.copy_plan()
+    steps = [PlanStep('copy', f'create {len(dirs)} folders', operations=[{'op': 'mkdir', 'path': d} for d in dirs])]
+
+    layers = {}
+    for entry, destination in pairs:
+        layers.setdefault(entry.layer, []).append((entry, destination))
+    for layer, layer_pairs in layers.items():
+        size = sum(entry.size for entry, _ in layer_pairs)
+        name = 'template' if layer == 'template' else 'default template'
+        steps.append(PlanStep('copy', f'copy {len(layer_pairs)} files ({_format_size(size)}) from the {name}',
+                              key='copy', units=len(layer_pairs),
+                              operations=[_copy_operation(entry, destination) for entry, destination in layer_pairs]))
+    return steps
+
+
+def _venv_steps(project):
+    from .venvcache import VenvCache
+    from .wheelhouse import Wheelhouse, WHEELHOUSE_FOLDER, wheel_command
+
+    targets = [('client-venv', project.client_dir, f'{project.client_source_dir}/requirements.txt',
+                'client/requirements.txt')]
+    if project.has_server:
+        server_dir = os.path.join(project.project_dir, 'server')
+        targets.append(('server-venv', server_dir, 'server/requirements.txt', 'server/requirements.txt'))
+
+    steps = []
+    missing = []
+    for phase, target_dir, source_file, fallback_file in targets:
+        entry, operations = _template_source(project, source_file, fallback_file, target_dir)
+        requirements = entry.read_bytes()
+        if project.venv_cache.has_key(VenvCache.key_for(requirements)):
+            steps.append(PlanStep(phase, 'restore virtual environment from cache', key='venv:hit',
+                                  cache_result='hit', operations=operations))
+            continue
+
+        missing.append((target_dir, requirements))
+        pip = os.path.join('.', 'venv', 'Scripts' if is_windows else 'bin', 'pip')
+        steps.append(PlanStep(phase, 'create virtual environment and install requirements', key='venv:miss',
+                              cache_result='miss' if project.venv_cache.enabled else None,
+                              commands=[[pip, 'install'] + project.wheelhouse.planned_install_args()
+                                        + ['-r', 'requirements.txt']],
+                              operations=operations))
+
+    if missing and project.wheelhouse.enabled:
+        wheelhouse = project.wheelhouse
+        resolved = all(wheelhouse.is_resolved(Wheelhouse.key_for(requirements.decode())) for _, requirements in missing)
+        _, bundled = project.manifest.subtree(WHEELHOUSE_FOLDER)
+        wheel_dir = cache.cache_dir(WHEELHOUSE_FOLDER, create=False)
+        commands = [] if resolved else [wheel_command([os.path.join(target_dir, 'requirements.txt')
+                                                       for target_dir, _ in missing],
+                                                      wheel_dir, find_links=wheel_dir,
+                                                      no_index=wheelhouse.offline or bool(bundled))]
+        action = 'wheels already fetched' if resolved else 'fetch wheels for all requirements'
+        if bundled:
+            action += f' ({len(bundled)} bundled)'
+        steps.insert(0, PlanStep('wheelhouse', action, key=f"wheelhouse:{'hit' if resolved else 'miss'}",
+                                 cache_result='hit' if resolved else 'miss', commands=commands))
+    return steps
+
+
+def _npm_steps(project):
+    source_file = f'{project.client_source_dir}/package.json'
+    package_entry, operations = _template_source(project, source_file, 'client/package.json', project.client_dir)
+    lock_file = f'{project.client_source_dir}/package-lock.json'
+    lock_data = json.loads(project.manifest.resolve(lock_file).read_bytes()) if project.manifest.is_file(lock_file) else None
+
+    result, command = project.npm_cache.plan(json.loads(package_entry.read_bytes()), lock_data)
+    action = 'restore node_modules from cache' if command is None else f'install JavaScript dependencies ({command[1]})'
+    steps = [PlanStep('npm', action, key=f"npm:{result or 'miss'}", cache_result=result,
+                      commands=[command] if command else [], operations=operations)]
+
+    patch_name = 'asset.js.win.patch' if is_windows else 'asset.js.patch'
+    result = project.patch_cache.plan(project.manifest.resolve(patch_name).read_bytes())
+    action = 'restore patched Transcrypt Parcel Plugin' if result == 'hit' else 'patch Transcrypt Parcel Plugin'
+    steps.append(PlanStep('npm', action, key=f"patch:{result or 'miss'}", cache_result=result))
+    return steps
+
+
+def _git_steps(project):
+    action = 'initial commit' + (', version bump commit and tag' if project.has_npm else '')
+    return [PlanStep('git', action, key='git:fast-import',
+                     commands=[['git', 'init'], ['git', 'var', '-l'], ['git', 'fast-import', '--quiet'],
+                               ['git', 'reset', '-q']])]
+
+
+def build_plan(project, history, jobs=1):
+    """Everything bootstrap() would do for the project, worked out from the template and the caches alone"""
+    steps = _copy_steps(project)
+    if project.has_venv:
+        steps.extend(_venv_steps(project))
+    if project.has_npm:
+        steps.extend(_npm_steps(project))
+    if project.has_git:
+        steps.extend(_git_steps(project))
+
+    for step in steps:
+        if step.key is not None:
+            step.estimate = history.estimate(step.key, step.units)
+    return Plan(project.project_dir, jobs, steps)
+
+
+def print_plan(plan, output_format='table'):
+    if output_format == 'json':
+        sys.stdout.write(json.dumps(plan.to_dict(), indent=2) + '\n')
+    else:
+        plan.print()
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+_active = None
+
+
+def _children_time():
+    # Only counts children that have been waited on, and is shared by every thread in the process
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class Span:
+    def __init__(self, name, category, start, wall, cpu, children, thread_id, args):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.wall = wall
+        self.cpu = cpu
+        self.children = children
+        self.thread_id = thread_id
+        self.args = args
+
+    def to_dict(self):
+        return dict(name=self.name, category=self.category, start=round(self.start, 6), wall=round(self.wall, 6),
+                    cpu=round(self.cpu, 6), children=round(self.children, 6), **self.args)
+
+
+class Profiler:
+    """Records wall, CPU and child process time for scaffolding phases and commands"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, category, **args):
+        # The args dict is yielded so the code being timed can add to it, e.g. whether it was a cache hit
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        children_start = _children_time()
+        try:
+            yield args
+        finally:
+            span = Span(name, category,
+                        start=start - self.origin,
+                        wall=time.perf_counter() - start,
+                        cpu=time.thread_time() - cpu_start,
+                        children=_children_time() - children_start,
+                        thread_id=threading.get_ident(),
+                        args=args)
+            with self._lock:
+                self.spans.append(span)
+
+    def summary(self):
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            'total': round(time.perf_counter() - self.origin, 6),
+            'phases': [s.to_dict() for s in spans if s.category == 'phase'],
+            'commands': [s.to_dict() for s in spans if s.category == 'cmd'],
+            'steps': [s.to_dict() for s in spans if s.category == 'step'],
+        }
+
+    def trace_events(self):
+        # Chrome trace-event format: complete ('X') events with microsecond timestamps
+        pid = os.getpid()
+        thread_ids = {}
+        events = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            tid = thread_ids.setdefault(span.thread_id, len(thread_ids) + 1)
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round(span.start * 1e6),
+                'dur': round(span.wall * 1e6),
+                'pid': pid,
+                'tid': tid,
+                'args': dict(cpu=span.cpu, children=span.children, **span.args),
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, output_dir):
+        import json
+
+        os.makedirs(output_dir, exist_ok=True)
+        summary_file = os.path.join(output_dir, 'pcra-profile.json')
+        trace_file = os.path.join(output_dir, 'pcra-trace.json')
+        with open(summary_file, 'w') as f:
+            f.write(json.dumps(self.summary(), indent=2))
+        with open(trace_file, 'w') as f:
+            f.write(json.dumps(self.trace_events()))
+        return summary_file, trace_file
+
+
+def start():
+    global _active
+    _active = Profiler()
+    return _active
+
+
+def stop():
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+def span(name, category, **args):
+    if _active is None:
+        return nullcontext(args)
+    return _active.span(name, category, **args)
+
+
+def active():
+    return _active
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import shutil
+import threading
+
+from . import cache
+
+# Double braces alone show up in the template's Python dict literals, so placeholders are namespaced
+PLACEHOLDER = re.compile(r'\{\{pcra:([A-Za-z_][A-Za-z0-9_]*)\}\}')
+PLACEHOLDER_START = b'{{pcra:'
+
+# Only these are ever opened to look for placeholders, anything else (images, fonts...) goes straight to the copy engine
+TEXT_EXTENSIONS = {'.py', '.html', '.htm', '.md', '.txt', '.json', '.js', '.jsx', '.css', '.cfg', '.ini', '.toml',
+                   '.yml', '.yaml'}
+
+RENDER_VERSION = 2
+
+
+class RenderError(Exception):
+    pass
+
+
+def is_text(path):
+    return os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS
+
+
+def compile_template(data, name=''):
+    """[text, variable, text, variable, ..., text] for a file with placeholders, or None if it has none"""
+    if PLACEHOLDER_START not in data:
+        return None
+    try:
+        return PLACEHOLDER.split(data.decode('utf-8'))
+    except UnicodeDecodeError:
+        raise RenderError(f'{name} has template placeholders but is not UTF-8')
+
+
+def _escape(value, file_name):
+    # Values end up inside string literals or markup, so they're escaped for the kind of file they go into
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext == '.json':
+        return json.dumps(value)[1:-1]
+    if ext in ('.py', '.js', '.jsx'):
+        return json.dumps(value)[1:-1].replace("'", "\\'")
+    if ext in ('.html', '.htm'):
+        import html
+        return html.escape(value)
+    return value
+
+
+def current_signature(entry):
+    # The manifest may come from its cache, so loose files are checked again here before a cached compile is trusted
+    if entry.source is None:
+        return entry.signature
+    st = os.stat(entry.source)
+    return f'{st.st_size}:{st.st_mtime_ns}'
+
+
+def render(parts, variables, name=''):
+    output = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            output.append(part)
+        elif part in variables:
+            output.append(_escape(variables[part], name))
+        else:
+            raise RenderError(f"{name} uses the undefined template variable '{part}'")
+    return ''.join(output).encode('utf-8')
+
+
+class TemplateRenderer:
+    """Fills in template placeholders while the template is copied
+
+    Which files have placeholders (and their compiled form) is cached per template fingerprint, so files without
+    any are left to the copy engine and files with them are rendered without reading the source at all.
+    """
+
+    def __init__(self, variables, use_cache=True):
+        self.variables = variables
+        self.use_cache = use_cache
+        self.rendered = 0
+        self._compiled = None  # {'layer:path': {'signature': ..., 'parts': parts or None}}
+        self._cache_file = None
+        self._lock = threading.Lock()
+
+    def _load(self, manifest):
+        if self._compiled is not None:
+            return
+        self._compiled = {}
+        if not self.use_cache:
+            return
+
+        signatures = sorted(f'{layer.name}:{path}:{entry.signature}' for layer in manifest.layers
+                            for path, entry in layer.files.items() if is_text(path))
+        self._cache_file = os.path.join(cache.cache_dir('render'), cache.hash_key(*signatures) + '.json')
+        try:
+            with open(self._cache_file, 'r') as f:
+                data = json.load(f)
+            if data['version'] == RENDER_VERSION:
+                self._compiled = data['files']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        if self._cache_file is None:
+            return
+        tmp_file = cache.tmp_path(self._cache_file)
+        try:
+            with open(tmp_file, 'w') as f:
+                f.write(json.dumps({'version': RENDER_VERSION, 'files': self._compiled}))
+            os.replace(tmp_file, self._cache_file)
+        except OSError:
+            pass
+
+    def write(self, manifest, pairs, transforms=None, stats=None):
+        """Render the (entry, destination) pairs that need it and return the rest for a plain copy
+
+        transforms maps destination files to a function applied to their contents before they're written.
+        """
+        transforms = transforms or {}
+        remaining = []
+        with self._lock:
+            self._load(manifest)
+            changed = False
+            for entry, destination in pairs:
+                transform = transforms.get(destination)
+                if transform is None and not is_text(entry.path):
+                    remaining.append((entry, destination))
+                    continue
+
+                key = f'{entry.layer}:{entry.path}'
+                signature = current_signature(entry)
+                cached = self._compiled.get(key)
+                if cached is not None and cached['signature'] == signature:
+                    parts = cached['parts']
+                    if parts is None and transform is None:
+                        remaining.append((entry, destination))
+                        continue
+                    data = entry.read_bytes() if parts is None else render(parts, self.variables, entry.path)
+                else:
+                    # Never read the same file twice: whatever was read to look for placeholders gets written out
+                    data = entry.read_bytes()
+                    parts = compile_template(data, entry.path)
+                    self._compiled[key] = {'signature': signature, 'parts': parts}
+                    changed = True
+                    if parts is not None:
+                        data = render(parts, self.variables, entry.path)
+
+                if transform is not None:
+                    data = transform(data)
+                with open(destination, 'wb') as f:
+                    f.write(data)
+                if entry.source is not None:
+                    shutil.copymode(entry.source, destination)
+                if parts is not None:
+                    self.rendered += 1
+                if stats is not None:
+                    stats.add(len(data), 'render')
+
+            if changed:
+                self._save()
+        return remaining
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .utils import set_output_prefix, get_output_prefix
+from . import profiler
+
+
+class Task:
+    def __init__(self, name, func, depends=()):
+        self.name = name
+        self.func = func
+        self.depends = tuple(depends)
+
+
+class TaskScheduler:
+    """Runs setup phases in dependency order, with up to `jobs` of them in flight at once"""
+
+    def __init__(self, jobs=1):
+        self.jobs = max(1, jobs)
+        self.tasks = {}
+
+    def add(self, name, func, depends=()):
+        for dep in depends:
+            if dep not in self.tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+        self.tasks[name] = Task(name, func, depends)
+
+    def run(self):
+        if self.jobs == 1:
+            # Tasks are added in a valid order, so just run them one after the other
+            for task in self.tasks.values():
+                with profiler.span(task.name, 'phase'):
+                    task.func()
+            return
+
+        parent_prefix = get_output_prefix()
+        pending = dict(self.tasks)
+        done = set()
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                if error is None:
+                    for task in list(pending.values()):
+                        if len(running) >= self.jobs:
+                            break
+                        if all(dep in done for dep in task.depends):
+                            del pending[task.name]
+                            running[executor.submit(self._run_task, task, parent_prefix)] = task
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(task.name)
+                    except Exception as e:
+                        # Let in-flight tasks finish but don't start anything new
+                        if error is None:
+                            error = e
+                        pending.clear()
+
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def _run_task(task, parent_prefix=None):
+        set_output_prefix(task.name if parent_prefix is None else f'{parent_prefix}:{task.name}')
+        try:
+            with profiler.span(task.name, 'phase'):
+                task.func()
+        finally:
+            set_output_prefix(None)
@@ -4,6 +4,6 @@ from common import require
 
 
 applogo = require("../static/app_logo.png")
-appname = "Python Create React App"
+appname = "{{pcra:app_title}}"
 
 gaid = 'UA-100000000-1'
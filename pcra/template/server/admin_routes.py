@@ -1,8 +1,10 @@
 from flask import jsonify, request, Response, session, Blueprint
-from werkzeug.security import check_password_hash, generate_password_hash
 import flask_login
 import logging
 
+import sessions
+import users
+
 log = logging.getLogger(__name__)
 
 admin_api = Blueprint('admin_api', __name__, url_prefix='/api')
@@ -20,7 +22,14 @@ def login():
     username = record.pop('username', "")
     username = username.lower()
 
-    if validateLogin(username, pwd):
+    try:
+        valid = validateLogin(username, pwd)
+    except users.Busy:
+        log.warning(f"Too many logins waiting, turned away '{username}'")
+        return Response("BUSY", 503, {'Retry-After': '1'})
+
+    if valid:
+        sessions.regenerate(session)
         flask_login.login_user(User(username))
         session.permanent = True
         return jsonify({"OK": 200})
@@ -31,9 +40,7 @@ def login():
 
 
 def validateLogin(user, pwd):
-    # TODO: Use db.Users table for user validation
-    SECRET_PASSWORD = generate_password_hash('123')
-    return user == 'admin' and check_password_hash(SECRET_PASSWORD, pwd)
+    return users.verify_password(users.get_store(), user, pwd)
 
 
 @admin_api.route('/logout', methods=['GET'])
@@ -0,0 +1,131 @@
+"""Logging for the app server that stays out of the way of requests
+
+Log records are put on a queue and a background thread formats and writes them, so a request thread never waits
+on stderr.  If the queue fills up, records below WARNING are dropped (and counted) rather than slowing requests down.
+
+Every request is logged when it finishes, with its status and how long it took, but only for a sample of the
+requests: sample_rates gives the fraction to log for each status class, and for URL rules that need a different
+rate than their status class:
+
+    {'status': {'2xx': 0.1, '3xx': 0.1, '4xx': 1.0}, 'routes': {'/api/ping': 0.01}}
+
+Anything not listed is always logged, and so are 5xx responses and every WARNING or ERROR record, whatever the
+rates say.  With json_lines=True each record is written as a JSON object on a line of its own.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import request, g
+
+TEXT_FORMAT = "[%(asctime)s]|%(levelname)s|[%(module)s]:%(funcName)s()|%(message)s"
+QUEUE_SIZE = 10000
+
+access_log = logging.getLogger('access')
+
+_listener = None
+_pid = None
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'http', {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting is left to the writer thread, only a traceback has to be turned into text while it exists
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # The queue itself has no limit, so warnings and errors still go on it when it is full
+        if record.levelno < logging.WARNING and self.queue.qsize() >= QUEUE_SIZE:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.queue.put(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"{dropped} log records were dropped because the log queue was full"}))
+        self.queue.put(record)
+
+
+def setup(level=logging.INFO, json_lines=False):
+    """Send the log records of this process through the queue to stderr, once per process"""
+    global _listener, _pid
+    if _pid == os.getpid():
+        return
+
+    root = logging.getLogger()
+    # A forked worker inherits the handler of its parent, but not the thread that was writing for it
+    for handler in root.handlers[:]:
+        if isinstance(handler, _QueueHandler):
+            root.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JSONFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()  # Much cheaper to put on than queue.Queue, and bounded by enqueue() instead
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    _pid = os.getpid()
+    atexit.register(_listener.stop)  # Writes out what is left on the queue
+
+
+def _sample_rate(sample_rates, rule, status):
+    if status >= 500:
+        return 1.0
+    routes = sample_rates.get('routes', {})
+    if rule is not None and rule.rule in routes:
+        return routes[rule.rule]
+    return sample_rates.get('status', {}).get(f'{status // 100}xx', 1.0)
+
+
+def init_app(app, sample_rates=None):
+    """Log the requests that app handles, sampled by sample_rates"""
+    sample_rates = sample_rates or {}
+
+    def start_timer():
+        g.log_start = time.perf_counter()
+
+    def log_request(response):
+        rate = _sample_rate(sample_rates, request.url_rule, response.status_code)
+        if rate >= 1.0 or random.random() < rate:
+            start = g.get('log_start')
+            duration_ms = None if start is None else (time.perf_counter() - start) * 1000
+            http = {'method': request.method, 'path': request.full_path, 'status': response.status_code,
+                    'duration_ms': duration_ms and round(duration_ms, 2)}
+            level = logging.ERROR if response.status_code >= 500 else logging.INFO
+            access_log.log(level, "[%s] %s %s %.1f ms", request.method, request.full_path, response.status_code,
+                           duration_ms or 0.0, extra={'http': http})
+        return response
+
+    # Registered first so that the timer includes the other hooks
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+    app.after_request(log_request)
@@ -1,72 +1,57 @@
-from flask import Flask, jsonify, request, Response, session
+from flask import Flask, jsonify, request, Response, session, current_app
 import flask_login
 import logging
 import os
 from datetime import timedelta
 
-# import dbutils as db
+import applog
+import sessions
+import static_assets
+import users
+import dbutils as db
 from admin_routes import admin_api, User
-# from db_routes import db_api
+from db_routes import db_api
 
 
-fmt = "[%(asctime)s]|%(levelname)s|[%(module)s]:%(funcName)s()|%(message)s"
-logging.basicConfig(format=fmt)
 log = logging.getLogger()
-log.setLevel(logging.INFO)
 
 SERVE_SPA = True
 SPA_DIR = '../client/dist/prod'
 SESSION_TIMEOUT = 60
-
-app = Flask(__name__, static_folder=SPA_DIR, static_url_path='/')
-app.register_blueprint(admin_api)
-# app.register_blueprint(db_api)
+SESSION_RENEW_AFTER = 0.25  # Fraction of SESSION_TIMEOUT after which a request renews the session
+SESSION_STORE = os.environ.get('APPSERVER_SESSION_STORE', 'sqlite')  # sqlite, memory or cookie (see sessions.py)
+LOG_JSON = os.environ.get('APPSERVER_LOG_FORMAT') == 'json'  # One JSON object per line instead of text
+LOG_SAMPLE_RATES = {  # Fractions of the requests to log (see applog.py), 5xx responses are always logged
+    'status': {'2xx': 1.0, '3xx': 1.0, '4xx': 1.0},
+    'routes': {},  # For example {'/api/ping': 0.01}
+}
 
 login_manager = flask_login.LoginManager()
-login_manager.init_app(app)
-
-app.config.update(
-    SECRET_KEY=os.urandom(16),
-    SESSION_COOKIE_HTTPONLY=True,
-    SESSION_COOKIE_SAMESITE='Lax',
-)
-
-app.permanent_session_lifetime = timedelta(minutes=SESSION_TIMEOUT)
-
-# Create the database if it doesn't exist
-# db.connect()
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User(user_id)
+    # Cached, since this runs on every request from a logged in user
+    return User(user_id) if users.get_store().get(user_id) else None
 
 
 @login_manager.unauthorized_handler
 def unauthorized_callback():
-    log.warning(f"UNAUTHORIZED [{request.method}] {request.full_path}")
+    # The request log has the 401
     return Response("UNAUTHORIZED", 401)
 
 
-@app.errorhandler(404)
 def request_not_found(err):
-    if SERVE_SPA:
-        return app.send_static_file('index.html')
-    else:
-        return jsonify({'error': str(err)})
+    return jsonify({'error': str(err)}), 404
 
 
-@app.before_request
-def request_log():
-    log.info(f"[{request.method}] {request.full_path}")
-
-
-@app.before_request
-def refresh_session():
-    session.modified = True
+def refresh_session(response):
+    # Sliding expiry for logged in users, without saving the session on every request
+    if flask_login.current_user.is_authenticated:
+        sessions.renew(session, current_app.permanent_session_lifetime, current_app.config['SESSION_RENEW_AFTER'])
+    return response
 
 
-@app.after_request
 def apply_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     if request.blueprint == 'db_api':
@@ -74,10 +59,71 @@ def apply_headers(response):
     return response
 
 
-@app.route('/api/', methods=['GET'])
+@sessions.exempt
 def index():
     return Response("OK", 200)
 
 
+def create_app():
+    """Application factory, called once in every server process"""
+    applog.setup(json_lines=LOG_JSON)
+    app = Flask(__name__, static_folder=None)
+    app.register_blueprint(admin_api)
+    app.register_blueprint(db_api)
+
+    login_manager.init_app(app)
+    users.init_app(app)
+
+    # Every worker (and every restart) has to use the same key or sessions stop being valid
+    key_file = os.environ.get('APPSERVER_SECRET_KEY_FILE') or os.path.join(app.instance_path, 'secret_key')
+    app.config.update(
+        SECRET_KEY=sessions.load_secret_key(key_file),
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SAMESITE='Lax',
+        SESSION_RENEW_AFTER=SESSION_RENEW_AFTER,
+    )
+
+    app.permanent_session_lifetime = timedelta(minutes=SESSION_TIMEOUT)
+    sessions.init_app(app, SESSION_STORE)
+
+    app.register_error_handler(404, request_not_found)
+    applog.init_app(app, LOG_SAMPLE_RATES)
+    app.after_request(refresh_session)
+    app.after_request(apply_headers)
+    app.add_url_rule('/api/', 'index', index, methods=['GET'])
+    if SERVE_SPA:
+        static_assets.init_app(app, SPA_DIR)
+        sessions.exempt(app.view_functions['spa'])
+
+    # Create the database if it doesn't exist
+    db.connect()
+
+    return app
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m appserver')
+    parser.add_argument('--prod', action='store_true',
+                        help='serve with the multi-worker production server instead of the Flask development server')
+    parser.add_argument('--workers', type=int, help='worker processes (production server only)')
+    parser.add_argument('--threads', type=int, help='threads per worker (production server only)')
+    parser.add_argument('--max-requests', type=int,
+                        help='replace a worker after it has handled this many requests (production server only)')
+    parser.add_argument('--bind', help='host:port to listen on (production server only)')
+    args = parser.parse_args()
+
+    if SERVE_SPA:
+        # Compress any new build once, before the workers start
+        static_assets.precompress(os.path.join(os.path.dirname(os.path.abspath(__file__)), SPA_DIR))
+
+    if args.prod:
+        import prodserver
+        prodserver.run(workers=args.workers, threads=args.threads, max_requests=args.max_requests, bind=args.bind)
+    else:
+        create_app().run(debug=True, port=8000)
+
+
 if __name__ == "__main__":
-    app.run(debug=True, port=8000)
+    main()
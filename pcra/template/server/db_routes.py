@@ -0,0 +1,73 @@
+from flask import jsonify, request, Response, Blueprint
+import flask_login
+import logging
+import sqlite3
+
+import dbutils as db
+
+log = logging.getLogger(__name__)
+
+db_api = Blueprint('db_api', __name__, url_prefix='/api/db')
+
+
+@db_api.before_request
+@flask_login.login_required
+def require_login():
+    pass
+
+
+def _check_table(table):
+    if table not in db.SCHEMA:
+        return Response(f"NO TABLE '{table}'", 404)
+    return None
+
+
+@db_api.route('/<table>', methods=['GET'])
+def getRows(table):
+    # Keyset pagination: ?after=<last id of the previous page>&limit=<rows>
+    error = _check_table(table)
+    if error:
+        return error
+    rows, next_after = db.page(table, request.args.get('after', 0, type=int), request.args.get('limit', 50, type=int))
+    return jsonify({'success': {'rows': rows, 'next': next_after}})
+
+
+@db_api.route('/<table>/<int:row_id>', methods=['GET'])
+def getRow(table, row_id):
+    error = _check_table(table)
+    if error:
+        return error
+    row = db.get(table, row_id)
+    if row is None:
+        return Response("NOT FOUND", 404)
+    return jsonify({'success': row})
+
+
+@db_api.route('/<table>', methods=['POST'])
+def addRows(table):
+    # A single record, or a list of them which is inserted in one transaction
+    error = _check_table(table)
+    if error:
+        return error
+    record = request.get_json()
+    records = record if isinstance(record, list) else [record]
+    for item in records:
+        if not isinstance(item, dict) or not set(item) <= set(db.COLUMNS[table]):
+            return Response(f"BAD RECORD (columns: {', '.join(db.COLUMNS[table])})", 400)
+
+    try:
+        if isinstance(record, list):
+            return jsonify({'success': {'count': db.insert_many(table, records)}})
+        return jsonify({'success': {'id': db.insert(table, record)}})
+    except sqlite3.IntegrityError as e:
+        return Response(f"BAD RECORD ({e})", 400)
+
+
+@db_api.route('/<table>/<int:row_id>', methods=['DELETE'])
+def deleteRow(table, row_id):
+    error = _check_table(table)
+    if error:
+        return error
+    if not db.delete(table, row_id):
+        return Response("NOT FOUND", 404)
+    return jsonify({"OK": 200})
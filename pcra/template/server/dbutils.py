@@ -0,0 +1,174 @@
+"""SQLite data layer for the app server
+
+Each thread gets its own connection from the pool, opened the first time it needs one and kept for as long as
+the thread runs, in WAL mode so that readers don't block the writer (or each other) across all of the worker
+processes.  Connections keep up to STATEMENT_CACHE prepared statements, and the SQL for the tables in SCHEMA is
+only built once, so the same statement text (and its compiled statement) is used every time.
+
+The database is instance/app.db, or the file named by APPSERVER_DB.  Add tables to SCHEMA along with the columns
+that the API can write to in COLUMNS.
+"""
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+STATEMENT_CACHE = 256  # Prepared statements kept by each connection
+BATCH_SIZE = 500  # Rows per executemany() call when inserting many rows
+MAX_PAGE = 500
+
+SCHEMA = {
+    'items': 'CREATE TABLE IF NOT EXISTS items '
+             '(id INTEGER PRIMARY KEY, name TEXT NOT NULL, value TEXT, created REAL NOT NULL)',
+}
+COLUMNS = {
+    'items': ['name', 'value'],
+}
+
+_pool = None
+_statements = {}
+_inherited = []
+
+
+class ConnectionPool:
+    """One connection to db_file for each thread that uses it"""
+
+    def __init__(self, db_file, statement_cache=STATEMENT_CACHE):
+        self.db_file = db_file
+        self.statement_cache = statement_cache
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._connections = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+
+    def connection(self):
+        if self._pid != os.getpid():
+            # A connection can't be shared with a forked process, so a child starts with none.  The ones it
+            # inherited are kept from being closed, which could remove the WAL files that the parent is using
+            _inherited.extend(self._connections)
+            self._local = threading.local()
+            self._pid = os.getpid()
+            self._connections = []
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # close() can be called from any thread, but each connection is only ever used by its own
+            conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.statement_cache)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # Still safe with WAL, but no sync on every commit
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+@contextmanager
+def transaction(conn=None):
+    """Run the statements in the with block as one transaction, taking the write lock up front"""
+    conn = conn or connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def default_db_file():
+    instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+    return os.environ.get('APPSERVER_DB') or os.path.join(instance_path, 'app.db')
+
+
+def connect(db_file=None):
+    """Open the database (creating the tables that don't exist) for this process"""
+    global _pool
+    db_file = db_file or default_db_file()
+    if _pool is not None and _pool.db_file == db_file:
+        return _pool
+    _pool = ConnectionPool(db_file)
+    with transaction(_pool.connection()) as conn:
+        for create_table in SCHEMA.values():
+            conn.execute(create_table)
+    return _pool
+
+
+def connection():
+    if _pool is None:
+        connect()
+    return _pool.connection()
+
+
+def close():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def _sql(table, statement):
+    # Table and column names can't be parameters, so the statements are built (once) from SCHEMA and COLUMNS
+    if table not in SCHEMA:
+        raise KeyError(table)
+    key = (table, statement)
+    sql = _statements.get(key)
+    if sql is None:
+        columns = COLUMNS[table]
+        sql = {
+            'get': f'SELECT * FROM {table} WHERE id = ?',
+            'page': f'SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?',
+            'insert': f"INSERT INTO {table} ({', '.join(columns)}, created) "
+                      f"VALUES ({', '.join('?' for _ in columns)}, ?)",
+            'delete': f'DELETE FROM {table} WHERE id = ?',
+        }[statement]
+        _statements[key] = sql
+    return sql
+
+
+def get(table, row_id):
+    row = connection().execute(_sql(table, 'get'), (row_id,)).fetchone()
+    return None if row is None else dict(row)
+
+
+def page(table, after=0, limit=50):
+    """Up to limit rows with ids after the given one, and the id to pass as after for the next page (or None)
+
+    Keyset pagination: every page is an index range scan, however far into the table it is.
+    """
+    limit = max(1, min(limit, MAX_PAGE))
+    rows = [dict(row) for row in connection().execute(_sql(table, 'page'), (after, limit))]
+    return rows, (rows[-1]['id'] if len(rows) == limit else None)
+
+
+def insert(table, record):
+    columns = COLUMNS[table]
+    cursor = connection().execute(_sql(table, 'insert'), [record.get(c) for c in columns] + [time.time()])
+    return cursor.lastrowid
+
+
+def insert_many(table, records, batch_size=BATCH_SIZE):
+    """Insert the records in one transaction, in batches of batch_size rows, returns how many were inserted"""
+    columns = COLUMNS[table]
+    sql = _sql(table, 'insert')
+    now = time.time()
+    count = 0
+    with transaction() as conn:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            conn.executemany(sql, ([record.get(c) for c in columns] + [now] for record in batch))
+            count += len(batch)
+    return count
+
+
+def delete(table, row_id):
+    return connection().execute(_sql(table, 'delete'), (row_id,)).rowcount > 0
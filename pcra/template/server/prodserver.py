@@ -0,0 +1,81 @@
+"""Production server for the app
+
+Runs gunicorn (pre-forked worker processes) on Linux and macOS, and waitress (a single process with a thread pool)
+on Windows, where gunicorn doesn't run.  Settings come from the `python -m appserver --prod` options or from
+environment variables:
+
+    APPSERVER_BIND              host:port to listen on (default: 127.0.0.1:8000)
+    APPSERVER_WORKERS           worker processes (default: 2 x CPU cores + 1)
+    APPSERVER_THREADS           threads per worker (default: 1)
+    APPSERVER_MAX_REQUESTS      requests a worker handles before it is replaced, 0 to never replace it
+                                (default: 1000 with one thread per worker, otherwise 0)
+    APPSERVER_TIMEOUT           seconds before a stuck worker is killed and replaced (default: 30)
+    APPSERVER_GRACEFUL_TIMEOUT  seconds workers get to finish their requests when reloading or stopping (default: 30)
+
+Send SIGHUP to the gunicorn master process to reload the code: new workers are started and the old ones
+finish the requests they are handling before they exit.
+
+Replacing a threaded worker drops the kept-alive connections it is holding, which clients see as the odd failed
+request, so recycling is off by default when there is more than one thread per worker.
+"""
+import os
+import multiprocessing
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def settings(workers=None, threads=None, max_requests=None, bind=None):
+    """Server settings, with arguments that are given taking priority over the environment"""
+    threads = threads or _env_int('APPSERVER_THREADS', 1)
+    return {
+        'bind': bind or os.environ.get('APPSERVER_BIND') or '127.0.0.1:8000',
+        'workers': workers or _env_int('APPSERVER_WORKERS', multiprocessing.cpu_count() * 2 + 1),
+        'threads': threads,
+        'max_requests': (max_requests if max_requests is not None
+                         else _env_int('APPSERVER_MAX_REQUESTS', 1000 if threads == 1 else 0)),
+        'timeout': _env_int('APPSERVER_TIMEOUT', 30),
+        'graceful_timeout': _env_int('APPSERVER_GRACEFUL_TIMEOUT', 30),
+    }
+
+
+def _run_gunicorn(config):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', config['bind'])
+            self.cfg.set('workers', config['workers'])
+            self.cfg.set('threads', config['threads'])
+            self.cfg.set('worker_class', 'gthread' if config['threads'] > 1 else 'sync')
+            self.cfg.set('max_requests', config['max_requests'])
+            # Spread the restarts out so the workers aren't all replaced at the same moment
+            self.cfg.set('max_requests_jitter', config['max_requests'] // 10)
+            self.cfg.set('timeout', config['timeout'])
+            self.cfg.set('graceful_timeout', config['graceful_timeout'])
+
+        def load(self):
+            # Imported in each worker (not the master) so that a reload picks up code changes
+            from appserver import create_app
+            return create_app()
+
+    Application().run()
+
+
+def _run_waitress(config):
+    import waitress
+    from appserver import create_app
+
+    host, _, port = config['bind'].rpartition(':')
+    waitress.serve(create_app(), host=host or '127.0.0.1', port=int(port),
+                   threads=config['workers'] * config['threads'])
+
+
+def run(workers=None, threads=None, max_requests=None, bind=None):
+    config = settings(workers, threads, max_requests, bind)
+    if os.name == 'nt':
+        _run_waitress(config)
+    else:
+        _run_gunicorn(config)
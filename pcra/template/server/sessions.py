@@ -0,0 +1,255 @@
+"""Shared secret key and server-side session storage
+
+With several worker processes, every one of them has to sign and check cookies with the same secret key, and
+has to be able to find a session that another worker created.  The key comes from the APPSERVER_SECRET_KEY
+environment variable, or else from a key file that is generated the first time the server starts.
+
+Sessions are stored on the server and the cookie only holds a signed, random session id:
+
+    sqlite  - a database file shared by all of the workers on the machine (default)
+    memory  - an LRU dictionary in each process, only for running a single process
+    cookie  - Flask's default signed cookie sessions, with nothing stored on the server
+
+Sessions slide: a request from a logged in user pushes the expiry back, but only once a part of the session
+lifetime (renew_after) has gone by since the last time, so most requests don't have to save the session or send
+a new cookie.  Views marked with @exempt (static files, routes that don't need a login) don't open the session
+at all.
+"""
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+from werkzeug.exceptions import HTTPException
+
+import dbutils
+
+SWEEP_INTERVAL = 300  # Seconds between deletions of expired sessions
+RENEWED_KEY = '_renewed'
+
+
+def exempt(view):
+    """Mark a view that doesn't use the session, so requests for it skip loading and saving it"""
+    view.session_exempt = True
+    return view
+
+
+def _is_exempt(app, request):
+    rule = request.url_rule
+    if rule is None:
+        # Flask 1.x opens the session before it matches the request to a route
+        try:
+            rule, _ = app.create_url_adapter(request).match(return_rule=True)
+        except HTTPException:
+            return True  # Requests that don't match a route (404, 405) don't need the session either
+    return getattr(app.view_functions.get(rule.endpoint), 'session_exempt', False)
+
+
+def renew(session, lifetime, renew_after):
+    """Have the session saved again if the fraction renew_after of its lifetime has passed since it last was"""
+    now = time.time()
+    if now - session.get(RENEWED_KEY, 0) >= lifetime.total_seconds() * renew_after:
+        session[RENEWED_KEY] = now
+
+
+def load_secret_key(key_file):
+    """APPSERVER_SECRET_KEY if it is set, otherwise the key in key_file (which is created if it doesn't exist)"""
+    key = os.environ.get('APPSERVER_SECRET_KEY')
+    if key:
+        return key.encode()
+
+    if not os.path.isfile(key_file):
+        os.makedirs(os.path.dirname(key_file), exist_ok=True)
+        tmp_file = f'{key_file}.{os.getpid()}.tmp'
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(secrets.token_hex(32).encode())
+        try:
+            # Workers starting at the same time race to create the file, and only the first key is ever used
+            os.link(tmp_file, key_file)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_file)
+
+    with open(key_file, 'rb') as f:
+        return f.read().strip()
+
+
+class MemoryStore:
+    """Least recently used sessions kept in the memory of one process"""
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # sid: (data, expires)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._sessions.get(sid)
+            if item is None:
+                return None
+            if item[1] < time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return item[0]
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._sessions[sid] = (data, expires)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def touch(self, sid, expires):
+        with self._lock:
+            item = self._sessions.get(sid)
+            if item is not None:
+                self._sessions[sid] = (item[0], expires)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLiteStore:
+    """Sessions in a SQLite database that every worker process on the machine shares"""
+
+    def __init__(self, db_file):
+        self._pool = dbutils.ConnectionPool(db_file)
+        self._last_sweep = 0.0
+        conn = self._pool.connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB, expires REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+
+    def get(self, sid):
+        row = self._pool.connection().execute('SELECT data FROM sessions WHERE id = ? AND expires > ?',
+                                              (sid, time.time())).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, sid, data, expires):
+        conn = self._pool.connection()
+        conn.execute('INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)', (sid, data, expires))
+        self._sweep(conn)
+
+    def touch(self, sid, expires):
+        self._pool.connection().execute('UPDATE sessions SET expires = ? WHERE id = ?', (expires, sid))
+
+    def delete(self, sid):
+        self._pool.connection().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+    def _sweep(self, conn):
+        now = time.time()
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self._last_sweep = now
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.old_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """Switch to a new session id, so that an id set before logging in can't be used to hijack the session"""
+        if self.sid is not None:
+            self.old_sid = self.sid
+            self.sid = None
+        self.modified = True
+
+
+def regenerate(session):
+    # Cookie sessions have no id to replace
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def _signer(app):
+        return Signer(app.secret_key, salt='appserver-session')
+
+    def open_session(self, app, request):
+        if _is_exempt(app, request):
+            return self.make_null_session(app)
+        cookie = request.cookies.get(app.session_cookie_name)
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None  # Forged or from an old key, so there's no need to look it up
+            if sid:
+                data = self.store.get(sid)
+                if data is not None:
+                    return ServerSession(self.serializer.loads(data), sid)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.old_sid is not None:
+            self.store.delete(session.old_sid)
+            session.old_sid = None
+
+        if not session:
+            if session.modified and session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        # Sessions that only last as long as the browser is open still need an expiry on the server
+        expires = time.time() + app.permanent_session_lifetime.total_seconds()
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), expires)
+        elif session.modified:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), expires)
+        else:
+            self.store.touch(session.sid, expires)
+
+        response.set_cookie(app.session_cookie_name, self._signer(app).sign(session.sid.encode()).decode(),
+                            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+class CookieSessionInterface(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        if _is_exempt(app, request):
+            return self.make_null_session(app)
+        return super().open_session(app, request)
+
+
+def init_app(app, store_name):
+    # Sessions are only saved when they change or are renewed, instead of on every request
+    app.config['SESSION_REFRESH_EACH_REQUEST'] = False
+    if store_name == 'sqlite':
+        store = SQLiteStore(os.environ.get('APPSERVER_SESSION_DB') or os.path.join(app.instance_path, 'sessions.db'))
+    elif store_name == 'memory':
+        store = MemoryStore()
+    elif store_name == 'cookie':
+        app.session_interface = CookieSessionInterface()
+        return
+    else:
+        raise ValueError(f"Unknown session store '{store_name}'")
+    app.session_interface = ServerSessionInterface(store)
@@ -0,0 +1,150 @@
+"""Serving the production build of the client
+
+The files in the build folder get .br and .gz copies (brotli only if the Brotli package is installed), written
+ahead of time by precompress() so that nothing is compressed while a request waits.  Each request is sent the
+smallest copy that its Accept-Encoding allows.
+
+Parcel puts a content hash in the names of the bundles it builds (src.1a2b3c4d.js), so a file with a hashed name
+never changes and can be cached by the browser for good.  Everything else, index.html included, is revalidated
+with its ETag on every use, so that a new build is picked up straight away.
+
+Paths that aren't files in the build folder are client routes and get index.html, except for paths under /api/
+and paths whose last part has a file extension, which are missing files and get a 404.
+
+Files are sent with the file wrapper of the WSGI server, which gunicorn sends with sendfile() without copying
+them through Python.  Set APPSERVER_X_SENDFILE=1 when a web server in front of the app handles the X-Sendfile
+header, to have it send the files instead.
+
+To compress a build without starting the server:  python static_assets.py ../client/dist/prod
+"""
+import os
+import re
+import io
+import sys
+import gzip
+import mimetypes
+
+from flask import request, send_file, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'.html', '.js', '.mjs', '.css', '.map', '.json', '.svg', '.txt', '.xml', '.ico', '.wasm'}
+MIN_SIZE = 256  # Smaller files aren't worth compressing
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # In order of preference
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.[^./]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _gzip(data):
+    buffer = io.BytesIO()
+    # A fixed mtime keeps the output the same from one run to the next
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def _compressors():
+    compressors = {'gzip': _gzip}
+    if brotli is not None:
+        compressors['br'] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+
+def _is_current(variant, stat):
+    # Compressed copies are given the mtime of the file they were made from
+    try:
+        return os.stat(variant).st_mtime_ns == stat.st_mtime_ns
+    except OSError:
+        return False
+
+
+def precompress(dist_dir):
+    """Write compressed copies of the files in dist_dir that don't have up to date ones, returns how many"""
+    compressors = _compressors()
+    written = 0
+    for root, _, files in os.walk(dist_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            stat = os.stat(path)
+            if stat.st_size < MIN_SIZE:
+                continue
+
+            data = None
+            for encoding, suffix in ENCODINGS:
+                compress = compressors.get(encoding)
+                variant = path + suffix
+                if compress is None or _is_current(variant, stat):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress(data)
+                if len(compressed) > len(data) * 0.9:
+                    continue
+
+                tmp_file = f'{variant}.{os.getpid()}.tmp'
+                with open(tmp_file, 'wb') as f:
+                    f.write(compressed)
+                os.utime(tmp_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                os.replace(tmp_file, variant)
+                written += 1
+    return written
+
+
+def send_asset(dist_dir, path):
+    """The response for a file in dist_dir, or None if there is no such file"""
+    file_path = safe_join(dist_dir, path)
+    if file_path is None or not os.path.isfile(file_path):
+        return None
+
+    stat = os.stat(file_path)
+    mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    has_variants = False
+    send_path, encoding = file_path, None
+    for accepted, suffix in ENCODINGS:
+        if _is_current(file_path + suffix, stat):
+            has_variants = True
+            if encoding is None and request.accept_encodings[accepted]:
+                send_path, encoding = file_path + suffix, accepted
+
+    # The ETag comes from the file that is sent, so every encoding has its own
+    response = send_file(send_path, mimetype=mimetype, conditional=True)
+    if encoding and response.status_code != 304:
+        response.headers['Content-Encoding'] = encoding
+    if has_variants:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE if HASHED_NAME.search(path) else 'no-cache'
+    response.headers.pop('Expires', None)
+    return response
+
+
+def init_app(app, dist_dir, api_prefix='api/'):
+    """Serve the client build in dist_dir (relative to the server folder) at the root of the app"""
+    dist_dir = os.path.join(app.root_path, dist_dir)
+    app.config['USE_X_SENDFILE'] = os.environ.get('APPSERVER_X_SENDFILE') == '1'
+
+    def spa(path='index.html'):
+        if path.startswith(api_prefix):
+            abort(404)
+        response = send_asset(dist_dir, path)
+        if response is None:
+            if os.path.splitext(path)[1]:
+                abort(404)
+            response = send_asset(dist_dir, 'index.html')
+            if response is None:
+                abort(404)
+        return response
+
+    app.add_url_rule('/', 'spa', spa, methods=['GET'])
+    app.add_url_rule('/<path:path>', 'spa', spa, methods=['GET'])
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else '../client/dist/prod'
+    print(f"Compressed {precompress(folder)} files in {folder}")
@@ -0,0 +1,203 @@
+"""User accounts for the app server
+
+Users are kept in a SQLite database (instance/users.db, or APPSERVER_USERS_DB), with the password hash worked
+out once when the user is created or the password is changed.  If there are no users yet, an 'admin' user is
+created with the password in APPSERVER_ADMIN_PASSWORD, or '123' if it isn't set.
+
+Checking a password runs the hash derivation again, which is slow on purpose.  The checks run on a small pool of
+threads, which limits how many of them use the CPU at once (the request thread still waits for its result), and a
+login is turned away (Busy) when too many are already waiting.
+
+Flask-Login loads the user on every request, so lookups are cached for CACHE_SECONDS.  A user that is deleted
+or changed in another process can take that long to be noticed.
+
+    python users.py list
+    python users.py add NAME
+    python users.py passwd NAME
+    python users.py delete NAME
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import dbutils
+
+log = logging.getLogger(__name__)
+
+CHECK_THREADS = 2  # Password checks that can run at the same time in each process
+CHECK_QUEUE = 16  # Password checks that can be waiting or running before logins are turned away
+CACHE_SECONDS = 60
+CACHE_SIZE = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(CHECK_QUEUE)
+_dummy_hash = None
+
+
+class Busy(Exception):
+    """Too many password checks are already waiting"""
+
+
+class TTLCache:
+    """A small dictionary whose entries expire, for lookups that are allowed to be a little out of date"""
+
+    def __init__(self, seconds, max_size):
+        self.seconds = seconds
+        self.max_size = max_size
+        self._items = OrderedDict()  # key: (value, expires)
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """The cached value for key, or the value from load(key), which is then cached"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] > now:
+                return item[0]
+        value = load(key)
+        with self._lock:
+            self._items[key] = (value, now + self.seconds)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class UserStore:
+    def __init__(self, db_file):
+        self._pool = dbutils.ConnectionPool(db_file)
+        self._cache = TTLCache(CACHE_SECONDS, CACHE_SIZE)
+        self._pool.connection().execute('CREATE TABLE IF NOT EXISTS users '
+                                        '(username TEXT PRIMARY KEY, password_hash TEXT NOT NULL, created REAL)')
+
+    def _load(self, username):
+        row = self._pool.connection().execute('SELECT username, created FROM users WHERE username = ?',
+                                              (username,)).fetchone()
+        return None if row is None else {'username': row[0], 'created': row[1]}
+
+    def get(self, username):
+        """The user's record (without the password hash), or None if there is no such user"""
+        return self._cache.get(username, self._load)
+
+    def password_hash(self, username):
+        row = self._pool.connection().execute('SELECT password_hash FROM users WHERE username = ?',
+                                              (username,)).fetchone()
+        return None if row is None else row[0]
+
+    def add(self, username, password):
+        """Create the user, returns False if it already exists"""
+        cursor = self._pool.connection().execute(
+            'INSERT OR IGNORE INTO users (username, password_hash, created) VALUES (?, ?, ?)',
+            (username, generate_password_hash(password), time.time()))
+        self._cache.discard(username)
+        return cursor.rowcount > 0
+
+    def set_password(self, username, password):
+        cursor = self._pool.connection().execute('UPDATE users SET password_hash = ? WHERE username = ?',
+                                                 (generate_password_hash(password), username))
+        return cursor.rowcount > 0
+
+    def delete(self, username):
+        cursor = self._pool.connection().execute('DELETE FROM users WHERE username = ?', (username,))
+        self._cache.discard(username)
+        return cursor.rowcount > 0
+
+    def usernames(self):
+        return [row[0] for row in self._pool.connection().execute('SELECT username FROM users ORDER BY username')]
+
+    def is_empty(self):
+        return self._pool.connection().execute('SELECT 1 FROM users LIMIT 1').fetchone() is None
+
+
+def _check_executor():
+    global _executor
+    with _executor_lock:
+        # Made on first use, so a forked worker doesn't inherit the threads of its parent
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CHECK_THREADS, thread_name_prefix='password-check')
+        return _executor
+
+
+def verify_password(store, username, password):
+    """Whether password is the user's password, raises Busy if too many checks are waiting
+
+    The pool only limits how many checks run at once, the calling thread is blocked until its check is done.
+    """
+    if not _pending.acquire(blocking=False):
+        raise Busy()
+    try:
+        password_hash = store.password_hash(username)
+        if password_hash is None:
+            # Check against a made up hash so that unknown users take as long as wrong passwords
+            _check_executor().submit(check_password_hash, _dummy_hash, password).result()
+            return False
+        return _check_executor().submit(check_password_hash, password_hash, password).result()
+    finally:
+        _pending.release()
+
+
+def default_db_file(instance_path):
+    return os.environ.get('APPSERVER_USERS_DB') or os.path.join(instance_path, 'users.db')
+
+
+def init_app(app):
+    global _dummy_hash
+    # Worked out at startup, the first login of an unknown user shouldn't have to pay for it
+    if _dummy_hash is None:
+        _dummy_hash = generate_password_hash(os.urandom(16).hex())
+
+    store = UserStore(default_db_file(app.instance_path))
+    if store.is_empty() and store.add('admin', os.environ.get('APPSERVER_ADMIN_PASSWORD', '123')):
+        log.warning("Created the user 'admin', change its password with: python users.py passwd admin")
+    app.extensions['users'] = store
+    return store
+
+
+def get_store():
+    return current_app.extensions['users']
+
+
+def main():
+    import argparse
+    import getpass
+
+    parser = argparse.ArgumentParser(prog='python users.py', description='Manage the users of the app server')
+    parser.add_argument('command', choices=['list', 'add', 'passwd', 'delete'])
+    parser.add_argument('username', nargs='?')
+    args = parser.parse_args()
+
+    store = UserStore(default_db_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')))
+    if args.command == 'list':
+        print('\n'.join(store.usernames()))
+        return
+    if not args.username:
+        parser.error(f"'{args.command}' needs a username")
+    username = args.username.lower()
+
+    if args.command == 'delete':
+        print(f"Deleted '{username}'" if store.delete(username) else f"There is no user '{username}'")
+        return
+
+    password = getpass.getpass(f"Password for '{username}': ")
+    if password != getpass.getpass('Again: '):
+        parser.exit(1, "The passwords don't match\n")
+    if args.command == 'add':
+        print(f"Added '{username}'" if store.add(username, password) else f"The user '{username}' already exists")
+    else:
+        print(f"Changed the password of '{username}'" if store.set_password(username, password)
+              else f"There is no user '{username}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,106 @@
 import os
 import sys
-import subprocess
-import re
-
-try:
-    from colorama import Fore, Style, init as colorama_init
-    colorama_init()
-except ModuleNotFoundError:
-    # If colorama is not installed create failover classes for colored text output
-    if os.name == 'nt':
-        print("[Colored output not available]")
+import threading
+from collections import deque, namedtuple
+
+from . import profiler
+
+# Heavier modules (subprocess, selectors, colorama...) are imported on first use so the CLI starts quickly
+
+PROBE_TTL = 300  # Seconds a successful git/npm probe is trusted for
+
+_colors = None
+
+
+def colors():
+    """(Fore, Style) for colored output, initializing colorama the first time output is colored"""
+    global _colors
+    if _colors is None:
+        try:
+            from colorama import Fore, Style, init as colorama_init
+            colorama_init()
+        except ModuleNotFoundError:
+            # If colorama is not installed create failover classes for colored text output
+            if os.name == 'nt':
+                print("[Colored output not available]")
+
+                class Fore:
+                    CYAN = ''
+                    YELLOW = ''
+                    RED = ''
+
+                class Style:
+                    RESET_ALL = ''
+            else:
+                class Fore:
+                    CYAN = '\033[1;36;48m'
+                    YELLOW = '\033[1;33;48m'
+                    RED = '\033[1;31;48m'
+
+                class Style:
+                    RESET_ALL = '\033[1;37;0m'
+        _colors = (Fore, Style)
+    return _colors
+
+
+def __getattr__(name):
+    # Keeps `from pcra.utils import Fore, Style` working without paying for colorama at import time
+    if name == 'Fore':
+        return colors()[0]
+    if name == 'Style':
+        return colors()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_output_lock = threading.Lock()
+_output_context = threading.local()
+
+
+def set_output_prefix(prefix):
+    # Lines printed from the current thread get tagged so concurrent task output stays readable
+    _output_context.prefix = prefix
+
 
-        class Fore:
-            CYAN = ''
-            YELLOW = ''
-            RED = ''
+def get_output_prefix():
+    return getattr(_output_context, 'prefix', None)
 
-        class Style:
-            RESET_ALL = ''
-    else:
-        class Fore:
-            CYAN = '\033[1;36;48m'
-            YELLOW = '\033[1;33;48m'
-            RED = '\033[1;31;48m'
 
-        class Style:
-            RESET_ALL = '\033[1;37;0m'
+def _emit(text):
+    prefix = getattr(_output_context, 'prefix', None)
+    with _output_lock:
+        if prefix:
+            for line in str(text).splitlines() or ['']:
+                print(f'[{prefix}] {line}')
+        else:
+            print(text)
 
 
 def printmsg(msg):
-    print(f'{Fore.CYAN}{msg}{Style.RESET_ALL}')
+    Fore, Style = colors()
+    _emit(f'{Fore.CYAN}{msg}{Style.RESET_ALL}')
 
 
 def printerr(msg):
-    print(f'{Fore.RED}{msg}{Style.RESET_ALL}')
+    Fore, Style = colors()
+    _emit(f'{Fore.RED}{msg}{Style.RESET_ALL}')
 
 
 def printwarn(msg):
-    print(f'{Fore.YELLOW}{msg}{Style.RESET_ALL}')
+    Fore, Style = colors()
+    _emit(f'{Fore.YELLOW}{msg}{Style.RESET_ALL}')
 
 
-_process_kwargs = dict(stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE,
-                       universal_newlines=True,
-                       text=True
-                       )
-if os.name == 'nt':
-    _process_kwargs['shell'] = True  # Windows npm commands fail without shell: FileNotFoundError
+def _process_kwargs():
+    import subprocess
+
+    kwargs = dict(stdout=subprocess.PIPE,
+                  stderr=subprocess.PIPE,
+                  universal_newlines=True,
+                  text=True
+                  )
+    if os.name == 'nt':
+        kwargs['shell'] = True  # Windows npm commands fail without shell: FileNotFoundError
+    return kwargs
 
 
 def check_python_version(version_required):
@@ -55,48 +109,241 @@ def check_python_version(version_required):
     return (python_version.major, python_version.minor) == required_version
 
 
-def check_git_installed():
+def _is_npm_version(line):
+    import re
+    return re.match(r'^\d+\.\d+\.\d+$', line) is not None  # 6.14.8
+
+
+_PROBES = {
+    'git': (['git', '--version'], lambda line: line.startswith('git version')),
+    'npm': (['npm', '--version'], _is_npm_version),
+}
+
+
+def _probe_cache_file():
+    from .cache import cache_dir
+    return os.path.join(cache_dir('probes'), 'toolchain.json')
+
+
+def _load_probe_cache():
+    import json
+    import time
     try:
-        process = subprocess.Popen(['git', '--version'], **_process_kwargs)
-        return process.stdout.readline().startswith('git version')
-    except FileNotFoundError as e:
-        print(e)
-        return False
+        with open(_probe_cache_file(), 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('path') != os.environ.get('PATH') or time.time() - data.get('time', 0) > PROBE_TTL:
+        return {}
+    return data.get('tools', {})
+
+
+def _save_probe_cache(tools):
+    import json
+    import time
+    try:
+        cache_file = _probe_cache_file()
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(json.dumps({'path': os.environ.get('PATH'), 'time': time.time(), 'tools': tools}))
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+def probe_toolchain(*names, use_cache=True):
+    """Check that the named tools (git, npm) run, starting all the probes at once
+
+    Successful probes are remembered for PROBE_TTL seconds as long as PATH doesn't change, unless use_cache is False.
+    """
+    import subprocess
+
+    cached = _load_probe_cache() if use_cache else {}
+    results = {name: True for name in names if cached.get(name)}
+    processes = {}
+    for name in names:
+        if name in results:
+            continue
+        try:
+            processes[name] = subprocess.Popen(_PROBES[name][0], **_process_kwargs())
+        except FileNotFoundError as e:
+            print(e)
+            results[name] = False
+
+    for name, process in processes.items():
+        output, _ = process.communicate()
+        lines = output.splitlines()
+        results[name] = bool(lines) and _PROBES[name][1](lines[0].strip())
+
+    if use_cache and processes and any(results[name] for name in processes):
+        cached.update({name: True for name, ok in results.items() if ok})
+        _save_probe_cache(cached)
+
+    return results
+
+
+def check_git_installed():
+    return probe_toolchain('git')['git']
 
 
 def check_npm_installed():
+    return probe_toolchain('npm')['npm']
+
+
+def get_cmd_output(args, cwd=None):
+    import subprocess
+
     try:
-        process = subprocess.Popen(['npm', '--version'], **_process_kwargs)
-        r = re.compile(r'^\d+\.\d+\.\d+$')  # 6.14.8
-        return r.match(process.stdout.readline()) is not None
-    except FileNotFoundError as e:
-        print(e)
-        return False
+        result = subprocess.run(args, cwd=cwd, **_process_kwargs())
+    except FileNotFoundError:
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
 
 
 def _print_if_data(msg):
     # Don't print blank lines
     msg_text = msg.strip()
     if len(msg_text) > 0:
-        print(msg_text)
+        _emit(msg_text)
+
+
+CmdResult = namedtuple('CmdResult', ['args', 'returncode', 'duration', 'output'])
+
+
+class CommandError(Exception):
+    def __init__(self, result, timed_out=False):
+        self.result = result
+        self.timed_out = timed_out
+        cmd = ' '.join(result.args)
+        if timed_out:
+            super().__init__(f"Command '{cmd}' timed out after {result.duration:.1f}s")
+        else:
+            super().__init__(f"Command '{cmd}' failed with return code {result.returncode}")
+
+
+def _pump_selectors(process, on_line, deadline):
+    import time
+    import codecs
+    import locale
+    import selectors
+    import subprocess
+
+    encoding = locale.getpreferredencoding(False)
+    selector = selectors.DefaultSelector()
+    streams = {}
+    for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+        selector.register(pipe, selectors.EVENT_READ, name)
+        streams[name] = [codecs.getincrementaldecoder(encoding)(errors='replace'), '']
+
+    while selector.get_map():
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise subprocess.TimeoutExpired(process.args, 0)
+
+        for key, _ in selector.select(timeout):
+            decoder, pending = streams[key.data]
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fileobj)
+                pending += decoder.decode(b'', final=True)
+                if pending:
+                    on_line(key.data, pending.rstrip('\r'))
+                continue
 
+            lines = (pending + decoder.decode(data)).split('\n')
+            streams[key.data][1] = lines.pop()
+            for line in lines:
+                on_line(key.data, line.rstrip('\r'))
+
+    selector.close()
+
+
+def _pump_threads(process, on_line, deadline):
+    # Pipes can't be used with selectors on Windows so each one gets a reader thread instead
+    import time
+    import queue
+    import locale
+    import subprocess
+
+    encoding = locale.getpreferredencoding(False)
+    lines = queue.Queue()
+
+    def reader(name, pipe):
+        for raw in iter(pipe.readline, b''):
+            lines.put((name, raw.decode(encoding, errors='replace').rstrip('\r\n')))
+        lines.put((name, None))
+
+    for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+        threading.Thread(target=reader, args=(name, pipe), daemon=True).start()
+
+    open_streams = 2
+    while open_streams:
+        timeout = None if deadline is None else max(0, deadline - time.monotonic())
+        try:
+            name, line = lines.get(timeout=timeout)
+        except queue.Empty:
+            raise subprocess.TimeoutExpired(process.args, 0)
+        if line is None:
+            open_streams -= 1
+        else:
+            on_line(name, line)
+
+
+def run_cmd(args, cwd=None, timeout=None, check=True, tail_lines=50, stdin=None):
+    """Run a command, streaming its stdout while draining stderr so neither pipe can fill up and stall it
+
+    Returns a CmdResult with the exit code, duration and the last `tail_lines` lines of output as
+    (seconds since start, stream name, line) tuples.  Raises CommandError on failure or timeout unless check is False.
+    stdin can be an open file to feed to the command.
+    """
+    span_name = ' '.join([os.path.basename(str(args[0]))] + [str(arg) for arg in args[1:2]])
+    with profiler.span(span_name, 'cmd', args=' '.join(str(arg) for arg in args), cwd=cwd):
+        return _run_cmd(args, cwd, timeout, check, tail_lines, stdin)
+
+
+def _run_cmd(args, cwd, timeout, check, tail_lines, stdin):
+    import time
+    import subprocess
+
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    output = deque(maxlen=tail_lines)
+
+    def on_line(stream, line):
+        output.append((time.monotonic() - start, stream, line))
+        if stream == 'stdout':
+            _print_if_data(line)
+
+    process = subprocess.Popen(args, cwd=cwd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               shell=os.name == 'nt')
+    timed_out = False
+    try:
+        if os.name == 'nt':
+            _pump_threads(process, on_line, deadline)
+        else:
+            _pump_selectors(process, on_line, deadline)
+        return_code = process.wait(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        process.kill()
+        return_code = process.wait()
+    finally:
+        process.stdout.close()
+        process.stderr.close()
 
-def run_cmd(args):
-    process = subprocess.Popen(args, **_process_kwargs)
+    result = CmdResult(list(args), return_code, time.monotonic() - start, list(output))
 
-    while True:
-        output = process.stdout.readline()
-        _print_if_data(output)
-        # Do something else
-        return_code = process.poll()
-        if return_code is not None:
-            # Process has finished, read rest of the output
-            for output in process.stdout.readlines():
-                _print_if_data(output)
+    if return_code != 0:
+        _emit(f'RETURN CODE: {return_code}')
+        for _, stream, line in result.output:
+            if stream == 'stderr':
+                _print_if_data(line)
 
-            if return_code != 0:
-                print('RETURN CODE:', return_code)
-                for output in process.stderr.readlines():
-                    _print_if_data(output)
+        if check:
+            raise CommandError(result, timed_out)
 
-            break
+    return result
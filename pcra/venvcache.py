@@ -0,0 +1,103 @@
+import os
+import sys
+import shutil
+import platform
+from contextlib import nullcontext
+
+from . import cache
+from .utils import printmsg, printwarn
+
+is_windows = os.name == 'nt'
+
+script_folder = 'Scripts' if is_windows else 'bin'
+
+
+def _fixup_paths(venv_dir, old_path):
+    # Activation scripts, console script shebangs and pyvenv.cfg all embed the absolute venv location
+    old = old_path.encode()
+    new = venv_dir.encode()
+    candidates = [os.path.join(venv_dir, 'pyvenv.cfg')]
+    bin_dir = os.path.join(venv_dir, script_folder)
+    candidates.extend(os.path.join(bin_dir, f) for f in os.listdir(bin_dir))
+
+    for path in candidates:
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        if b'\0' in data or old not in data:
+            continue
+        mode = os.stat(path).st_mode
+        os.remove(path)  # Don't write through a hardlink into the cache
+        with open(path, 'wb') as f:
+            f.write(data.replace(old, new))
+        os.chmod(path, mode)
+
+
+class VenvCache:
+    """Content-addressed store of fully installed virtual environments"""
+
+    def __init__(self, enabled=True, refresh=False):
+        # Console script launchers on Windows are binaries with the venv path baked in, so they can't be relocated
+        self.enabled = enabled and not is_windows
+        self.refresh = refresh
+        self._locks = cache.KeyLocks('venv')
+
+    def lock(self, requirements_file):
+        if not self.enabled:
+            return nullcontext()
+        return self._locks(self.key(requirements_file))
+
+    @staticmethod
+    def key(requirements_file):
+        with open(requirements_file, 'rb') as f:
+            return VenvCache.key_for(f.read())
+
+    @staticmethod
+    def key_for(requirements):
+        return cache.hash_key(requirements, sys.version, sys.executable, platform.platform())
+
+    @staticmethod
+    def _entry_dir(key, create=True):
+        return os.path.join(cache.cache_dir('venv', create), key)
+
+    def has(self, requirements_file) -> bool:
+        return self.has_key(self.key(requirements_file))
+
+    def has_key(self, key) -> bool:
+        if not self.enabled or self.refresh:
+            return False
+        return cache.read_meta(self._entry_dir(key, create=False)) is not None
+
+    def restore(self, requirements_file, venv_dir) -> bool:
+        if not self.enabled or self.refresh:
+            return False
+
+        entry_dir = self._entry_dir(self.key(requirements_file))
+        meta = cache.read_meta(entry_dir)
+        if meta is None:
+            return False
+
+        cache.link_tree(os.path.join(entry_dir, 'venv'), venv_dir)
+        _fixup_paths(venv_dir, meta['path'])
+        cache.mark_used(entry_dir)
+        printmsg('Restored virtual environment from cache')
+        return True
+
+    def save(self, requirements_file, venv_dir):
+        if not self.enabled:
+            return
+
+        entry_dir = self._entry_dir(self.key(requirements_file))
+        tmp_dir = cache.tmp_path(entry_dir)
+        try:
+            shutil.copytree(venv_dir, os.path.join(tmp_dir, 'venv'), symlinks=True,
+                            ignore=shutil.ignore_patterns('__pycache__'))
+            cache.write_meta(tmp_dir, {'path': venv_dir,
+                                       'requirements': os.path.basename(requirements_file),
+                                       'size': cache.tree_size(tmp_dir)})
+            cache.publish(tmp_dir, entry_dir)
+            cache.evict(os.path.dirname(entry_dir))
+        except OSError as e:
+            printwarn(f'Unable to cache virtual environment: {e}')
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import glob
+import platform
+from contextlib import contextmanager
+
+from . import cache, profiler
+from .utils import printmsg, run_cmd, CommandError
+
+WHEELHOUSE_FOLDER = 'wheelhouse'  # Folder of bundled wheels in a template or packed template
+
+
+def _requirement_lines(requirements):
+    lines = (line.split('#', 1)[0].strip() for line in requirements.splitlines())
+    return [line for line in lines if line]
+
+
+def _normalize_name(name):
+    # Wheel and dist-info names spell the same project with any mix of case, dashes, dots and underscores
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def wheel_command(requirements_files, wheel_dir, find_links=None, no_index=False):
+    args = [sys.executable, '-m', 'pip', 'wheel', '--disable-pip-version-check', '--wheel-dir', wheel_dir]
+    if find_links is not None:
+        args.extend(['--find-links', find_links])
+    if no_index:
+        args.append('--no-index')
+    for requirements_file in requirements_files:
+        args.extend(['-r', requirements_file])
+    return args
+
+
+def fetch_wheels(requirements_files, wheel_dir, find_links=None, no_index=False):
+    """Build or download wheels for all of the requirements files in a single pip run
+
+    Requirements shared between the files are only resolved and fetched once.
+    """
+    run_cmd(wheel_command(requirements_files, wheel_dir, find_links, no_index))
+
+
+class Wheelhouse:
+    """Local folder of wheels kept between runs that every virtual environment installs from without the index"""
+
+    def __init__(self, enabled=True, refresh=False, offline=False):
+        self.enabled = enabled
+        self.refresh = refresh
+        self.offline = offline
+        self._ready = set()
+        self._locks = cache.KeyLocks(WHEELHOUSE_FOLDER)
+
+    @property
+    def path(self):
+        return cache.cache_dir(WHEELHOUSE_FOLDER)
+
+    @staticmethod
+    def key(requirements_file):
+        with open(requirements_file, 'r') as f:
+            return Wheelhouse.key_for(f.read())
+
+    @staticmethod
+    def key_for(requirements):
+        # Wheels are picked per interpreter, so a set of requirements resolved for one Python says nothing about another
+        return cache.hash_key(*sorted(_requirement_lines(requirements)), sys.version, platform.platform())
+
+    def is_resolved(self, key) -> bool:
+        """Whether an earlier run already fetched everything for the requirements with this key"""
+        if not self.enabled or self.refresh:
+            return False
+        meta = cache.read_meta(cache.cache_dir(WHEELHOUSE_FOLDER, create=False)) or {}
+        return key in self._ready or key in meta.get('resolved', [])
+
+    def planned_install_args(self):
+        """What installing() will give once prepare() has run"""
+        if not self.enabled:
+            return []
+        return ['--no-index', '--find-links', cache.cache_dir(WHEELHOUSE_FOLDER, create=False)]
+
+    def _lock(self, shared=False):
+        return cache.FileLock(cache.lock_file(WHEELHOUSE_FOLDER, WHEELHOUSE_FOLDER), shared=shared)
+
+    @contextmanager
+    def installing(self, requirements_file, venv_dir):
+        """Extra pip install arguments for a requirements file that prepare() has fetched everything for
+
+        The wheelhouse is locked (shared with other installs) until the with block ends, so none of the wheels
+        can be evicted while pip is installing from them, and the wheels that ended up in venv_dir are marked
+        as used afterwards.
+        """
+        key = self.key(requirements_file) if self.enabled else None
+        if key not in self._ready:
+            yield []
+            return
+
+        lock = self._lock(shared=True)
+        lock.acquire()
+        try:
+            if key not in (cache.read_meta(self.path) or {}).get('resolved', []):
+                # Some of the wheels were evicted after prepare(), so fetch them again
+                lock.release()
+                self._ready.discard(key)
+                self.prepare([requirements_file])
+                lock.acquire()
+            yield ['--no-index', '--find-links', self.path]
+            self.mark_used(venv_dir)
+        finally:
+            lock.release()
+
+    def mark_used(self, venv_dir):
+        """Touch the wheels of the packages installed in venv_dir, so that eviction goes by when they were last used"""
+        installed = set()
+        for site_packages in (glob.glob(os.path.join(venv_dir, 'lib', 'python*', 'site-packages'))
+                              + [os.path.join(venv_dir, 'Lib', 'site-packages')]):
+            for dist_info in glob.glob(os.path.join(site_packages, '*.dist-info')):
+                name, _, version = os.path.basename(dist_info)[:-len('.dist-info')].rpartition('-')
+                installed.add((_normalize_name(name), version))
+
+        for wheel in glob.glob(os.path.join(self.path, '*.whl')):
+            name, version = os.path.basename(wheel).split('-')[:2]
+            if (_normalize_name(name), version) in installed:
+                try:
+                    os.utime(wheel)
+                except OSError:
+                    pass
+
+    def add_bundled(self, entries):
+        """Seed the wheelhouse with the wheels from a template's wheelhouse folder"""
+        wheel_dir = self.path
+        added = 0
+        for entry in entries:
+            destination = os.path.join(wheel_dir, entry.path.rsplit('/', 1)[-1])
+            if os.path.isfile(destination):
+                continue
+            tmp_file = cache.tmp_path(destination)
+            with open(tmp_file, 'wb') as f:
+                f.write(entry.read_bytes())
+            os.replace(tmp_file, destination)
+            added += 1
+        if added:
+            printmsg(f'Added {added} bundled wheels to the wheelhouse')
+        return added
+
+    def prepare(self, requirements_files, bundled=False):
+        """Make sure every requirement (and dependency) of the files is in the wheelhouse
+
+        Everything is fetched in one pip run so the client and server environments can then be installed
+        side by side from local files.
+        """
+        if not self.enabled or not requirements_files:
+            return
+
+        # Room is made before looking at what is resolved, so that no wheel this run installs from is evicted later
+        if cache.evict_files(self.path):
+            self._ready.clear()
+
+        # One pip run at a time writes into the shared folder, whichever process it's in
+        with self._locks(WHEELHOUSE_FOLDER), profiler.span('wheelhouse', 'step') as step:
+            wheel_dir = self.path
+            meta = cache.read_meta(wheel_dir) or {}
+            resolved = set(meta.get('resolved', []))
+            keys = {requirements_file: self.key(requirements_file) for requirements_file in requirements_files}
+
+            pending = [f for f, key in keys.items() if key not in self._ready and (self.refresh or key not in resolved)]
+            step['cache'] = 'miss' if pending else 'hit'
+            if pending:
+                printmsg('Fetching Python wheels...')
+                if self.offline or (bundled and not self.refresh):
+                    # A bundled wheelhouse should already hold everything, so try without the index first
+                    try:
+                        fetch_wheels(pending, wheel_dir, find_links=wheel_dir, no_index=True)
+                    except CommandError:
+                        if self.offline:
+                            raise
+                        fetch_wheels(pending, wheel_dir, find_links=wheel_dir)
+                else:
+                    fetch_wheels(pending, wheel_dir, find_links=wheel_dir)
+
+                resolved.update(keys[f] for f in pending)
+                meta['resolved'] = sorted(resolved)
+                cache.write_meta(wheel_dir, meta)
+
+            self._ready.update(keys.values())
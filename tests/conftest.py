@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def template(tmp_path, monkeypatch):
+    """A custom template and a fallback template, with the cache in a folder of its own"""
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+    template_dir = tmp_path / 'template'
+    fallback_dir = tmp_path / 'fallback'
+    template_dir.mkdir()
+    fallback_dir.mkdir()
+    (template_dir / 'README.md').write_text('Hello {{pcra:project_name}} v1')
+    (fallback_dir / 'index.html').write_text('<title>{{pcra:app_title}}</title>')
+    return str(template_dir), str(fallback_dir)
+
+
+@pytest.fixture
+def edit_in_place():
+    def edit(path, text):
+        # Same size as before, and a later mtime even on filesystems with coarse timestamps
+        st = os.stat(path)
+        with open(path, 'w') as f:
+            f.write(text)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000_000))
+    return edit
+
+
+@pytest.fixture
+def render_readme():
+    from pcra.render import TemplateRenderer
+
+    def render_readme(manifest, project_dir, name):
+        os.makedirs(project_dir)
+        destination = os.path.join(project_dir, 'README.md')
+        TemplateRenderer({'project_name': name}).write(manifest, [(manifest.resolve('README.md'), destination)])
+        with open(destination) as f:
+            return f.read()
+    return render_readme
+
+
+@pytest.fixture
+def new_project(tmp_path, monkeypatch):
+    """Makes projects in tmp_path with git, npm and the virtual environments turned off
+
+    Each project records the phases it ran in project.ran, and the phase named by fail raises instead of running.
+    """
+    from pcra.api import ProjectOptions
+    from pcra.pcra import PCRA
+
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+
+    def new_project(folder='app', fail=None, **options):
+        options = dict(dict(no_virtualenv=True, no_javascript=True, no_git=True), **options)
+        project = PCRA(ProjectOptions(folder=folder, base_dir=str(tmp_path), **options))
+        project.ran = []
+        for phase, method, _ in project.PHASES:
+            def run(phase=phase, func=getattr(project, method)):
+                if phase == fail:
+                    raise RuntimeError(f'{phase} failed')
+                func()
+                project.ran.append(phase)
+            setattr(project, method, run)
+        return project
+    return new_project
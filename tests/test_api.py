@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+from pcra.api import ProjectOptions, create_project, create_projects
+from pcra.archive import ARCHIVE_EXTENSION
+from pcra.pcra import PCRA
+
+
+@pytest.fixture(autouse=True)
+def local_only(tmp_path, monkeypatch):
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+    # Transcrypt pins the Python version of created projects, not the one the tests run under
+    monkeypatch.setattr('pcra.pcra.PYTHON_VERSION_REQUIRED', '{}.{}'.format(*sys.version_info))
+
+
+def options(tmp_path, folder='app', **kwargs):
+    return ProjectOptions(folder, no_virtualenv=True, no_javascript=True, no_git=True, base_dir=str(tmp_path),
+                          **kwargs)
+
+
+def planned_copies(project_options):
+    project = PCRA(project_options)
+    try:
+        return len(project.copy_plan()[1])
+    finally:
+        project.close()
+
+
+def test_create_project_result(tmp_path):
+    expected = planned_copies(options(tmp_path, full_stack=True))
+    result = create_project(options(tmp_path, full_stack=True))
+
+    assert result.success
+    assert result.error is None
+    assert result.name == 'app'
+    assert result.project_dir == os.path.realpath(str(tmp_path / 'app'))
+    assert os.path.isfile(os.path.join(result.project_dir, 'server', 'requirements.txt'))
+    assert result.files_copied == expected
+    assert result.bytes_copied > 0
+    assert result.duration > 0
+
+
+def test_existing_folder_is_reported(tmp_path):
+    (tmp_path / 'app').mkdir()
+    (tmp_path / 'app' / 'keep.txt').write_text('mine')
+
+    result = create_project(options(tmp_path))
+
+    assert not result.success
+    assert result.error == 'The path specified already exists!'
+    assert os.listdir(str(tmp_path / 'app')) == ['keep.txt']
+
+
+def test_invalid_template_is_reported(tmp_path):
+    template_dir = tmp_path / 'template'
+    template_dir.mkdir()
+    (template_dir / 'README.md').write_text('No client folder')
+
+    result = create_project(options(tmp_path, template=str(template_dir)))
+
+    assert not result.success
+    assert result.error == f'Supplied template folder at {template_dir} is not valid!'
+
+
+def test_unreadable_packed_template_is_reported(tmp_path):
+    packed = tmp_path / f'template{ARCHIVE_EXTENSION}'
+    packed.write_bytes(b'not a packed template')
+
+    result = create_project(options(tmp_path, template=str(packed)))
+
+    assert not result.success
+    assert result.error
+
+
+def test_create_projects_keeps_going_after_a_failure(tmp_path, capsys):
+    (tmp_path / 'taken').mkdir()
+
+    results = create_projects([options(tmp_path, 'one'), options(tmp_path, 'taken'), options(tmp_path, 'two')],
+                              workers=2)
+
+    assert [(result.name, result.success) for result in results] == [('one', True), ('taken', False),
+                                                                     ('two', True)]
+    assert results[1].error == 'The path specified already exists!'
+    assert '[one] ' in capsys.readouterr().out
@@ -0,0 +1,23 @@
+import os
+
+from pcra.archive import TemplateArchive, pack_template
+from pcra.manifest import TemplateManifest
+
+
+def test_archive_is_released_after_use(template, tmp_path):
+    template_dir, fallback_dir = template
+    archive_file = str(tmp_path / 'template.pcra')
+    pack_template(template_dir, archive_file)
+
+    with TemplateArchive(archive_file) as archive:
+        assert archive.read('README.md') == b'Hello {{pcra:project_name}} v1'
+        destination = str(tmp_path / 'README.md')
+        archive.extract([('README.md', destination)])
+    assert archive._file.closed and archive._map is None
+    archive.close()  # Closing twice is harmless
+
+    manifest = TemplateManifest.load(archive_file, fallback_dir)
+    assert manifest.resolve('README.md').read_bytes() == b'Hello {{pcra:project_name}} v1'
+    manifest.close()
+    assert manifest.archive._file.closed
+    os.remove(archive_file)
@@ -0,0 +1,77 @@
+import os
+import zipfile
+
+import pytest
+
+from pcra import cache
+
+
+@pytest.fixture
+def wheelhouse(tmp_path, monkeypatch):
+    """A wheelhouse with three 1 KB wheels added a minute apart, oldest first"""
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+    wheel_dir = cache.cache_dir('wheelhouse')
+    for i, name in enumerate(['a', 'b', 'c']):
+        path = os.path.join(wheel_dir, f'{name}-1.0-py3-none-any.whl')
+        with zipfile.ZipFile(path, 'w') as f:
+            f.writestr('data', os.urandom(1024))
+        os.utime(path, (1000 + i * 60, 1000 + i * 60))
+    cache.write_meta(wheel_dir, {'resolved': ['key']})
+    return wheel_dir
+
+
+def test_evict_removes_oldest_wheels_and_resolved_keys(wheelhouse):
+    size = sum(os.path.getsize(os.path.join(wheelhouse, name)) for name in os.listdir(wheelhouse)
+               if name.endswith('.whl'))
+    evicted = cache.evict_files(wheelhouse, size - 1)
+
+    assert [os.path.basename(path) for path in evicted] == ['a-1.0-py3-none-any.whl']
+    assert sorted(os.listdir(wheelhouse)) == ['.locks', 'b-1.0-py3-none-any.whl', 'c-1.0-py3-none-any.whl']
+    assert cache.read_meta(wheelhouse) is None
+
+
+def test_evict_keeps_wheelhouse_within_limit(wheelhouse):
+    assert cache.evict_files(wheelhouse, 1024 * 1024) == []
+    assert cache.read_meta(wheelhouse) == {'resolved': ['key']}
+
+
+def test_verify_and_prune_wheelhouse(wheelhouse):
+    broken = os.path.join(wheelhouse, 'd-1.0-py3-none-any.whl')
+    with open(broken, 'w') as f:
+        f.write('not a wheel')
+
+    assert cache.verify_cache() == [('wheelhouse', broken, 'is not a readable wheel')]
+
+    removed = cache.prune_cache(max_bytes=0)
+    assert broken in removed
+    assert [name for name in os.listdir(wheelhouse) if name.endswith('.whl')] == []
+
+
+def test_shared_locks_keep_out_exclusive_ones(tmp_path):
+    path = str(tmp_path / 'section.lock')
+    first, second = cache.FileLock(path, shared=True), cache.FileLock(path, shared=True)
+    with first:
+        assert second.acquire(blocking=False)
+        second.release()
+        assert not cache.FileLock(path).acquire(blocking=False)
+    exclusive = cache.FileLock(path)
+    assert exclusive.acquire(blocking=False)
+    exclusive.release()
+
+
+def test_no_eviction_while_installing(wheelhouse):
+    with cache.FileLock(cache.lock_file('wheelhouse', 'wheelhouse'), shared=True):
+        assert cache.evict_files(wheelhouse, 0) == []
+    assert len(cache.evict_files(wheelhouse, 0)) == 3
+
+
+def test_installed_wheels_are_marked_used(wheelhouse, tmp_path):
+    from pcra.wheelhouse import Wheelhouse
+
+    site_packages = tmp_path / 'venv' / 'lib' / 'python3.11' / 'site-packages'
+    (site_packages / 'A-1.0.dist-info').mkdir(parents=True)
+    Wheelhouse().mark_used(str(tmp_path / 'venv'))
+
+    size = os.path.getsize(os.path.join(wheelhouse, 'a-1.0-py3-none-any.whl'))
+    evicted = cache.evict_files(wheelhouse, size)
+    assert sorted(os.path.basename(path) for path in evicted) == ['b-1.0-py3-none-any.whl', 'c-1.0-py3-none-any.whl']
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from pcra.gitimport import GitImportError, npm_version_files
+
+
+def write_client(client_dir, lock_data):
+    (client_dir / 'package.json').write_text(json.dumps({'name': 'alpha', 'version': '0.0.0'}))
+    (client_dir / 'package-lock.json').write_text(json.dumps(lock_data))
+
+
+def test_version_bump_updates_root_package_in_lockfile(tmp_path):
+    write_client(tmp_path, {'name': 'alpha', 'version': '0.0.0', 'lockfileVersion': 3,
+                            'packages': {'': {'name': 'alpha', 'version': '0.0.0'},
+                                         'node_modules/react': {'version': '17.0.2'}}})
+
+    version, files = npm_version_files(str(tmp_path))
+
+    lock_data = json.loads(files[str(tmp_path / 'package-lock.json')])
+    assert version == '0.1.0'
+    assert lock_data['version'] == '0.1.0'
+    assert lock_data['packages']['']['version'] == '0.1.0'
+    assert lock_data['packages']['node_modules/react']['version'] == '17.0.2'
+
+
+def test_unknown_lockfile_version_uses_npm(tmp_path):
+    write_client(tmp_path, {'name': 'alpha', 'version': '0.0.0', 'lockfileVersion': 4})
+
+    with pytest.raises(GitImportError):
+        npm_version_files(str(tmp_path))
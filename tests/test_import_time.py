@@ -0,0 +1,54 @@
+"""Import-time budget for the py-create-react-app entry point
+
+pcra.__main__ is imported in fresh interpreters with -X importtime.  The best of a few runs has to stay within the
+budget, and no module that should only be loaded once real work starts may be pulled in at import time.
+"""
+import os
+import sys
+import subprocess
+
+import pytest
+
+BUDGET_MS = 60.0
+RUNS = 5
+
+project_folder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules that --help and argument errors must not need
+DEFERRED_MODULES = ['subprocess', 'venv', 'json', 'hashlib', 'shutil', 'selectors', 'concurrent.futures',
+                    'colorama', 'mmap', 'patch', 'pcra.api', 'pcra.manifest', 'pcra.venvcache', 'pcra.npmcache',
+                    'pcra.scheduler', 'pcra.cache']
+
+
+def measure():
+    env = dict(os.environ, PYTHONPATH=project_folder + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import pcra.__main__'],
+                            stderr=subprocess.PIPE, universal_newlines=True, env=env, check=True)
+    total = None
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        modules.add(name)
+        if name == 'pcra.__main__':
+            total = int(parts[1]) / 1000
+    return total, modules
+
+
+@pytest.fixture(scope='module')
+def runs():
+    return [measure() for _ in range(RUNS)]
+
+
+def test_import_time_within_budget(runs):
+    best = min(total for total, _ in runs)
+    assert best <= BUDGET_MS, f'pcra.__main__ takes {best:.1f} ms to import (budget {BUDGET_MS:.1f} ms)'
+
+
+def test_no_deferred_modules_at_startup(runs):
+    loaded = set().union(*(modules for _, modules in runs))
+    assert [name for name in DEFERRED_MODULES if name in loaded] == []
@@ -0,0 +1,65 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+from pcra.journal import Journal, ResumeError
+
+
+def interrupted(new_project, phase, **options):
+    project = new_project(fail=phase, **options)
+    with pytest.raises(RuntimeError):
+        project.bootstrap()
+    assert Journal.exists(project.project_dir)
+    return project
+
+
+def test_resume_skips_finished_phases(new_project):
+    first = interrupted(new_project, 'npm')
+    assert first.ran == ['copy', 'wheelhouse', 'client-venv', 'server-venv']
+
+    resumed = new_project(resume=True)
+    resumed.bootstrap()
+    assert resumed.ran == ['npm', 'git']
+    assert not Journal.exists(resumed.project_dir)
+
+
+def test_resume_reruns_phases_whose_inputs_changed(new_project, monkeypatch):
+    interrupted(new_project, 'git')
+
+    # The environments depend on the Python they are made with, the JavaScript dependencies don't
+    monkeypatch.setattr(sys, 'executable', sys.executable + '-other')
+    resumed = new_project(resume=True)
+    resumed.bootstrap()
+    assert resumed.ran == ['wheelhouse', 'client-venv', 'server-venv', 'git']
+
+
+def test_resume_rejects_a_project_whose_copied_files_are_gone(new_project):
+    first = interrupted(new_project, 'git')
+    os.remove(os.path.join(first.project_dir, 'README.md'))
+
+    with pytest.raises(ResumeError):
+        new_project(resume=True).bootstrap()
+
+
+@pytest.mark.parametrize('change', ['options', 'variables', 'template'])
+def test_resume_rejects_a_different_template_or_options(new_project, tmp_path, change):
+    interrupted(new_project, 'npm')
+
+    options = {'resume': True}
+    if change == 'options':
+        options['full_stack'] = True
+    elif change == 'variables':
+        options['variables'] = {'app_title': 'Something else'}
+    else:
+        template_dir = str(tmp_path / 'template')
+        shutil.copytree(new_project().fallback_dir, template_dir)
+        with open(os.path.join(template_dir, 'README.md'), 'a') as f:
+            f.write('\nChanged\n')
+        options['template'] = template_dir
+
+    resumed = new_project(**options)
+    with pytest.raises(ResumeError):
+        resumed.bootstrap()
+    assert resumed.ran == []
@@ -0,0 +1,20 @@
+import os
+
+from pcra.manifest import TemplateManifest
+
+
+def test_manifest_sees_in_place_edit(template, edit_in_place):
+    template_dir, fallback_dir = template
+    before = TemplateManifest.load(template_dir, fallback_dir).resolve('README.md').signature
+    edit_in_place(os.path.join(template_dir, 'README.md'), 'Hello {{pcra:project_name}} v2')
+    after = TemplateManifest.load(template_dir, fallback_dir).resolve('README.md').signature
+    assert before != after
+
+
+def test_scaffold_after_in_place_edit(template, edit_in_place, render_readme, tmp_path):
+    template_dir, fallback_dir = template
+    manifest = TemplateManifest.load(template_dir, fallback_dir)
+    assert render_readme(manifest, str(tmp_path / 'p1'), 'p1') == 'Hello p1 v1'
+    edit_in_place(os.path.join(template_dir, 'README.md'), 'Hello {{pcra:project_name}} v2')
+    manifest = TemplateManifest.load(template_dir, fallback_dir)
+    assert render_readme(manifest, str(tmp_path / 'p2'), 'p2') == 'Hello p2 v2'
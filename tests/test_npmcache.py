@@ -0,0 +1,42 @@
+import json
+
+from pcra.npmcache import NpmCache, LOCK_FILE
+
+
+def write_client(client_dir, name, lock_data=None):
+    client_dir.mkdir()
+    (client_dir / 'package.json').write_text(json.dumps({'name': name, 'version': '0.1.0',
+                                                         'dependencies': {'react': '^17.0.2'}}))
+    if lock_data is not None:
+        (client_dir / LOCK_FILE).write_text(json.dumps(lock_data))
+
+
+def lockfile(name):
+    return {'name': name, 'version': '0.1.0', 'lockfileVersion': 3,
+            'packages': {'': {'name': name, 'version': '0.1.0', 'dependencies': {'react': '^17.0.2'}},
+                         'node_modules/react': {'version': '17.0.2'}}}
+
+
+def test_restored_lockfile_has_the_new_project_name(tmp_path, monkeypatch):
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+    npm_cache = NpmCache()
+    write_client(tmp_path / 'alpha', 'alpha', lockfile('alpha'))
+    npm_cache._save_lockfile(str(tmp_path / 'alpha'))
+
+    write_client(tmp_path / 'beta', 'beta')
+    assert npm_cache._restore_lockfile(str(tmp_path / 'beta'), 'beta')
+
+    lock_data = json.loads((tmp_path / 'beta' / LOCK_FILE).read_text())
+    assert lock_data['name'] == 'beta'
+    assert lock_data['packages']['']['name'] == 'beta'
+    assert 'alpha' not in json.dumps(lock_data)
+
+
+def test_lockfile_key_ignores_the_project_name(tmp_path, monkeypatch):
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(NpmCache, 'node_version', 'v16.0.0')
+    write_client(tmp_path / 'alpha', 'alpha', lockfile('alpha'))
+    write_client(tmp_path / 'beta', 'beta', lockfile('beta'))
+
+    npm_cache = NpmCache()
+    assert npm_cache.key(str(tmp_path / 'alpha' / LOCK_FILE)) == npm_cache.key(str(tmp_path / 'beta' / LOCK_FILE))
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import platform
+
+import pytest
+
+from pcra import cache
+from pcra.api import ProjectOptions
+from pcra.npmcache import LOCK_FILE, _normalize
+from pcra.pcra import PCRA, main
+from pcra.planner import History, build_plan
+from pcra.venvcache import VenvCache
+from pcra.wheelhouse import Wheelhouse
+
+
+@pytest.fixture
+def full_stack(tmp_path, monkeypatch):
+    """A full-stack project from the default template that has not been created yet"""
+    monkeypatch.setenv('PCRA_CACHE_DIR', str(tmp_path / 'cache'))
+    project = PCRA(ProjectOptions(folder='app', base_dir=str(tmp_path), full_stack=True))
+    yield project
+    project.close()
+
+
+def fill_cache(project):
+    """Cache entries for everything the project's template needs, as earlier runs would have left them"""
+    manifest = project.manifest
+    resolved = []
+    for requirements_file in (f'{project.client_source_dir}/requirements.txt', 'server/requirements.txt'):
+        requirements = manifest.resolve(requirements_file).read_bytes()
+        cache.write_meta(cache.cache_dir(os.path.join('venv', VenvCache.key_for(requirements))), {})
+        resolved.append(Wheelhouse.key_for(requirements.decode()))
+    cache.write_meta(cache.cache_dir('wheelhouse'), {'resolved': resolved})
+
+    package_data = json.loads(manifest.resolve(f'{project.client_source_dir}/package.json').read_bytes())
+    lock_data = {'lockfileVersion': 3, 'packages': {'node_modules/react': {'version': '17.0.2'}}}
+    lock_dir = cache.cache_dir(os.path.join('npm-lock', cache.hash_key(_normalize(package_data))))
+    with open(os.path.join(lock_dir, LOCK_FILE), 'w') as f:
+        json.dump(lock_data, f)
+    cache.write_meta(cache.cache_dir(os.path.join('npm', 'modules')),
+                     {'lock': cache.hash_key(_normalize(lock_data)), 'platform': [platform.system(), platform.machine()]})
+
+    patch_name = 'asset.js.win.patch' if os.name == 'nt' else 'asset.js.patch'
+    cache.write_meta(cache.cache_dir(os.path.join('patch', 'plugin')),
+                     {'patch': cache.hash_key(manifest.resolve(patch_name).read_bytes())})
+
+
+def cache_results(plan):
+    return {step.key.split(':')[0]: step.cache for step in plan.steps if step.key is not None and ':' in step.key}
+
+
+def test_empty_cache_predicts_misses(full_stack):
+    plan = build_plan(full_stack, History())
+    assert cache_results(plan) == {'wheelhouse': 'miss', 'venv': 'miss', 'npm': 'miss', 'patch': 'miss',
+                                   'git': None}
+    assert [step.phase for step in plan.steps if step.key == 'venv:miss'] == ['client-venv', 'server-venv']
+    npm_step = next(step for step in plan.steps if step.key == 'npm:miss')
+    assert npm_step.commands == [['npm', 'install']]
+
+
+def test_filled_cache_predicts_hits(full_stack):
+    fill_cache(full_stack)
+    plan = build_plan(full_stack, History())
+    assert cache_results(plan) == {'venv': 'hit', 'npm': 'hit', 'patch': 'hit', 'git': None}
+    assert [step.commands for step in plan.steps if step.phase == 'npm'] == [[], []]
+
+
+def test_refresh_cache_predicts_misses(tmp_path, full_stack):
+    fill_cache(full_stack)
+    project = PCRA(ProjectOptions(folder='app', base_dir=str(tmp_path), full_stack=True, refresh_cache=True))
+    try:
+        plan = build_plan(project, History())
+    finally:
+        project.close()
+    assert cache_results(plan) == {'wheelhouse': 'miss', 'venv': 'miss', 'npm': 'miss', 'patch': 'miss',
+                                   'git': None}
+
+
+def test_estimates_come_from_history(full_stack):
+    plan = build_plan(full_stack, History({'copy': [0.001, 0.003, 0.002], 'npm:miss': [20.0]}))
+    copy_step = next(step for step in plan.steps if step.key == 'copy')
+    assert copy_step.estimate == pytest.approx(0.002 * copy_step.units)
+    assert next(step for step in plan.steps if step.key == 'npm:miss').estimate == 20.0
+    assert next(step for step in plan.steps if step.key == 'patch:miss') in plan.unestimated
+
+
+def snapshot(folder):
+    return {os.path.join(root, name): os.stat(os.path.join(root, name)).st_mtime_ns
+            for root, dirs, files in os.walk(folder) for name in dirs + files}
+
+
+@pytest.mark.parametrize('filled', [False, True])
+def test_dry_run_writes_nothing(tmp_path, monkeypatch, capsys, full_stack, filled):
+    if filled:
+        fill_cache(full_stack)
+    before = snapshot(tmp_path)
+    capsys.readouterr()
+    monkeypatch.chdir(tmp_path)
+    # Transcrypt pins the Python version of created projects, not the one the tests run under
+    monkeypatch.setattr('pcra.pcra.PYTHON_VERSION_REQUIRED', '{}.{}'.format(*sys.version_info))
+    monkeypatch.setattr(sys, 'argv', ['pcra', 'app', '-fs', '--dry-run', 'json'])
+
+    main()
+
+    plan = json.loads(capsys.readouterr().out)
+    assert plan['project_dir'] == str(tmp_path / 'app')
+    assert plan['steps']
+    assert snapshot(tmp_path) == before
@@ -0,0 +1,12 @@
+import os
+
+from pcra.manifest import TemplateManifest
+
+
+def test_compiled_template_is_checked_against_the_file(template, edit_in_place, render_readme, tmp_path):
+    # Even with an out of date manifest, a cached compile is only used if the file hasn't changed since
+    template_dir, fallback_dir = template
+    manifest = TemplateManifest.load(template_dir, fallback_dir)
+    assert render_readme(manifest, str(tmp_path / 'p1'), 'p1') == 'Hello p1 v1'
+    edit_in_place(os.path.join(template_dir, 'README.md'), 'Hello {{pcra:project_name}} v2')
+    assert render_readme(manifest, str(tmp_path / 'p2'), 'p2') == 'Hello p2 v2'
@@ -0,0 +1,65 @@
+import sys
+import time
+import subprocess
+
+import pytest
+
+from pcra.utils import CommandError, run_cmd, _pump_threads
+
+# Well past the size of a pipe buffer on both pipes, stderr first so a reader that only drains stdout would stall
+LARGE_OUTPUT = '''
+import sys
+for i in range(200):
+    sys.stderr.write('e' * 5000 + '\\n')
+for i in range(200):
+    sys.stdout.write('o' * 5000 + '\\n')
+    sys.stderr.write('e' * 5000 + '\\n')
+sys.stderr.write('last error\\n')
+'''
+
+
+def test_large_output_on_both_pipes(capsys):
+    result = run_cmd([sys.executable, '-c', LARGE_OUTPUT], timeout=60, tail_lines=1000)
+
+    assert result.returncode == 0
+    assert sum(1 for _, stream, _ in result.output if stream == 'stdout') == 200
+    assert sum(1 for _, stream, _ in result.output if stream == 'stderr') == 401
+    assert result.output[-1][1:] == ('stderr', 'last error')
+    assert capsys.readouterr().out.count('o' * 5000) == 200
+
+
+def test_thread_fallback_drains_both_pipes():
+    # The reader threads used on Windows work the same way anywhere
+    process = subprocess.Popen([sys.executable, '-c', LARGE_OUTPUT], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    lines = []
+    _pump_threads(process, lambda stream, line: lines.append(stream), time.monotonic() + 60)
+    assert process.wait() == 0
+    assert (lines.count('stdout'), lines.count('stderr')) == (200, 401)
+
+
+def test_timeout_kills_the_child(capsys):
+    start = time.monotonic()
+    with pytest.raises(CommandError) as error:
+        run_cmd([sys.executable, '-c', 'import time; print("started", flush=True); time.sleep(60)'], timeout=1)
+
+    assert error.value.timed_out
+    assert 'timed out' in str(error.value)
+    assert error.value.result.returncode != 0
+    assert time.monotonic() - start < 30
+
+
+def test_failure_raises_with_captured_stderr(capsys):
+    script = 'import sys; print("working"); sys.stderr.write("something broke\\n"); sys.exit(3)'
+    with pytest.raises(CommandError) as error:
+        run_cmd([sys.executable, '-c', script])
+
+    assert not error.value.timed_out
+    assert error.value.result.returncode == 3
+    assert ('stderr', 'something broke') in [(stream, line) for _, stream, line in error.value.result.output]
+    assert 'failed with return code 3' in str(error.value)
+    assert 'something broke' in capsys.readouterr().out
+
+
+def test_failure_without_check_returns_the_result(capsys):
+    result = run_cmd([sys.executable, '-c', 'import sys; sys.exit(2)'], check=False)
+    assert result.returncode == 2
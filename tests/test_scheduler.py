@@ -0,0 +1,58 @@
+import time
+import threading
+
+import pytest
+
+from pcra.scheduler import TaskScheduler
+
+
+def recorder(log, name, seconds=0.0, error=None):
+    lock = threading.Lock()
+
+    def run():
+        with lock:
+            log.append(f'start {name}')
+        time.sleep(seconds)
+        if error is not None:
+            raise error
+        with lock:
+            log.append(f'end {name}')
+    return run
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_tasks_start_after_their_dependencies(jobs):
+    log = []
+    scheduler = TaskScheduler(jobs)
+    scheduler.add('copy', recorder(log, 'copy', 0.05))
+    scheduler.add('venv', recorder(log, 'venv', 0.05), depends=['copy'])
+    scheduler.add('npm', recorder(log, 'npm', 0.01), depends=['copy'])
+    scheduler.add('git', recorder(log, 'git'), depends=['venv', 'npm'])
+    scheduler.run()
+
+    assert log.index('start venv') > log.index('end copy')
+    assert log.index('start npm') > log.index('end copy')
+    assert log.index('start git') > max(log.index('end venv'), log.index('end npm'))
+    if jobs > 1:
+        # Independent tasks overlap
+        assert log.index('start npm') < log.index('end venv')
+
+
+def test_error_stops_dependent_tasks():
+    log = []
+    scheduler = TaskScheduler(3)
+    scheduler.add('copy', recorder(log, 'copy'))
+    scheduler.add('venv', recorder(log, 'venv', 0.01, error=RuntimeError('pip failed')), depends=['copy'])
+    scheduler.add('npm', recorder(log, 'npm', 0.1), depends=['copy'])
+    scheduler.add('git', recorder(log, 'git'), depends=['venv', 'npm'])
+
+    with pytest.raises(RuntimeError, match='pip failed'):
+        scheduler.run()
+    assert 'start git' not in log
+    assert 'end npm' in log  # Tasks already running are allowed to finish
+
+
+def test_unknown_dependency_is_rejected():
+    scheduler = TaskScheduler()
+    with pytest.raises(ValueError):
+        scheduler.add('git', lambda: None, depends=['npm'])